@@ -5,3 +5,8 @@ class AdminDashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_dashboard'
     verbose_name = 'Admin Dashboard'
+
+    def ready(self):
+        from . import signals
+
+        signals.connect()
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from . import stats
+
+
+def _invalidate_sections(sender, **kwargs):
+    """Drop the statistics sections that depend on the changed table"""
+    sections = stats.DEPENDENCIES[sender]
+    transaction.on_commit(lambda: stats.invalidate(*sections))
+
+
+def connect():
+    for model in stats.DEPENDENCIES:
+        post_save.connect(_invalidate_sections, sender=model, dispatch_uid=f'admin-stats-save-{model._meta.label_lower}')
+        post_delete.connect(_invalidate_sections, sender=model, dispatch_uid=f'admin-stats-delete-{model._meta.label_lower}')
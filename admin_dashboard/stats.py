@@ -0,0 +1,131 @@
+"""
+Dashboard statistics service.
+
+Each section of the snapshot is computed with a single conditional
+aggregate over one table and cached on its own. ``admin_dashboard.signals``
+drops a section when a row of its table is saved or deleted, so a refresh
+only re-runs the queries for the tables that actually changed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from events.models import Event, EventClass, Reservation, Venue
+from entitypool.models import Individuals, Organizations
+from manage_suites.models import SuiteContracts, Suites
+
+
+SECTION_KEY = 'admin-stats:{name}'
+
+
+def stats_ttl():
+    """Seconds a section may be served before it is recomputed anyway"""
+    return getattr(settings, 'ADMIN_STATS_TTL', 30)
+
+
+def events_section():
+    # 'total' and 'active' count event classes, as the dashboard always has;
+    # the scheduled Event rows are reported under their own names
+    upcoming = Q(schedule_status='approved', date__gte=timezone.now())
+    counts = EventClass.objects.aggregate(
+        total=Count('pk'),
+        active=Count('pk', filter=Q(Exists(Event.objects.filter(upcoming, event_class=OuterRef('pk'))))),
+    )
+    counts.update(Event.objects.aggregate(
+        scheduled=Count('pk'),
+        upcoming=Count('pk', filter=upcoming),
+        pending=Count('pk', filter=Q(schedule_status='pending')),
+    ))
+    return counts
+
+
+def reservations_section():
+    week_ago = timezone.now() - timedelta(days=7)
+    counts = Reservation.objects.aggregate(
+        total=Count('pk'),
+        pending=Count('pk', filter=Q(status='pending')),
+        approved=Count('pk', filter=Q(status='approved')),
+        rejected=Count('pk', filter=Q(status='rejected')),
+        cancelled=Count('pk', filter=Q(status='cancelled')),
+        recent=Count('pk', filter=Q(created_at__gte=week_ago)),
+    )
+    # The dashboard labels approved reservations as confirmed
+    counts['confirmed'] = counts['approved']
+    return counts
+
+
+def venues_section():
+    booked = (
+        Exists(Event.objects.filter(venue=OuterRef('pk')))
+        | Exists(Reservation.objects.filter(event_area=OuterRef('venue')))
+    )
+    return Venue.objects.aggregate(
+        total=Count('pk'),
+        with_reservations=Count('pk', filter=Q(booked)),
+    )
+
+
+def suites_section():
+    today = timezone.localdate()
+    occupied = Exists(SuiteContracts.objects.filter(SuiteContracts.active_on(today), suite=OuterRef('pk')))
+    counts = Suites.objects.aggregate(
+        total=Count('pk'),
+        available=Count('pk', filter=~Q(occupied)),
+    )
+    contracts = SuiteContracts.objects.aggregate(
+        contracts=Count('pk'),
+        active_contracts=Count('pk', filter=SuiteContracts.active_on(today)),
+    )
+    counts.update(contracts)
+    return counts
+
+
+def entities_section():
+    return {
+        'individuals': Individuals.objects.count(),
+        'organizations': Organizations.objects.count(),
+    }
+
+
+SECTIONS = {
+    'events': events_section,
+    'reservations': reservations_section,
+    'venues': venues_section,
+    'suites': suites_section,
+    'entities': entities_section,
+}
+
+# Sections to drop when a row of each model changes
+DEPENDENCIES = {
+    Event: ('events', 'venues'),
+    EventClass: ('events',),
+    Reservation: ('reservations', 'venues'),
+    Venue: ('venues',),
+    Suites: ('suites',),
+    SuiteContracts: ('suites',),
+    Individuals: ('entities',),
+    Organizations: ('entities',),
+}
+
+
+def invalidate(*names):
+    cache.delete_many([SECTION_KEY.format(name=name) for name in names])
+
+
+def snapshot():
+    """All dashboard statistics, recomputing only the sections that are missing"""
+    keys = {name: SECTION_KEY.format(name=name) for name in SECTIONS}
+    cached = cache.get_many(keys.values())
+    stats = {}
+    fresh = {}
+    for name, key in keys.items():
+        if key in cached:
+            stats[name] = cached[key]
+        else:
+            stats[name] = fresh[key] = SECTIONS[name]()
+    if fresh:
+        cache.set_many(fresh, stats_ttl())
+    return stats
@@ -0,0 +1,187 @@
+import json
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from events.models import Event, EventClass, Reservation, Venue
+from manage_suites.models import SuiteContracts, SuiteOperatingModels, SuitePhoto, Suites
+
+from . import stats
+
+
+def reservation(area='Hall', status='pending', days=1):
+    return Reservation.objects.create(
+        event_organization='Org', event_type='Meeting', event_area=area, status=status,
+        event_datetime_begin=timezone.now() + timedelta(days=days), event_datetime_delta=timedelta(hours=2),
+        event_number_of_people_min=1, event_number_of_people_max=10,
+    )
+
+
+class StatsSectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create_user('organizer')
+
+    def event(self, event_class, status='approved', days=1, venue=None):
+        return Event.objects.create(
+            title='Talk', date=timezone.now() + timedelta(days=days), event_class=event_class,
+            venue=venue, organizer=self.organizer, schedule_status=status,
+        )
+
+    def test_events_section_counts_classes_and_scheduled_events(self):
+        talk, workshop, _ = (EventClass.objects.create(event_name=name) for name in ('Talk', 'Workshop', 'Gala'))
+        self.event(talk)
+        self.event(talk, days=-3)
+        self.event(workshop, status='pending')
+        self.assertEqual(stats.events_section(), {
+            'total': 3, 'active': 1, 'scheduled': 3, 'upcoming': 1, 'pending': 1,
+        })
+
+    def test_reservations_section(self):
+        for status in ('pending', 'pending', 'approved', 'rejected', 'cancelled'):
+            reservation(status=status)
+        Reservation.objects.filter(status='rejected').update(created_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(stats.reservations_section(), {
+            'total': 5, 'pending': 2, 'approved': 1, 'confirmed': 1, 'rejected': 1, 'cancelled': 1, 'recent': 4,
+        })
+
+    def test_venues_section_counts_venues_booked_either_way(self):
+        hall = Venue.objects.create(venue='Hall', address='1 Main St')
+        Venue.objects.create(venue='Nook', address='1 Main St')
+        Venue.objects.create(venue='Attic', address='1 Main St')
+        reservation(area='Nook')
+        self.event(EventClass.objects.create(event_name='Talk'), venue=hall)
+        self.assertEqual(stats.venues_section(), {'total': 3, 'with_reservations': 2})
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sections_are_cached_until_their_tables_change_on_commit(self):
+        self.assertEqual(stats.snapshot()['reservations']['total'], 0)
+        with self.assertNumQueries(0):
+            stats.snapshot()
+
+        # Not committed yet: the cached figures stay
+        with self.captureOnCommitCallbacks() as callbacks:
+            reservation()
+        self.assertEqual(stats.snapshot()['reservations']['total'], 0)
+
+        for callback in callbacks:
+            callback()
+        # Only the sections that depend on reservations are recomputed
+        with self.assertNumQueries(2):
+            snapshot = stats.snapshot()
+        self.assertEqual(snapshot['reservations']['total'], 1)
+
+    def test_deletes_invalidate_too(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            venue = Venue.objects.create(venue='Hall', address='1 Main St')
+        self.assertEqual(stats.snapshot()['venues']['total'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            venue.delete()
+        self.assertEqual(stats.snapshot()['venues']['total'], 0)
+
+
+class SuitesApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.model = SuiteOperatingModels.objects.create(model_name='Private', pricepoint=2500, period=90)
+        for number in ('101', '102', '103'):
+            self.suite(number)
+        today = timezone.localdate()
+        suite = Suites.objects.get(suite_number='101')
+        SuiteContracts.objects.create(suite=suite, model=self.model, roe_begin=date(2020, 1, 1), roe_end=date(2020, 12, 31))
+        self.current = SuiteContracts.objects.create(suite=suite, model=self.model, roe_begin=today, on_going=True)
+        SuitePhoto.objects.create(suite=suite, image='suite_photos/101.jpg', caption='Window')
+
+    def suite(self, number):
+        return Suites.objects.create(suite_number=number)
+
+    def get(self, **params):
+        return self.client.get('/admin_dashboard/api/suites/', params)
+
+    def streamed(self):
+        response = self.get(stream='1')
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_full_paged_and_streamed_suites_have_the_same_shape(self):
+        full = self.get().json()
+        pages = [self.get(page=n, page_size=2).json()['suites'] for n in (1, 2)]
+        streamed = self.streamed()
+        self.assertEqual(pages[0] + pages[1], full['suites'])
+        self.assertEqual(streamed['suites'], full['suites'])
+        self.assertEqual(streamed['summary'], full['summary'])
+        first = full['suites'][0]
+        self.assertEqual([photo['caption'] for photo in first['photos']], ['Window'])
+        self.assertEqual(first['active_contract']['id'], self.current.pk)
+        self.assertEqual(first['active_contract']['model'], {
+            'id': self.model.pk, 'name': 'Private', 'is_shared': False, 'pricepoint': 2500.0, 'period': 90,
+        })
+        self.assertEqual((first['contracts_count'], first['photo_count']), (2, 1))
+        self.assertIsNone(full['suites'][1]['active_contract'])
+        self.assertEqual(full['summary'], {'total': 3, 'occupied': 1, 'available': 2})
+
+    def test_paging(self):
+        page = self.get(page=2, page_size=2).json()
+        self.assertEqual([suite['suite_number'] for suite in page['suites']], ['103'])
+        self.assertEqual((page['page'], page['num_pages'], page['count']), (2, 2, 3))
+        self.assertEqual(page['summary'], {'total': 3, 'occupied': 1, 'available': 2})
+        self.assertEqual(self.get(page=1, page_size='many').status_code, 400)
+
+    def test_query_count_does_not_grow_with_suites(self):
+        self.get()
+        with CaptureQueriesContext(connection) as first:
+            self.get()
+        for number in ('104', '105', '106'):
+            SuiteContracts.objects.create(suite=self.suite(number), model=self.model, roe_begin=date(2021, 1, 1), on_going=True)
+        with self.assertNumQueries(len(first.captured_queries)):
+            self.assertEqual(len(self.get().json()['suites']), 6)
+
+
+class ReservationCursorTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        stamp = timezone.now() - timedelta(days=1)
+        for n in range(7):
+            reservation(days=n % 3)
+        # Several rows share each created_at, so pages must break ties on the id
+        for n, row in enumerate(Reservation.objects.order_by('pk')):
+            Reservation.objects.filter(pk=row.pk).update(created_at=stamp + timedelta(minutes=n // 3))
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = dict(params, limit=2, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get('/admin_dashboard/api/reservations/', query).json()
+            ids += [row['id'] for row in data['reservations']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_continue_across_equal_sort_keys(self):
+        expected = list(Reservation.objects.order_by('created_at', 'pk').values_list('pk', flat=True))
+        self.assertEqual(self.pages(sort='created_at'), expected)
+
+    def test_descending_order(self):
+        expected = list(Reservation.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(self.pages(sort='-created_at'), expected)
+        expected = list(Reservation.objects.order_by('-event_datetime_begin', '-pk').values_list('pk', flat=True))
+        self.assertEqual(self.pages(sort='-event_datetime_begin'), expected)
+
+    def test_invalid_cursors_are_rejected(self):
+        url = '/admin_dashboard/api/reservations/'
+        cursor = self.client.get(url, {'sort': 'created_at', 'limit': 2}).json()['next_cursor']
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        for params in ({'cursor': tampered}, {'cursor': 'not-a-cursor'}, {'cursor': cursor}, {'sort': 'title'}):
+            params.setdefault('sort', '-created_at')
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
@@ -2,16 +2,32 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core import signing
+from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.db.models import Count, Q
-from datetime import datetime, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+import itertools
 import json
 
 from events.models import EventClass, Venue, Reservation
 from entitypool.models import Individuals, Organizations
-from manage_suites.models import Suites, SuiteContracts
+from manage_suites import inventory
+from . import stats
+
+
+SUITES_PAGE_SIZE = 50
+SUITES_MAX_PAGE_SIZE = 200
+SUITES_STREAM_CHUNK = 200  # rows serialized (contracts and photos fetched) together when streaming
+
+RESERVATIONS_PAGE_SIZE = 20
+RESERVATIONS_MAX_PAGE_SIZE = 100
+RESERVATION_SORTS = ('-created_at', 'created_at', '-event_datetime_begin', 'event_datetime_begin')
+RESERVATION_CURSOR_SALT = 'admin_dashboard.reservations.cursor'
 
 
 def is_admin(user):
@@ -68,66 +84,104 @@ def dashboard_view(request):
 def admin_stats_api(request):
     """Get dashboard statistics"""
     try:
-        # Calculate date ranges
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        stats = {
-            'events': {
-                'total': EventClass.objects.count(),
-                'active': EventClass.objects.filter(is_active=True).count()
-            },
-            'reservations': {
-                'total': Reservation.objects.count(),
-                'pending': Reservation.objects.filter(status='pending').count(),
-                'confirmed': Reservation.objects.filter(status='confirmed').count(),
-                'cancelled': Reservation.objects.filter(status='cancelled').count(),
-                'recent': Reservation.objects.filter(created_at__gte=week_ago).count()
-            },
-            'venues': {
-                'total': Venue.objects.count(),
-                'with_reservations': Venue.objects.annotate(
-                    reservation_count=Count('reservation')
-                ).filter(reservation_count__gt=0).count()
-            },
-            'suites': {
-                'total': Suites.objects.count(),
-                'available': Suites.objects.filter(is_available=True).count() if hasattr(Suites, 'is_available') else 0,
-                'contracts': SuiteContracts.objects.count()
-            },
-            'entities': {
-                'individuals': Individuals.objects.count(),
-                'organizations': Organizations.objects.count()
-            }
-        }
-        
-        return JsonResponse(stats)
+        return JsonResponse(stats.snapshot())
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _parse_date_param(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_reservations_api(request):
-    """Get reservations data for admin"""
+    """Get reservations for admin, keyset-paginated.
+
+    Filters: ``status``, ``area``, ``type``, ``date_from``/``date_to`` (on the
+    event start). ``sort`` is one of RESERVATION_SORTS; pass the returned
+    ``next_cursor`` as ``cursor`` to fetch the following page.
+    """
     try:
-        reservations = []
-        for reservation in Reservation.objects.select_related('venue').order_by('-created_at')[:20]:
-            reservations.append({
-                'id': reservation.event_id,
-                'event_organization': reservation.event_organization,
-                'event_type': reservation.event_type,
-                'venue': reservation.venue.venue if reservation.venue else 'N/A',
-                'start_datetime': reservation.start_datetime.isoformat() if reservation.start_datetime else None,
-                'duration_hours': reservation.duration_hours,
-                'status': reservation.status,
-                'created_at': reservation.created_at.isoformat(),
-                'min_crowd_size': reservation.min_crowd_size,
-                'max_crowd_size': reservation.max_crowd_size
-            })
+        sort = request.GET.get('sort', '-created_at')
+        if sort not in RESERVATION_SORTS:
+            return JsonResponse({'error': f'sort must be one of {", ".join(RESERVATION_SORTS)}'}, status=400)
+        column = sort.lstrip('-')
+        descending = sort.startswith('-')
+        limit = min(int(request.GET.get('limit', RESERVATIONS_PAGE_SIZE)), RESERVATIONS_MAX_PAGE_SIZE)
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+        
+        queryset = Reservation.objects.all()
+        if request.GET.get('status'):
+            queryset = queryset.filter(status=request.GET['status'])
+        if request.GET.get('area'):
+            queryset = queryset.filter(event_area=request.GET['area'])
+        if request.GET.get('type'):
+            queryset = queryset.filter(event_type=request.GET['type'])
+        if request.GET.get('date_from'):
+            queryset = queryset.filter(event_datetime_begin__gte=_parse_date_param(request.GET['date_from']))
+        if request.GET.get('date_to'):
+            queryset = queryset.filter(event_datetime_begin__lte=_parse_date_param(request.GET['date_to'], end_of_day=True))
+        
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                position = signing.loads(cursor, salt=RESERVATION_CURSOR_SALT)
+            except signing.BadSignature:
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            if position['sort'] != sort:
+                return JsonResponse({'error': 'Cursor does not match sort'}, status=400)
+            value = parse_datetime(position['value'])
+            if descending:
+                after = Q(**{f'{column}__lt': value}) | Q(**{column: value, 'event_id__lt': position['id']})
+            else:
+                after = Q(**{f'{column}__gt': value}) | Q(**{column: value, 'event_id__gt': position['id']})
+            queryset = queryset.filter(after)
+        
+        order = [sort, '-event_id' if descending else 'event_id']
+        rows = list(queryset.order_by(*order).values(
+            'event_id', 'event_organization', 'event_type', 'event_area',
+            'event_datetime_begin', 'event_datetime_delta', 'event_datetime_end',
+            'status', 'created_at', 'event_number_of_people_min', 'event_number_of_people_max',
+        )[:limit + 1])
         
-        return JsonResponse({'reservations': reservations})
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = signing.dumps(
+                {'sort': sort, 'value': last[column].isoformat(), 'id': last['event_id']},
+                salt=RESERVATION_CURSOR_SALT,
+            )
+        
+        reservations = [
+            {
+                'id': row['event_id'],
+                'event_organization': row['event_organization'],
+                'event_type': row['event_type'],
+                'venue': row['event_area'],
+                'start_datetime': row['event_datetime_begin'].isoformat(),
+                'end_datetime': row['event_datetime_end'].isoformat() if row['event_datetime_end'] else None,
+                'duration_hours': row['event_datetime_delta'].total_seconds() / 3600,
+                'status': row['status'],
+                'created_at': row['created_at'].isoformat(),
+                'min_crowd_size': row['event_number_of_people_min'],
+                'max_crowd_size': row['event_number_of_people_max'],
+            }
+            for row in rows
+        ]
+        
+        return JsonResponse({'reservations': reservations, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -157,27 +211,64 @@ def admin_venues_api(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_suites_api(request):
-    """Get suites data for admin"""
+    """Get suite inventory for admin.
+
+    Returns every suite by default. ``?page=N&page_size=M`` returns one page;
+    ``?stream=1`` streams the full list row by row.
+    """
     try:
-        suites = []
-        for suite in Suites.objects.all():
-            contracts_count = SuiteContracts.objects.filter(suite=suite).count()
-            suites.append({
-                'id': suite.suite_id,
-                'suite_name': suite.suite_name,
-                'square_footage': suite.square_footage,
-                'monthly_rent': float(suite.monthly_rent),
-                'contracts_count': contracts_count,
-                'has_private_office': getattr(suite, 'has_private_office', False),
-                'has_conference_room': getattr(suite, 'has_conference_room', False),
-                'desk_count': getattr(suite, 'desk_count', 0)
+        rows = inventory.inventory()
+        
+        if request.GET.get('stream'):
+            return StreamingHttpResponse(_stream_suites(rows), content_type='application/json')
+        
+        if request.GET.get('page'):
+            page_size = min(int(request.GET.get('page_size', SUITES_PAGE_SIZE)), SUITES_MAX_PAGE_SIZE)
+            page = Paginator(rows, page_size).get_page(request.GET.get('page'))
+            suites = inventory.serialize_page(page)
+            return JsonResponse({
+                'suites': suites,
+                'summary': _suite_summary(),
+                'page': page.number,
+                'num_pages': page.paginator.num_pages,
+                'count': page.paginator.count,
             })
         
-        return JsonResponse({'suites': suites})
+        suites = inventory.serialize_page(rows)
+        occupied = sum(1 for suite in suites if suite['occupied'])
+        return JsonResponse({
+            'suites': suites,
+            'summary': {'total': len(suites), 'occupied': occupied, 'available': len(suites) - occupied},
+        })
+    except ValueError:
+        return JsonResponse({'error': 'Invalid page_size'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _suite_summary():
+    suites = stats.suites_section()
+    return {
+        'total': suites['total'],
+        'occupied': suites['total'] - suites['available'],
+        'available': suites['available'],
+    }
+
+
+def _stream_suites(rows):
+    """Yield the suite inventory as one JSON document, SUITES_STREAM_CHUNK rows at a time"""
+    total = occupied = 0
+    yield '{"suites": ['
+    rows = rows.iterator(chunk_size=SUITES_STREAM_CHUNK)
+    while chunk := list(itertools.islice(rows, SUITES_STREAM_CHUNK)):
+        for suite in inventory.serialize_page(chunk):
+            total += 1
+            occupied += suite['occupied']
+            yield ('' if total == 1 else ',') + json.dumps(suite)
+    summary = {'total': total, 'occupied': occupied, 'available': total - occupied}
+    yield '], "summary": ' + json.dumps(summary) + '}'
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_entities_api(request):
@@ -0,0 +1,29 @@
+from django.contrib.staticfiles.management.commands import collectstatic
+
+
+class Command(collectstatic.Command):
+    help = (
+        'Collect static files into STATIC_ROOT, save content-hashed copies listed in staticfiles.json, '
+        'and write gzip and brotli variants of compressible files'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--no-compress', action='store_true', help='Do not write the .gz and .br variants of compressible files',
+        )
+
+    def set_options(self, **options):
+        super().set_options(**options)
+        self.compress = not options['no_compress'] and hasattr(self.storage, 'variants_written')
+        if hasattr(self.storage, 'compress_variants'):
+            self.storage.compress_variants = self.compress
+
+    def handle(self, **options):
+        summary = super().handle(**options)
+        if self.compress and not self.dry_run and self.verbosity >= 1:
+            written = self.storage.variants_written
+            summary += f"\n{written['gzip']} gzip and {written['br']} brotli variants written."
+            if 'br' not in self.storage.available_encodings():
+                summary += ' Install the brotli package to write brotli variants too.'
+        return summary
@@ -0,0 +1,136 @@
+"""
+Fingerprinted, precompressed static files.
+
+``PrecompressedManifestStorage`` is the staticfiles storage (see STORAGES).
+``collectstatic`` copies every file to STATIC_ROOT as before, then saves a
+copy named after the MD5 of its content (``admin/css/x.1a2b3c4d5e6f.css``)
+and records the mapping in ``staticfiles.json``. ``{% static %}`` and form
+Media resolve to those names, so they can be cached for good. The original
+names stay in place for the pages and the React app that hard-code
+``/static/...`` and ``/images/...`` URLs.
+
+The Next.js export under ``_next/static/`` is fingerprinted by Next itself
+and its chunks are loaded by name at runtime, so it is not renamed again;
+neither are HTML pages, which are entry points. ``is_fingerprinted()``
+tells which URLs never change.
+
+Each compressible file also gets ``.gz`` and, when the optional ``brotli``
+package is installed, ``.br`` siblings, written only where they are
+smaller. Apache picks the variant the browser accepts (00-thecied-vhost.conf)
+and ``assets.views.serve_static`` does the same when Django serves them.
+"""
+import gzip
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are written
+    brotli = None
+
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.html', '.svg', '.json', '.txt', '.xml', '.map', '.ico', '.ttf', '.otf')
+MIN_COMPRESS_BYTES = 256  # smaller files gain nothing
+NEXT_FINGERPRINTED = re.compile(r'(^|/)_next/static/')
+DJANGO_FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+UNHASHED = ('.html',)
+
+# Content-Encoding -> suffix of the variant, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def is_fingerprinted(name):
+    """Whether static file ``name`` is named after its content, so its URL never serves anything else"""
+    return NEXT_FINGERPRINTED.search(name) is not None or DJANGO_FINGERPRINTED.search(name) is not None
+
+
+def compress(data, encoding):
+    """``data`` compressed with ``encoding`` ('br' or 'gzip') at the highest level"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical across builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class PrecompressedManifestStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that leaves already fingerprinted files alone and writes compressed variants"""
+
+    # Files referenced by templates but not collected resolve to their plain name
+    manifest_strict = False
+    keep_intermediate_files = False
+    compress_variants = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.variants_written = dict.fromkeys(ENCODINGS, 0)
+
+    def hashed_name(self, name, content=None, filename=None):
+        if NEXT_FINGERPRINTED.search(name) or name.lower().endswith(UNHASHED):
+            return name
+        return super().hashed_name(name, content, filename)
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            # No staticfiles.json until collectstatic has run; the files are there under their plain names
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected (yet); the plain URL is still better than a server error
+            return name
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            try:
+                return convert(matchobj)
+            except ValueError:
+                # Saved web pages and minified CSS refer to files that are not
+                # shipped (source maps, missing fonts); leave those URLs as they are
+                return matchobj[0]
+
+        return converter
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run or not self.compress_variants:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE):
+                self._write_variants(name)
+
+    def available_encodings(self):
+        """Encodings collectstatic can write here, in order of preference"""
+        return [encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+    def _write_variants(self, name):
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        data = None
+        for encoding in self.available_encodings():
+            variant = path + ENCODINGS[encoding]
+            try:
+                if os.stat(variant).st_mtime >= stat.st_mtime:
+                    continue  # up to date
+            except FileNotFoundError:
+                pass
+            if data is None:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            compressed = compress(data, encoding) if len(data) >= MIN_COMPRESS_BYTES else data
+            if len(compressed) < len(data) * 0.95:
+                # Write beside the variant, then rename, so Apache never sends a partial file
+                with open(variant + '.tmp', 'wb') as file:
+                    file.write(compressed)
+                os.replace(variant + '.tmp', variant)
+                self.variants_written[encoding] += 1
+            elif os.path.exists(variant):
+                # The file changed and no longer compresses well; never serve the old content
+                os.remove(variant)
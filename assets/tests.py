@@ -0,0 +1,154 @@
+import gzip
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from .storage import PrecompressedManifestStorage
+
+
+SCRIPT = b'console.log("hello");\n' * 40
+FINGERPRINTED = 'js/app.0123456789ab.js'
+
+
+class StaticRootTestCase(SimpleTestCase):
+    """Runs with STATIC_ROOT in a scratch directory"""
+
+    def setUp(self):
+        scratch = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        self.root = scratch / 'static'
+        self.root.mkdir()
+        settings = override_settings(STATIC_ROOT=str(self.root), STATIC_SERVE_MODE='python')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, data):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+
+class ServeStaticTests(StaticRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('js/app.js', SCRIPT)
+        self.write('js/app.js.gz', gzip.compress(SCRIPT))
+        self.write(FINGERPRINTED, SCRIPT)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/static/{name}', headers=headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_file(self):
+        response = self.get('js/app.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), SCRIPT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_precompressed_variant_when_accepted(self):
+        response = self.get('js/app.js', Accept_Encoding='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.body(response)), SCRIPT)
+        # gzip;q=0 refuses the variant
+        self.assertFalse(self.get('js/app.js', Accept_Encoding='gzip;q=0').has_header('Content-Encoding'))
+        # Each variant has its own validator
+        self.assertNotEqual(self.get('js/app.js')['ETag'], response['ETag'])
+
+    def test_byte_ranges(self):
+        response = self.get('js/app.js', Range='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), SCRIPT[5:10])
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(SCRIPT)}')
+        self.assertEqual(response['Content-Length'], '5')
+
+        self.assertEqual(self.body(self.get('js/app.js', Range='bytes=-4')), SCRIPT[-4:])
+        self.assertEqual(self.body(self.get('js/app.js', Range=f'bytes={len(SCRIPT) - 2}-')), SCRIPT[-2:])
+        # Several ranges are answered with the whole file
+        self.assertEqual(self.get('js/app.js', Range='bytes=0-1,4-5').status_code, 200)
+
+    def test_unsatisfiable_range(self):
+        for header in (f'bytes={len(SCRIPT)}-', 'bytes=9-5', 'bytes=-0'):
+            response = self.get('js/app.js', Range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], f'bytes */{len(SCRIPT)}')
+
+    def test_if_range(self):
+        etag = self.get('js/app.js')['ETag']
+        modified = http_date(os.stat(self.root / 'js/app.js').st_mtime)
+        for validator in (etag, modified):
+            self.assertEqual(self.get('js/app.js', Range='bytes=0-3', If_Range=validator).status_code, 206)
+        # A stale partial copy gets the whole current file
+        for validator in ('"stale"', http_date(0)):
+            response = self.get('js/app.js', Range='bytes=0-3', If_Range=validator)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.body(response), SCRIPT)
+
+    def test_not_modified(self):
+        etag = self.get('js/app.js')['ETag']
+        self.assertEqual(self.get('js/app.js', If_None_Match=etag).status_code, 304)
+
+    def test_fingerprinted_files_are_immutable(self):
+        cache_control = self.get(FINGERPRINTED)['Cache-Control']
+        self.assertIn('immutable', cache_control)
+        self.assertIn('max-age=31536000', cache_control)
+        self.write('_next/static/chunks/main.js', SCRIPT)
+        self.assertIn('immutable', self.get('_next/static/chunks/main.js')['Cache-Control'])
+        plain = self.get('js/app.js')['Cache-Control']
+        self.assertIn('no-cache', plain)
+        self.assertNotIn('immutable', plain)
+
+    def test_paths_outside_the_root_are_not_found(self):
+        self.write('../secret.txt', b'secret')
+        for name in ('../secret.txt', 'js/../../secret.txt', '%2e%2e/secret.txt', 'js', 'missing.js'):
+            self.assertEqual(self.get(name).status_code, 404, name)
+
+    @override_settings(STATIC_SERVE_MODE='sendfile')
+    def test_sendfile_mode_hands_the_variant_to_apache(self):
+        response = self.get('js/app.js', Accept_Encoding='gzip')
+        self.assertEqual(response['X-Sendfile'], str(self.root / 'js/app.js.gz'))
+        self.assertEqual(response.content, b'')
+
+
+class PrecompressedStorageTests(StaticRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = PrecompressedManifestStorage(location=str(self.root))
+
+    def test_next_chunks_and_pages_keep_their_names(self):
+        for name in ('_next/static/chunks/main-1a2b.js', 'index.html'):
+            self.assertEqual(self.storage.hashed_name(name), name)
+        self.write('css/site.css', b'body { color: red }')
+        self.assertRegex(self.storage.hashed_name('css/site.css'), r'^css/site\.[0-9a-f]{12}\.css$')
+
+    def test_variants_are_written_only_when_smaller(self):
+        self.write('js/app.js', SCRIPT)
+        self.write('js/tiny.js', b'x')
+        self.storage._write_variants('js/app.js')
+        self.storage._write_variants('js/tiny.js')
+        self.assertEqual(gzip.decompress((self.root / 'js/app.js.gz').read_bytes()), SCRIPT)
+        self.assertFalse((self.root / 'js/tiny.js.gz').exists())
+        self.assertEqual(self.storage.variants_written['gzip'], 1)
+
+    def test_stale_variant_is_removed_when_the_file_stops_compressing(self):
+        path = self.write('js/app.js', SCRIPT)
+        self.storage._write_variants('js/app.js')
+        variant = self.root / 'js/app.js.gz'
+        os.utime(variant, (0, 0))
+        path.write_bytes(os.urandom(len(SCRIPT)))
+        self.storage._write_variants('js/app.js')
+        self.assertFalse(variant.exists())
+
+    def test_up_to_date_variant_is_left_alone(self):
+        self.write('js/app.js', SCRIPT)
+        self.storage._write_variants('js/app.js')
+        self.storage._write_variants('js/app.js')
+        self.assertEqual(self.storage.variants_written['gzip'], 1)
@@ -0,0 +1,147 @@
+"""
+Static files for when Django, not Apache, answers /static/ and /images/.
+
+In production Apache serves STATIC_ROOT itself (00-thecied-vhost.conf), so
+these requests never reach a Python thread. Where a request still comes
+through Django, ``STATIC_SERVE_MODE`` decides how the file is sent:
+
+    'sendfile'   an empty response with an X-Sendfile header; Apache's
+                 mod_xsendfile sends the file, ranges included
+    'python'     the file itself (wsgi.file_wrapper), with byte ranges
+
+Either way the precompressed variant the browser accepts is chosen, and
+fingerprinted files are marked immutable.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import COMPRESSIBLE, ENCODINGS, is_fingerprinted
+
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _accepted(accept_encoding):
+    """Content codings the Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip().removeprefix('q=')
+        try:
+            if params and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _choose_variant(request, path):
+    """(file to send, Content-Encoding or None) for the best variant of ``path`` the client accepts"""
+    if not path.lower().endswith(COMPRESSIBLE):
+        return path, None
+    accepted = _accepted(request.headers.get('Accept-Encoding', ''))
+    for encoding, suffix in ENCODINGS.items():
+        if (encoding in accepted or '*' in accepted) and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single-range header, None to send everything, or False if unsatisfiable"""
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None  # several ranges or another unit: send the whole file
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_static(request, path, document_root=None, mode=None):
+    """Send a collected static file, precompressed when possible, honouring conditional and range requests"""
+    document_root = document_root or settings.STATIC_ROOT
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(document_root, path))
+    except SuspiciousFileOperation:
+        raise Http404('Static file not found')
+    if not fullpath.is_file():
+        raise Http404('Static file not found')
+
+    sent, encoding = _choose_variant(request, str(fullpath))
+    stat = os.stat(sent)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    content_type = mimetypes.guess_type(fullpath.name)[0] or 'application/octet-stream'
+
+    mode = mode or getattr(settings, 'STATIC_SERVE_MODE', 'python')
+    byte_range = None
+    if mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = sent
+    else:
+        byte_range = _byte_range(request.headers.get('Range', ''), stat.st_size)
+        if_range = request.headers.get('If-Range')
+        if byte_range and if_range and if_range != etag and parse_http_date_safe(if_range) != int(stat.st_mtime):
+            byte_range = None  # the client's partial copy is out of date
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(sent, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(sent, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if fullpath.name.lower().endswith(COMPRESSIBLE):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if is_fingerprinted(path):
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'STATIC_IMMUTABLE_MAX_AGE', 31536000), immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime), response=response)
+    if conditional is not response:
+        response.close()
+    return conditional
@@ -0,0 +1,168 @@
+"""
+Async chat completion client.
+
+One ``httpx.AsyncClient`` serves the whole process. It lives on a dedicated
+event loop in a background thread, and every caller - ``async_to_sync`` loops
+under mod_wsgi or the server loop under ASGI - hands its completion to that
+loop, so upstream TLS connections are kept alive and reused across requests
+instead of being opened per message. A semaphore on the same loop caps how
+many completions the process has in flight; callers beyond the cap wait their
+turn rather than piling onto the upstream and its rate limits. Failed calls
+(429, 5xx, timeouts, dropped connections) are retried with exponential
+backoff and jitter, sleeping outside the semaphore. A ``Retry-After``
+longer than CHAT_UPSTREAM_MAX_RETRY_AFTER ends the retries instead, so the
+upstream cannot hold a request for as long as it likes.
+
+Under mod_wsgi the request thread still waits for its reply; what is shared
+is the pool and the limit. The loop starts on first use and its connections
+are closed when the process exits.
+"""
+import asyncio
+import atexit
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from thecied import metrics
+
+from .upstream import (
+    NETWORK_ERROR_REPLY, NOT_CONFIGURED_REPLY, UNEXPECTED_ERROR_REPLY, UPSTREAM_ERROR_REPLY,
+    UpstreamError, build_openai_request,
+)
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncCompletionClient:
+    """Pooled, concurrency-limited completion calls, used from a single event loop"""
+
+    def __init__(self):
+        self.concurrency = getattr(settings, 'CHAT_UPSTREAM_CONCURRENCY', 8)
+        self.retries = getattr(settings, 'CHAT_UPSTREAM_RETRIES', 2)
+        self.backoff = getattr(settings, 'CHAT_UPSTREAM_BACKOFF', 0.5)
+        self.max_retry_after = getattr(
+            settings, 'CHAT_UPSTREAM_MAX_RETRY_AFTER', getattr(settings, 'CHAT_UPSTREAM_TIMEOUT', 30),
+        )
+        max_connections = getattr(settings, 'CHAT_UPSTREAM_MAX_CONNECTIONS', 20)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                getattr(settings, 'CHAT_UPSTREAM_TIMEOUT', 30),
+                connect=getattr(settings, 'CHAT_UPSTREAM_CONNECT_TIMEOUT', 5),
+            ),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    def _delay(self, attempt, response=None):
+        """Seconds to wait before retry number ``attempt`` (1-based), or None if the upstream asks for too long"""
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            delay = float(response.headers['Retry-After'])
+            return delay if delay <= self.max_retry_after else None
+        base = self.backoff * 2 ** (attempt - 1)
+        return base + random.uniform(0, base)
+
+    async def complete(self, messages):
+        """Completion text for ``messages``; raises UpstreamError on failure"""
+        if not getattr(settings, 'OPENAI_API_KEY', None):
+            raise UpstreamError(NOT_CONFIGURED_REPLY)
+        url, headers, payload = build_openai_request(messages)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self._delay(attempt, error if isinstance(error, httpx.Response) else None)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+            try:
+                async with self.semaphore:
+                    # Time the call itself, not the wait for a slot
+                    started = time.perf_counter()
+                    response = await self.http.post(url, headers=headers, json=payload)
+            except httpx.TransportError as e:
+                # Timeouts and connection failures
+                metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='async', status='error')
+                error = e
+                continue
+            metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='async', status=response.status_code)
+            if response.status_code in RETRY_STATUSES:
+                error = response
+                continue
+            if response.status_code != 200:
+                raise UpstreamError(UPSTREAM_ERROR_REPLY, f'{response.status_code} - {response.text}')
+            try:
+                return response.json()['choices'][0]['message']['content'].strip()
+            except (ValueError, KeyError, IndexError) as e:
+                raise UpstreamError(UNEXPECTED_ERROR_REPLY, str(e))
+        if isinstance(error, httpx.Response):
+            raise UpstreamError(UPSTREAM_ERROR_REPLY, f'{error.status_code} - {error.text}')
+        raise UpstreamError(NETWORK_ERROR_REPLY, str(error))
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+SHUTDOWN_TIMEOUT = 5  # seconds to wait for open connections to close at exit
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+_client = None
+
+
+def _background():
+    """The process-wide (loop, client) pair, starting the loop thread on first use"""
+    global _loop, _thread, _client
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='chat-upstream', daemon=True)
+            thread.start()
+            _loop, _thread, _client = loop, thread, AsyncCompletionClient()
+        return _loop, _client
+
+
+def get_client():
+    """The process-wide completion client; only use it on ``get_loop()``"""
+    return _background()[1]
+
+
+def get_loop():
+    """The background event loop the completion client runs on"""
+    return _background()[0]
+
+
+def shutdown():
+    """Close the client's connections and stop the background loop"""
+    global _loop, _thread, _client
+    with _lock:
+        loop, thread, client = _loop, _thread, _client
+        _loop = _thread = _client = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(SHUTDOWN_TIMEOUT)
+    except Exception as e:
+        print(f"Error closing chat upstream client: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(SHUTDOWN_TIMEOUT)
+    if not thread.is_alive():
+        loop.close()
+
+
+atexit.register(shutdown)
+
+
+async def acall_openai_api(messages):
+    """Async counterpart of ``views.call_openai_api``: the reply text, or a fallback message"""
+    loop, client = _background()
+    try:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.complete(messages), loop))
+    except UpstreamError as e:
+        print(f"OpenAI API error: {e}")
+        return e.reply
@@ -0,0 +1,133 @@
+"""
+Conversation context for completion requests.
+
+Only the newest ``CHAT_CONTEXT_MESSAGES`` rows of a session are read, through
+the (session, created_at) index, and the newest of those that fit
+``CHAT_CONTEXT_TOKEN_BUDGET`` are sent verbatim. Turns that fall out of that
+window are folded into a short running summary kept in the cache per session.
+The summary remembers the last message it covers, so each turn only folds in
+the one or two messages that were just evicted; a cold cache is rebuilt from
+a bounded slice of older messages. Cost per turn stays flat however long the
+session grows. The best matches for the latest question from
+``chat.knowledge`` are added so the model answers from real CIED data.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import knowledge
+
+
+SUMMARY_KEY = 'chat-summary:{pk}'
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+SUMMARY_POINT_CHARS = 160
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text):
+    """Approximate token count (about four characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _position(row):
+    return (row['created_at'], row['id'])
+
+
+def _after(position):
+    created_at, pk = position
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+
+def _before(position):
+    created_at, pk = position
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+
+def _point(row):
+    """One line of summary for a message: its first sentence, clipped"""
+    text = ' '.join(row['content'].split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    if len(text) > SUMMARY_POINT_CHARS:
+        text = text[:SUMMARY_POINT_CHARS - 3].rstrip() + '...'
+    speaker = 'User' if row['role'] == 'user' else 'Assistant'
+    return f'{speaker}: {text}'
+
+
+def _fit_points(points):
+    """Keep the most recent points that fit the summary budget"""
+    budget = _setting('CHAT_SUMMARY_TOKEN_BUDGET', 300)
+    kept = []
+    for point in reversed(points):
+        budget -= estimate_tokens(point)
+        if budget < 0:
+            break
+        kept.append(point)
+    kept.reverse()
+    return kept
+
+
+def _newest(queryset):
+    return queryset.order_by('-created_at', '-id').values('id', 'role', 'content', 'created_at')
+
+
+def build(session):
+    """Messages to send upstream for ``session``: a summary, then the newest turns"""
+    limit = _setting('CHAT_CONTEXT_MESSAGES', 20)
+    budget = _setting('CHAT_CONTEXT_TOKEN_BUDGET', 1500)
+    rows = list(_newest(session.messages.all())[:limit])
+    if not rows:
+        return []
+
+    key = SUMMARY_KEY.format(pk=session.pk)
+    state = cache.get(key)
+    through = state['through'] if state else None
+
+    # Newest first, as many as the budget allows (always the latest message),
+    # never reaching back into turns the summary already covers
+    window = []
+    for row in rows:
+        if through and _position(row) <= through:
+            break
+        cost = estimate_tokens(row['content']) + MESSAGE_OVERHEAD
+        if window and cost > budget:
+            break
+        budget -= cost
+        window.append(row)
+
+    # Older turns not yet in the summary: fetched rows left out of the window,
+    # plus any rows between the summary and the fetched slice
+    pending = [row for row in reversed(rows[len(window):]) if not through or _position(row) > through]
+    oldest = _position(rows[-1])
+    if len(rows) == limit and (not through or oldest > through):
+        older = _newest(session.messages.filter(_before(oldest)))
+        if through:
+            older = older.filter(_after(through))
+        pending = list(reversed(older[:_setting('CHAT_SUMMARY_SOURCE_MESSAGES', 50)])) + pending
+    if pending:
+        points = (state['points'] if state else []) + [_point(row) for row in pending]
+        state = {'through': _position(pending[-1]), 'points': _fit_points(points)}
+        cache.set(key, state, _setting('CHAT_SUMMARY_TIMEOUT', 86400))
+
+    context = []
+    if state and state['points']:
+        context.append({
+            'role': 'system',
+            'content': 'Summary of the earlier conversation:\n' + '\n'.join(state['points']),
+        })
+    if rows[0]['role'] == 'user':
+        documents = knowledge.search(rows[0]['content'])
+        if documents:
+            context.append({
+                'role': 'system',
+                'content': 'Records from The CIED that may answer the question:\n'
+                + '\n'.join(f'- {document.text}' for document in documents),
+            })
+    context += [{'role': row['role'], 'content': row['content']} for row in reversed(window)]
+    return context
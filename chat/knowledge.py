@@ -0,0 +1,317 @@
+"""
+Local retrieval index that grounds chat answers in CIED data.
+
+One short document per Venue, EventClass and Suite, and per approved Event
+or Reservation that has not ended within the next
+``CHAT_KNOWLEDGE_HORIZON_DAYS``, is kept in an in-process BM25 inverted
+index. ``chat.context`` looks up the latest question and passes the best
+matches to the model, so it can answer from real data instead of asking
+follow-up questions.
+
+Like ``events.availability``, the index loads lazily, is kept current in
+this process by the signals in ``chat.signals`` and is rebuilt every
+``CHAT_KNOWLEDGE_REBUILD_SECONDS`` so bookings that have ended drop out
+and edits made by other processes are picked up.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from events.models import DEFAULT_EVENT_DURATION, Event, EventClass, Reservation, Venue
+from manage_suites.models import Suites
+
+from .response_cache import STOP_WORDS, normalize
+
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Content words of ``text``, plural 's' trimmed so venues matches venue"""
+    words = []
+    for word in normalize(text).split():
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+class Document(NamedTuple):
+    kind: str
+    pk: int
+    text: str
+    expires: object = None
+
+    @property
+    def key(self):
+        return (self.kind, self.pk)
+
+
+class BM25Index:
+    """Inverted index of term frequencies with Okapi BM25 ranking.
+
+    Terms found in more than ``COMMON_TERM_RATIO`` of the documents (say
+    "venue") carry almost no weight, so they only re-rank documents already
+    matched by rarer terms instead of pulling in every posting; a query made
+    only of common terms is scored in full.
+    """
+
+    COMMON_TERM_RATIO = 0.5
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._lengths = {}
+        self._terms = {}
+        self._docs = {}
+        self._total_length = 0
+        self._norms = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, document):
+        self.remove(document.key)
+        counts = Counter(tokenize(document.text))
+        for term, count in counts.items():
+            self._postings[term][document.key] = count
+        length = sum(counts.values())
+        self._lengths[document.key] = length
+        self._terms[document.key] = list(counts)
+        self._total_length += length
+        self._docs[document.key] = document
+        self._norms = None
+
+    def remove(self, key):
+        document = self._docs.pop(key, None)
+        if document is None:
+            return
+        for term in self._terms.pop(key):
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(key)
+        self._norms = None
+
+    def _length_norms(self):
+        """Per-document length normalization, recomputed after the index changes"""
+        if self._norms is None:
+            average = self._total_length / len(self._docs) or 1
+            self._norms = {key: K1 * (1 - B + B * length / average) for key, length in self._lengths.items()}
+        return self._norms
+
+    def search(self, query, limit, now=None):
+        """Best ``limit`` documents for ``query`` as (score, document) pairs"""
+        if not self._docs:
+            return []
+        count = len(self._docs)
+        norms = self._length_norms()
+        weighted = []
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings:
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weighted.append((idf, postings))
+        rare = [item for item in weighted if len(item[1]) <= count * self.COMMON_TERM_RATIO]
+        common = [item for item in weighted if len(item[1]) > count * self.COMMON_TERM_RATIO]
+
+        scores = defaultdict(float)
+        for idf, postings in rare or common:
+            for key, tf in postings.items():
+                scores[key] += idf * tf * (K1 + 1) / (tf + norms[key])
+        if rare:
+            for idf, postings in common:
+                for key in scores:
+                    tf = postings.get(key)
+                    if tf:
+                        scores[key] += idf * tf * (K1 + 1) / (tf + norms[key])
+
+        live = (
+            (score, self._docs[key]) for key, score in scores.items()
+            if now is None or self._docs[key].expires is None or self._docs[key].expires > now
+        )
+        return heapq.nlargest(limit, live, key=lambda item: item[0])
+
+
+def _when(value):
+    return timezone.localtime(value).strftime('%a %b %d %Y %I:%M %p')
+
+
+def venue_documents(filters=Q()):
+    rows = Venue.objects.filter(filters).order_by().values(
+        'v_id', 'venue', 'address', 'capacity', 'description', 'contact_phone', 'contact_email',
+    )
+    for row in rows:
+        parts = [f"Venue {row['venue']}"]
+        if row['capacity']:
+            parts.append(f"capacity {row['capacity']} people")
+        parts.append(f"address {' '.join(row['address'].split())}")
+        if row['description']:
+            parts.append(' '.join(row['description'].split()))
+        contact = ', '.join(filter(None, [row['contact_email'], row['contact_phone']]))
+        if contact:
+            parts.append(f'contact {contact}')
+        yield Document('venue', row['v_id'], '; '.join(parts))
+
+
+def event_class_documents(filters=Q()):
+    for row in EventClass.objects.filter(filters).order_by().values('event_model_id', 'event_name', 'description'):
+        text = f"Event type {row['event_name']}"
+        if row['description']:
+            text += f"; {' '.join(row['description'].split())}"
+        yield Document('eventclass', row['event_model_id'], text)
+
+
+SUITE_FEATURES = (
+    ('whiteboard', 'whiteboard'),
+    ('filing_cabinet', 'filing cabinet'),
+    ('corner_unit', 'corner unit'),
+    ('minifridge', 'mini fridge'),
+)
+
+
+def suite_documents(filters=Q()):
+    rows = Suites.objects.filter(filters).order_by().values(
+        'suite_id', 'suite_number', 'height_adjustible_desk', 'office_chairs',
+        *(field for field, _ in SUITE_FEATURES),
+    )
+    for row in rows:
+        features = [label for field, label in SUITE_FEATURES if row[field]]
+        if row['height_adjustible_desk']:
+            features.append(f"{row['height_adjustible_desk']} height adjustable desks")
+        if row['office_chairs']:
+            features.append(f"{row['office_chairs']} office chairs")
+        text = f"Office suite {row['suite_number']}"
+        if features:
+            text += f"; features {', '.join(features)}"
+        yield Document('suite', row['suite_id'], text)
+
+
+def _horizon():
+    now = timezone.now()
+    return now, now + timedelta(days=getattr(settings, 'CHAT_KNOWLEDGE_HORIZON_DAYS', 90))
+
+
+def event_documents(filters=Q()):
+    now, horizon = _horizon()
+    rows = Event.objects.filter(
+        filters,
+        Q(date_end__gt=now) | Q(date_end__isnull=True, date__gt=now - DEFAULT_EVENT_DURATION),
+        schedule_status='approved',
+        date__lt=horizon,
+    ).order_by().values('id', 'title', 'description', 'date', 'date_end', 'venue__venue', 'event_class__event_name')
+    for row in rows:
+        end = row['date_end'] or row['date'] + DEFAULT_EVENT_DURATION
+        parts = [f"Upcoming event {row['title']}", f"{_when(row['date'])} to {_when(end)}"]
+        if row['venue__venue']:
+            parts.append(f"at {row['venue__venue']}")
+        if row['event_class__event_name']:
+            parts.append(f"type {row['event_class__event_name']}")
+        if row['description']:
+            parts.append(' '.join(row['description'].split())[:200])
+        yield Document('event', row['id'], '; '.join(parts), expires=end)
+
+
+def reservation_documents(filters=Q()):
+    now, horizon = _horizon()
+    rows = Reservation.objects.filter(
+        filters,
+        status='approved',
+        event_datetime_end__gt=now,
+        event_datetime_begin__lt=horizon,
+    ).order_by().values(
+        'event_id', 'event_area', 'event_type', 'event_organization',
+        'event_datetime_begin', 'event_datetime_end',
+    )
+    for row in rows:
+        text = (
+            f"{row['event_area']} is booked {_when(row['event_datetime_begin'])} to "
+            f"{_when(row['event_datetime_end'])}; {row['event_type']} by {row['event_organization']}"
+        )
+        yield Document('reservation', row['event_id'], text, expires=row['event_datetime_end'])
+
+
+SOURCES = {
+    'venue': (venue_documents, 'v_id'),
+    'eventclass': (event_class_documents, 'event_model_id'),
+    'suite': (suite_documents, 'suite_id'),
+    'event': (event_documents, 'id'),
+    'reservation': (reservation_documents, 'event_id'),
+}
+
+
+class KnowledgeBase:
+    """BM25 index over every document source, refreshed row by row"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._index = BM25Index()
+        self._loaded_at = None
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'CHAT_KNOWLEDGE_REBUILD_SECONDS', 300)
+
+    def rebuild(self):
+        """Reload every document from the database"""
+        index = BM25Index()
+        for documents, _ in SOURCES.values():
+            for document in documents():
+                index.add(document)
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.rebuild_interval
+        if stale:
+            self.rebuild()
+
+    def refresh(self, kind, pk):
+        """Re-read one row after it was saved, dropping it if it no longer qualifies"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+        documents, pk_field = SOURCES[kind]
+        found = list(documents(Q(**{pk_field: pk})))
+        with self._lock:
+            self._index.remove((kind, pk))
+            for document in found:
+                self._index.add(document)
+
+    def discard(self, kind, pk):
+        with self._lock:
+            self._index.remove((kind, pk))
+
+    def expire(self):
+        """Force a full rebuild on next use (after edits that change many documents)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def search(self, query, limit=None):
+        """Most relevant documents for ``query``"""
+        if limit is None:
+            limit = getattr(settings, 'CHAT_KNOWLEDGE_RESULTS', 5)
+        self._ensure_loaded()
+        with self._lock:
+            return [document for _, document in self._index.search(query, limit, now=timezone.now())]
+
+
+knowledge = KnowledgeBase()
+
+
+def search(query, limit=None):
+    return knowledge.search(query, limit)
@@ -0,0 +1,145 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from chat.async_backend import AsyncCompletionClient, UpstreamError
+from chat.management.commands.fake_completions import FakeCompletionHandler
+from chat.views import call_openai_api
+
+
+class CountingHandler(FakeCompletionHandler):
+    """Fake upstream that records connections, in-flight peak and injected failures"""
+
+    lock = threading.Lock()
+    connections = 0
+    in_flight = 0
+    peak = 0
+    requests = 0
+    fail_every = 0
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            type(self).connections += 1
+
+    def do_POST(self):
+        cls = type(self)
+        with self.lock:
+            cls.requests += 1
+            cls.in_flight += 1
+            cls.peak = max(cls.peak, cls.in_flight)
+            fail = cls.fail_every and cls.requests % cls.fail_every == 0
+        try:
+            if fail:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                super().do_POST()
+        finally:
+            with self.lock:
+                cls.in_flight -= 1
+
+    @classmethod
+    def reset(cls):
+        cls.connections = cls.in_flight = cls.peak = cls.requests = 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the chat upstream path against a local fake completion server, '
+        'comparing blocking per-request calls with the pooled async client.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Completions per run')
+        parser.add_argument('--clients', type=int, default=32, help='Concurrent callers')
+        parser.add_argument('--concurrency', type=int, default=8, help='CHAT_UPSTREAM_CONCURRENCY for the async run')
+        parser.add_argument('--latency', type=float, default=0.2, help='Fake upstream response time in seconds')
+        parser.add_argument('--fail-every', type=int, default=0, help='Answer every Nth upstream call with 503')
+
+    def handle(self, *args, **options):
+        CountingHandler.first_token_delay = options['latency']
+        CountingHandler.token_delay = 0
+        CountingHandler.fail_every = options['fail_every']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+        try:
+            with override_settings(
+                OPENAI_API_BASE=base,
+                OPENAI_API_KEY='load-test',
+                CHAT_UPSTREAM_CONCURRENCY=options['concurrency'],
+                CHAT_UPSTREAM_BACKOFF=0.05,
+            ):
+                self._report('sync (requests, thread per caller)', self._run_sync(options))
+                self._report(f"async (pooled, {options['concurrency']} in flight)", self._run_async(options))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _messages(self, i):
+        return [{'role': 'user', 'content': f'load test message {i}'}]
+
+    def _run_sync(self, options):
+        CountingHandler.reset()
+
+        def call(i):
+            started = time.perf_counter()
+            reply = call_openai_api(self._messages(i))
+            return time.perf_counter() - started, 'You asked' in reply
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['clients']) as pool:
+            results = list(pool.map(call, range(options['requests'])))
+        return results, time.perf_counter() - started
+
+    def _run_async(self, options):
+        CountingHandler.reset()
+
+        async def run():
+            client = AsyncCompletionClient()
+            gate = asyncio.Semaphore(options['clients'])
+
+            async def call(i):
+                async with gate:
+                    started = time.perf_counter()
+                    try:
+                        await client.complete(self._messages(i))
+                        ok = True
+                    except UpstreamError:
+                        ok = False
+                    return time.perf_counter() - started, ok
+
+            try:
+                return await asyncio.gather(*(call(i) for i in range(options['requests'])))
+            finally:
+                await client.aclose()
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        return results, time.perf_counter() - started
+
+    def _report(self, label, outcome):
+        results, elapsed = outcome
+        latencies = sorted(latency for latency, _ in results)
+        ok = sum(1 for _, success in results if success)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(
+            f'  {ok}/{len(results)} ok in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s), '
+            f'p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms'
+        )
+        self.stdout.write(
+            f'  upstream: {CountingHandler.requests} calls over {CountingHandler.connections} connections, '
+            f'peak {CountingHandler.peak} in flight'
+        )
@@ -0,0 +1,80 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /v1/chat/completions endpoint"""
+
+    protocol_version = 'HTTP/1.1'
+    first_token_delay = 0.5
+    token_delay = 0.05
+    reply = 'This is a canned reply from the local fake completion server.'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body or b'{}')
+        question = payload.get('messages', [{}])[-1].get('content', '')
+        tokens = [f'{word} ' for word in f'{self.reply} You asked: {question}'.split()]
+
+        time.sleep(self.first_token_delay)
+        if payload.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in tokens:
+                chunk = {'choices': [{'index': 0, 'delta': {'content': token}}]}
+                self._write_chunk(f'data: {json.dumps(chunk)}\n\n')
+                time.sleep(self.token_delay)
+            self._write_chunk('data: [DONE]\n\n')
+            self._write_chunk('')
+        else:
+            time.sleep(self.token_delay * len(tokens))
+            data = json.dumps({
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens).strip()}}]
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local fake OpenAI chat completion server for testing the chat app. '
+        'Point OPENAI_API_BASE at http://127.0.0.1:<port>/v1 and set any OPENAI_API_KEY.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--first-token-delay', type=float, default=0.5, help='Seconds before the first token')
+        parser.add_argument('--token-delay', type=float, default=0.05, help='Seconds between tokens')
+
+    def handle(self, *args, **options):
+        handler = type('Handler', (FakeCompletionHandler,), {
+            'first_token_delay': options['first_token_delay'],
+            'token_delay': options['token_delay'],
+        })
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), handler)
+        self.stdout.write(f"Fake completions on http://127.0.0.1:{options['port']}/v1 (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -26,3 +26,6 @@ class ChatMessage(models.Model):
         
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='chatmsg_session_created_idx'),
+        ]
@@ -0,0 +1,216 @@
+"""
+In-process cache of assistant replies to standalone questions.
+
+Only first-turn questions (no earlier conversation) are cached, because a
+follow-up's answer depends on what came before it. Entries are keyed on the
+normalized question and a scope hashing ``PROMPT_VERSION`` with the records
+retrieved for the question, so a reply is not reused once the data it was
+grounded in changes. Entries expire after
+``CHAT_RESPONSE_CACHE_TTL`` seconds and are evicted least-recently-used past
+``CHAT_RESPONSE_CACHE_SIZE``. When there is no exact match, a TF-IDF
+index over word unigrams and bigrams of the cached questions finds
+near-duplicates ("What are your opening hours?" / "what are the opening hours")
+at or above ``CHAT_RESPONSE_CACHE_SIMILARITY`` cosine similarity.
+
+Each process keeps its own cache and counters; ``stats()`` reports them.
+Lookups are also counted across processes in ``thecied.metrics``.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+
+from thecied import metrics
+
+from .upstream import FALLBACK_REPLIES, PROMPT_VERSION
+
+
+_NON_WORD = re.compile(r'[^\w]+')
+# Function words ignored by the similarity index; question words are kept so
+# "who ..." and "where ..." questions never match each other
+STOP_WORDS = frozenset(
+    'a an the is are am was were be been do does did i me my we our you your it its '
+    'this that these those to of in on at for with about can could would should will '
+    'please there any some'.split()
+)
+
+
+def normalize(text):
+    """Casefolded words of ``text`` joined by single spaces"""
+    return ' '.join(_NON_WORD.sub(' ', text.casefold()).split())
+
+
+def terms(normalized):
+    """Word unigrams and bigrams, minus stop words, with their counts"""
+    words = [word for word in normalized.split() if word not in STOP_WORDS] or normalized.split()
+    return Counter(words + [f'{a} {b}' for a, b in zip(words, words[1:])])
+
+
+def question_for(messages):
+    """(scope, question) if ``messages`` is a standalone first turn, else None"""
+    conversation = [message for message in messages if message['role'] != 'system']
+    if len(conversation) != 1 or conversation[0]['role'] != 'user':
+        return None
+    scope = hashlib.sha1(PROMPT_VERSION.encode('utf-8'))
+    for message in messages:
+        if message['role'] == 'system':
+            scope.update(message['content'].encode('utf-8'))
+    return scope.hexdigest()[:16], conversation[0]['content']
+
+
+class ResponseCache:
+    """LRU + TTL reply cache with a near-duplicate TF-IDF lookup"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._postings = defaultdict(set)
+        self._df = Counter()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE_SIZE', 500)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE_TTL', 3600)
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE_SIMILARITY', 0.85)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for term in entry['terms']:
+            self._postings[term].discard(key)
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term]
+                del self._postings[term]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires'] <= now:
+            self._remove(key)
+            entry = None
+        return entry
+
+    def _idf(self, term):
+        return math.log((len(self._entries) + 1) / (self._df.get(term, 0) + 1)) + 1
+
+    def _similar(self, scope, query, now):
+        """Key of the closest cached question above the threshold, or None"""
+        weights = {term: count * self._idf(term) for term, count in query.items()}
+        query_norm = math.sqrt(sum(w * w for w in weights.values()))
+        candidates = set()
+        for term in query:
+            candidates.update(key for key in self._postings.get(term, ()) if key[0] == scope)
+        best, best_score = None, self.threshold
+        for key in candidates:
+            entry = self._live(key, now)
+            if entry is None:
+                continue
+            dot = 0.0
+            norm = 0.0
+            for term, count in entry['terms'].items():
+                weight = count * self._idf(term)
+                norm += weight * weight
+                dot += weight * weights.get(term, 0.0)
+            score = dot / (query_norm * math.sqrt(norm))
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def get(self, scope, question):
+        normalized = normalize(question)
+        if not normalized:
+            return None
+        key = (scope, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            result = 'hit'
+            if entry is not None:
+                self.hits += 1
+            elif self.threshold:
+                similar = self._similar(scope, terms(normalized), now)
+                if similar is not None:
+                    key, entry = similar, self._entries[similar]
+                    self.near_hits += 1
+                    result = 'near_hit'
+            if entry is None:
+                self.misses += 1
+                result = 'miss'
+            else:
+                self._entries.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(cache='chat_reply', result=result)
+        return entry['reply'] if entry is not None else None
+
+    def set(self, scope, question, reply):
+        normalized = normalize(question)
+        if not normalized:
+            return
+        key = (scope, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            entry = {'terms': terms(normalized), 'reply': reply, 'expires': time.monotonic() + self.ttl}
+            self._entries[key] = entry
+            for term in entry['terms']:
+                self._postings[term].add(key)
+                self._df[term] += 1
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._df.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'lookups': lookups,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+            }
+
+
+responses = ResponseCache()
+
+
+def lookup(messages):
+    """Cached reply for a standalone question, or None"""
+    standalone = question_for(messages)
+    if standalone is None:
+        return None
+    return responses.get(*standalone)
+
+
+def store(messages, reply):
+    """Remember a successful reply to a standalone question"""
+    standalone = question_for(messages)
+    if standalone is not None and reply and reply not in FALLBACK_REPLIES:
+        responses.set(*standalone, reply)
+
+
+def stats():
+    return responses.stats()
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from events.models import Event, EventClass, Reservation, Venue
+from manage_suites.models import Suites
+
+from .knowledge import knowledge
+from .models import ChatMessage
+
+
+LATEST_MESSAGE_KEY = 'chat-latest:{pk}'
+LATEST_MESSAGE_TIMEOUT = 3600
+
+
+def latest_message_key(session_pk):
+    """Cache key whose value changes whenever a message is added to the session"""
+    return LATEST_MESSAGE_KEY.format(pk=session_pk)
+
+
+KINDS = {
+    Event: 'event',
+    Reservation: 'reservation',
+    Suites: 'suite',
+}
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Reservation)
+@receiver(post_save, sender=Suites)
+def document_saved(sender, instance, **kwargs):
+    """Re-index the saved row once the transaction commits"""
+    kind, pk = KINDS[sender], instance.pk
+    transaction.on_commit(lambda: knowledge.refresh(kind, pk))
+
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_delete, sender=Suites)
+def document_deleted(sender, instance, **kwargs):
+    kind, pk = KINDS[sender], instance.pk
+    transaction.on_commit(lambda: knowledge.discard(kind, pk))
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+@receiver(post_save, sender=EventClass)
+@receiver(post_delete, sender=EventClass)
+def names_changed(sender, **kwargs):
+    """Venue and event type names appear in event documents too, so reload everything"""
+    transaction.on_commit(knowledge.expire)
+
+
+@receiver(post_save, sender=ChatMessage)
+def message_saved(sender, instance, created, **kwargs):
+    """Wake history long-polls waiting on this session (in any process with a shared cache)"""
+    if created:
+        key, pk = latest_message_key(instance.session_id), instance.pk
+        transaction.on_commit(lambda: cache.set(key, pk, LATEST_MESSAGE_TIMEOUT))
@@ -1,3 +1,427 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from events.models import Reservation
+from manage_suites.models import Suites
+
+from . import async_backend, context, response_cache, views
+from .knowledge import BM25Index, Document, knowledge
+from .async_backend import AsyncCompletionClient
+from .models import ChatMessage, ChatSession
+from .upstream import NETWORK_ERROR_REPLY, UPSTREAM_ERROR_REPLY, UpstreamError
+
+
+def completion(text):
+    return httpx.Response(200, json={'choices': [{'message': {'content': text}}]})
+
+
+@override_settings(OPENAI_API_KEY='test-key', CHAT_UPSTREAM_RETRIES=2, CHAT_UPSTREAM_MAX_RETRY_AFTER=30)
+class AsyncCompletionClientTests(SimpleTestCase):
+    def client_for(self, *responses):
+        """A client whose upstream answers with ``responses`` in turn"""
+        responses = list(responses)
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return responses.pop(0)
+
+        client = AsyncCompletionClient()
+        client.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return client, calls
+
+    @mock.patch('chat.async_backend.asyncio.sleep')
+    async def test_retries_after_the_requested_delay(self, sleep):
+        client, calls = self.client_for(httpx.Response(429, headers={'Retry-After': '3'}), completion(' Hi '))
+        self.assertEqual(await client.complete([{'role': 'user', 'content': 'Hello'}]), 'Hi')
+        self.assertEqual(len(calls), 2)
+        sleep.assert_awaited_once_with(3.0)
+
+    @mock.patch('chat.async_backend.asyncio.sleep')
+    async def test_gives_up_when_retry_after_exceeds_the_cap(self, sleep):
+        client, calls = self.client_for(httpx.Response(503, headers={'Retry-After': '86400'}), completion('late'))
+        with self.assertRaises(UpstreamError) as raised:
+            await client.complete([{'role': 'user', 'content': 'Hello'}])
+        self.assertEqual(raised.exception.reply, UPSTREAM_ERROR_REPLY)
+        self.assertEqual(len(calls), 1)
+        sleep.assert_not_awaited()
+
+    @mock.patch('chat.async_backend.asyncio.sleep')
+    async def test_stops_after_the_configured_retries(self, sleep):
+        client, calls = self.client_for(*[httpx.Response(500)] * 3)
+        with self.assertRaises(UpstreamError):
+            await client.complete([{'role': 'user', 'content': 'Hello'}])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.await_count, 2)
+
+
+
+@override_settings(OPENAI_API_KEY='test-key')
+class BackgroundLoopTests(SimpleTestCase):
+    def setUp(self):
+        async_backend.shutdown()
+        self.addCleanup(async_backend.shutdown)
+
+    def test_requests_on_different_loops_share_one_client_and_loop(self):
+        seen = []
+
+        async def complete(messages):
+            seen.append((asyncio.get_running_loop(), threading.current_thread().name))
+            return 'Hi'
+
+        client = async_backend.get_client()
+        with mock.patch.object(client, 'complete', complete):
+            for _ in range(2):
+                # Each call stands in for a request's own async_to_sync loop
+                self.assertEqual(asyncio.run(async_backend.acall_openai_api([])), 'Hi')
+        self.assertIs(async_backend.get_client(), client)
+        self.assertEqual(seen, [(async_backend.get_loop(), 'chat-upstream')] * 2)
+
+    def test_upstream_errors_become_the_fallback_reply(self):
+        async def complete(messages):
+            raise UpstreamError(NETWORK_ERROR_REPLY, 'refused')
+
+        with mock.patch.object(async_backend.get_client(), 'complete', complete):
+            self.assertEqual(asyncio.run(async_backend.acall_openai_api([])), NETWORK_ERROR_REPLY)
+
+    def test_shutdown_closes_the_client_and_stops_the_loop(self):
+        loop, client = async_backend.get_loop(), async_backend.get_client()
+        thread = async_backend._thread
+        async_backend.shutdown()
+        self.assertTrue(client.http.is_closed)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(loop.is_closed())
+        # A later call starts a fresh loop
+        self.assertIsNot(async_backend.get_client(), client)
+
+@override_settings(CHAT_CONTEXT_MESSAGES=6, CHAT_CONTEXT_TOKEN_BUDGET=40, CHAT_SUMMARY_TOKEN_BUDGET=60)
+@mock.patch('chat.context.knowledge.search', return_value=[])
+class ContextWindowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = ChatSession.objects.create(session_id='context')
+        self.started = timezone.now()
+
+    def say(self, *contents):
+        for content in contents:
+            count = self.session.messages.count()
+            ChatMessage.objects.create(
+                session=self.session, role='user' if count % 2 == 0 else 'assistant', content=content,
+                created_at=self.started + timedelta(seconds=count),
+            )
+
+    def test_empty_session(self, search):
+        self.assertEqual(context.build(self.session), [])
+
+    def test_short_conversation_is_sent_verbatim(self, search):
+        self.say('Hi.', 'Hello, how can I help?', 'Is the hall free?')
+        self.assertEqual(
+            [message['content'] for message in context.build(self.session)],
+            ['Hi.', 'Hello, how can I help?', 'Is the hall free?'],
+        )
+
+    def test_turns_over_the_budget_are_summarized(self, search):
+        self.say('First question about parking. More detail here.', 'x' * 80, 'y' * 40, 'Latest?')
+        messages = context.build(self.session)
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('User: First question about parking.', messages[0]['content'])
+        self.assertNotIn('More detail', messages[0]['content'])
+        self.assertEqual([m['content'] for m in messages[1:]], ['y' * 40, 'Latest?'])
+
+    def test_latest_message_is_sent_even_over_budget(self, search):
+        self.say('z' * 1000)
+        self.assertEqual(context.build(self.session)[-1]['content'], 'z' * 1000)
+
+    def test_summary_is_extended_without_repeating_turns(self, search):
+        self.say('One.', 'a' * 80, 'Two.', 'b' * 80)
+        context.build(self.session)
+        self.say('Three.', 'c' * 80, 'Four?')
+        messages = context.build(self.session)
+        summary = messages[0]['content']
+        for point in ('One.', 'Two.'):
+            self.assertEqual(summary.count(point), 1)
+        # A turn is either summarized or sent verbatim, never both
+        self.assertNotIn('Three.', summary)
+        self.assertEqual([m['content'] for m in messages[1:]], ['Three.', 'c' * 80, 'Four?'])
+
+    @override_settings(CHAT_SUMMARY_TOKEN_BUDGET=20)
+    def test_cold_summary_keeps_the_newest_points_that_fit(self, search):
+        # More rows than CHAT_CONTEXT_MESSAGES: the older ones are read separately
+        self.say(*[f'Question number {n}.' for n in range(12)])
+        messages = context.build(self.session)
+        self.assertEqual(messages[-1]['content'], 'Question number 11.')
+        state = cache.get(context.SUMMARY_KEY.format(pk=self.session.pk))
+        self.assertLessEqual(sum(context.estimate_tokens(point) for point in state['points']), 20)
+        self.assertTrue(state['points'][-1].endswith('Question number 7.'))
+        self.assertNotIn('Question number 0.', ' '.join(state['points']))
+
+
+
+class BM25IndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        for pk, text in enumerate([
+            'Venue Atrium; capacity 200 people; glass roof',
+            'Venue Boardroom; capacity 12 people; projector and whiteboard',
+            'Venue Studio; capacity 30 people; projector',
+            'Venue Lounge; capacity 40 people; sofas, projector, projector screen and a long bar along the windows',
+        ]):
+            self.index.add(Document('venue', pk, text))
+
+    def ranked(self, query, now=None):
+        return [document.pk for _, document in self.index.search(query, 10, now=now)]
+
+    def test_rare_terms_outweigh_common_ones(self):
+        self.assertEqual(self.ranked('venue with a whiteboard'), [1])
+        self.assertEqual(self.ranked('whiteboard projector')[0], 1)
+        # Common terms only re-rank what the rare ones matched
+        self.assertEqual(self.ranked('projector glass'), [0])
+
+    def test_term_frequency_then_length_order_the_matches(self):
+        # The Lounge says projector twice; the Studio is shorter than the Boardroom
+        self.assertEqual(self.ranked('projectors'), [3, 2, 1])
+
+    def test_common_only_queries_score_everything(self):
+        self.assertEqual(len(self.ranked('venues')), 4)
+        self.assertEqual(self.ranked('ballroom'), [])
+
+    def test_removed_and_replaced_documents(self):
+        self.index.remove(('venue', 1))
+        self.index.remove(('venue', 99))
+        self.assertEqual(self.ranked('whiteboard'), [])
+        self.index.add(Document('venue', 2, 'Venue Studio; whiteboard'))
+        self.assertEqual(self.ranked('whiteboard'), [2])
+        self.assertEqual(self.ranked('projector'), [3])
+        self.assertEqual(len(self.index), 3)
+
+    def test_expired_documents_are_skipped(self):
+        now = timezone.now()
+        self.index.add(Document('event', 1, 'Upcoming event Gala at Atrium', expires=now))
+        self.assertEqual(self.ranked('gala', now=now - timedelta(minutes=1)), [1])
+        self.assertEqual(self.ranked('gala', now=now), [])
+
+
+class KnowledgeBaseTests(TestCase):
+    def setUp(self):
+        knowledge.expire()
+        self.addCleanup(knowledge.expire)
+
+    def reservation(self, organization, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reservation.objects.create(
+                event_organization=organization, event_type='Meeting', event_area='Atrium', status=status,
+                event_datetime_begin=timezone.now() + timedelta(days=1), event_datetime_delta=timedelta(hours=2),
+                event_number_of_people_min=1, event_number_of_people_max=10,
+            )
+
+    def found(self, query):
+        return [(document.kind, document.pk) for document in knowledge.search(query)]
+
+    def test_saves_and_deletes_update_the_loaded_index(self):
+        self.assertEqual(self.found('minifridge suite'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            suite = Suites.objects.create(suite_number='204', minifridge=True)
+        self.assertEqual(self.found('mini fridge'), [('suite', suite.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            suite.minifridge = False
+            suite.save()
+        self.assertEqual(self.found('mini fridge'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Suites.objects.filter(pk=suite.pk).delete()
+        self.assertEqual(self.found('suite 204'), [])
+
+    def test_reservations_are_indexed_once_approved(self):
+        self.found('atrium')
+        booking = self.reservation('Acme', 'pending')
+        self.assertEqual(self.found('atrium acme'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'approved'
+            booking.save()
+        self.assertEqual(self.found('atrium acme'), [('reservation', booking.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'cancelled'
+            booking.save()
+        self.assertEqual(self.found('atrium acme'), [])
+
+    def test_only_approved_organizations_reach_the_prompt(self):
+        self.reservation('Acme Robotics', 'approved')
+        for organization, status in (('Globex', 'pending'), ('Initech', 'rejected'), ('Umbrella', 'cancelled')):
+            self.reservation(organization, status)
+        session = ChatSession.objects.create(session_id='knowledge')
+        ChatMessage.objects.create(session=session, role='user', content='Who has the Atrium booked tomorrow?')
+        prompt = '\n'.join(message['content'] for message in context.build(session) if message['role'] == 'system')
+        self.assertIn('Acme Robotics', prompt)
+        for organization in ('Globex', 'Initech', 'Umbrella'):
+            self.assertNotIn(organization, prompt)
+
+def first_turn(question, *records):
+    return [{'role': 'system', 'content': record} for record in records] + [{'role': 'user', 'content': question}]
+
+
+@override_settings(CHAT_RESPONSE_CACHE_SIZE=3, CHAT_RESPONSE_CACHE_TTL=60, CHAT_RESPONSE_CACHE_SIMILARITY=0.6)
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = response_cache.ResponseCache()
+
+    def test_exact_match_ignores_case_and_punctuation(self):
+        self.cache.set('s', 'What are your opening hours?', 'Nine to five.')
+        self.assertEqual(self.cache.get('s', 'what are your OPENING hours'), 'Nine to five.')
+        self.assertIsNone(self.cache.get('other scope', 'What are your opening hours?'))
+
+    def test_near_match_above_the_threshold_only(self):
+        self.cache.set('s', 'What are your opening hours?', 'Nine to five.')
+        self.cache.set('s', 'Where can I park?', 'Behind the building.')
+        self.assertEqual(self.cache.get('s', 'what are the opening hours'), 'Nine to five.')
+        self.assertIsNone(self.cache.get('s', 'Who runs the opening ceremony?'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['near_hits'], stats['misses']), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for question in ('alpha one', 'bravo two', 'charlie three'):
+            self.cache.set('s', question, question.upper())
+        self.cache.get('s', 'alpha one')
+        self.cache.set('s', 'delta four', 'DELTA FOUR')
+        self.assertIsNone(self.cache.get('s', 'bravo two'))
+        self.assertEqual(self.cache.get('s', 'alpha one'), 'ALPHA ONE')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        # The evicted question no longer matches through the similarity index either
+        self.assertNotIn('bravo', self.cache._postings)
+
+    def test_entries_expire(self):
+        with mock.patch('chat.response_cache.time.monotonic', return_value=1000.0):
+            self.cache.set('s', 'alpha one', 'A')
+        with mock.patch('chat.response_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(self.cache.get('s', 'alpha one'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_only_successful_first_turn_replies_are_stored(self):
+        with mock.patch.object(response_cache, 'responses', self.cache):
+            response_cache.store(first_turn('Hello?'), NETWORK_ERROR_REPLY)
+            response_cache.store(first_turn('Hello?') + [{'role': 'assistant', 'content': 'Hi'}], 'Hi')
+            self.assertEqual(self.cache.stats()['stores'], 0)
+            response_cache.store(first_turn('Hello?', 'record A'), 'Hi')
+            self.assertEqual(response_cache.lookup(first_turn('Hello?', 'record A')), 'Hi')
+            # Different retrieved records: a different scope
+            self.assertIsNone(response_cache.lookup(first_turn('Hello?', 'record B')))
+
+
+class StreamReplyTests(TestCase):
+    def setUp(self):
+        self.session = ChatSession.objects.create(session_id='stream')
+        self.cache = response_cache.ResponseCache()
+        patcher = mock.patch.object(response_cache, 'responses', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reply(self, tokens):
+        with mock.patch('chat.views.stream_openai_api', return_value=tokens):
+            return ''.join(views._stream_reply(self.session, first_turn('Where is the auditorium?')))
+
+    def test_complete_stream_is_cached(self):
+        self.reply(iter(['The auditorium ', 'is upstairs.']))
+        self.assertEqual(response_cache.lookup(first_turn('Where is the auditorium?')), 'The auditorium is upstairs.')
+
+    def test_interrupted_stream_is_saved_but_not_cached(self):
+        def tokens():
+            yield 'The auditorium is '
+            raise UpstreamError(NETWORK_ERROR_REPLY, 'connection reset')
+
+        body = self.reply(tokens())
+        self.assertIn(NETWORK_ERROR_REPLY, body)
+        self.assertIsNone(response_cache.lookup(first_turn('Where is the auditorium?')))
+        self.assertEqual(self.cache.stats()['stores'], 0)
+        saved = ChatMessage.objects.get(session=self.session, role='assistant')
+        self.assertTrue(saved.content.startswith('The auditorium is'))
+
+    @override_settings(OPENAI_API_KEY='test-key')
+    def test_stream_without_done_raises(self):
+        upstream = mock.MagicMock(status_code=200)
+        upstream.__enter__.return_value = upstream
+        upstream.iter_lines.return_value = iter(['data: {"choices": [{"delta": {"content": "Hi"}}]}'])
+        with mock.patch('chat.views.requests.post', return_value=upstream):
+            tokens = views.stream_openai_api(first_turn('Hello?'))
+            self.assertEqual(next(tokens), 'Hi')
+            with self.assertRaises(UpstreamError):
+                next(tokens)
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = ChatSession.objects.create(session_id='history')
+        started = timezone.now()
+        # Pairs of messages share a timestamp, so cursors must break ties on the id
+        self.ids = [
+            ChatMessage.objects.create(
+                session=self.session, role='user', content=f'm{n}', created_at=started + timedelta(seconds=n // 2),
+            ).pk
+            for n in range(5)
+        ]
+
+    def history(self, headers=None, **params):
+        return self.client.get('/chat/history/', dict(params, session_id='history'), headers=headers)
+
+    def ids_of(self, response):
+        return [message['id'] for message in response.json()['messages']]
+
+    def test_newest_page_then_back_with_before(self):
+        page = self.history(limit=2).json()
+        self.assertEqual([m['id'] for m in page['messages']], self.ids[3:])
+        self.assertTrue(page['has_more'])
+        older = self.history(limit=2, before=page['before_cursor']).json()
+        self.assertEqual([m['id'] for m in older['messages']], self.ids[1:3])
+        oldest = self.history(limit=2, before=older['before_cursor']).json()
+        self.assertEqual([m['id'] for m in oldest['messages']], self.ids[:1])
+        self.assertFalse(oldest['has_more'])
+
+    def test_since_returns_only_newer_messages(self):
+        cursor = self.history(limit=3, before=self.history(limit=2).json()['before_cursor']).json()['cursor']
+        response = self.history(since=cursor, limit=1)
+        self.assertEqual(self.ids_of(response), self.ids[3:4])
+        self.assertTrue(response.json()['has_more'])
+        caught_up = self.history(since=self.history().json()['cursor']).json()
+        self.assertEqual((caught_up['messages'], caught_up['has_more']), ([], False))
+
+    def test_invalid_parameters(self):
+        for params in ({'since': 'forged'}, {'before': 'forged'}, {'limit': 0}, {'wait': 'soon'}):
+            self.assertEqual(self.history(**params).status_code, 400, params)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.history()
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        again = self.history(headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        ChatMessage.objects.create(session=self.session, role='assistant', content='new')
+        self.assertEqual(self.history(headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    @mock.patch('chat.views.HISTORY_POLL_INTERVAL', 0.02)
+    def test_long_poll_gives_up_at_the_deadline(self):
+        cursor = self.history().json()['cursor']
+        started = time.monotonic()
+        data = self.history(since=cursor, wait=0.1).json()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual((data['messages'], data['cursor']), ([], cursor))
+        self.assertEqual(views._history_waiters, 0)
+
+    @override_settings(CHAT_HISTORY_MAX_WAITERS=0)
+    def test_long_poll_past_the_cap_answers_at_once(self):
+        cursor = self.history().json()['cursor']
+        started = time.monotonic()
+        data = self.history(since=cursor, wait=25).json()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(data['messages'], [])
+
+    @override_settings(CHAT_HISTORY_MAX_WAITERS=8)
+    def test_waiters_are_capped_at_a_share_of_the_request_threads(self):
+        with mock.patch('chat.views.request_threads', return_value=15):
+            self.assertEqual(views._history_max_waiters(), 3)
+        with mock.patch('chat.views.request_threads', return_value=None):
+            self.assertEqual(views._history_max_waiters(), 8)
@@ -0,0 +1,80 @@
+"""
+Chat completion request building shared by the sync and async chat backends.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for The CIED (Center for Innovation and Economic Development). "
+    "You can help with questions about events, venue bookings, and general inquiries."
+)
+
+MODEL = 'gpt-3.5-turbo'
+
+# Changes whenever the prompt or model does, so cached replies are not reused across them
+PROMPT_VERSION = hashlib.sha1(f'{MODEL}\n{SYSTEM_PROMPT}'.encode('utf-8')).hexdigest()[:12]
+
+NOT_CONFIGURED_REPLY = "Sorry, the chat service is not configured. Please contact an administrator."
+UPSTREAM_ERROR_REPLY = "Sorry, I'm having trouble connecting to the chat service. Please try again later."
+NETWORK_ERROR_REPLY = "Sorry, there was a network error. Please try again later."
+UNEXPECTED_ERROR_REPLY = "Sorry, something went wrong. Please try again later."
+FALLBACK_REPLIES = frozenset({
+    NOT_CONFIGURED_REPLY, UPSTREAM_ERROR_REPLY, NETWORK_ERROR_REPLY, UNEXPECTED_ERROR_REPLY,
+})
+
+
+class UpstreamError(Exception):
+    """A completion call failed; ``reply`` is the fallback text to show the user"""
+
+    def __init__(self, reply, detail=''):
+        super().__init__(detail or reply)
+        self.reply = reply
+
+
+def build_openai_request(messages, stream=False):
+    """Return (url, headers, payload) for a chat completion request"""
+    # Prepare messages for OpenAI API format
+    openai_messages = []
+    
+    # Add system message
+    openai_messages.append({
+        "role": "system",
+        "content": SYSTEM_PROMPT
+    })
+    
+    # Add conversation history (already windowed by chat.context)
+    for msg in messages:
+        openai_messages.append({
+            "role": msg['role'],
+            "content": msg['content']
+        })
+    
+    headers = {
+        'Authorization': f'Bearer {settings.OPENAI_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+    
+    payload = {
+        'model': MODEL,
+        'messages': openai_messages,
+        'max_tokens': 500,
+        'temperature': 0.7
+    }
+    if stream:
+        payload['stream'] = True
+    
+    url = f"{getattr(settings, 'OPENAI_API_BASE', 'https://api.openai.com/v1').rstrip('/')}/chat/completions"
+    return url, headers, payload
+
+
+def parse_stream_line(line):
+    """Token text carried by one streamed SSE line, '' if none, None at end of stream"""
+    if not line or not line.startswith('data:'):
+        return ''
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    return json.loads(data)['choices'][0].get('delta', {}).get('content') or ''
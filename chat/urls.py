@@ -6,5 +6,7 @@ app_name = 'chat'
 urlpatterns = [
     path('', views.chat_page, name='chat_page'),
     path('api/', views.chat_api, name='chat_api'),
+    path('api/stream/', views.chat_stream_api, name='chat_stream_api'),
+    path('api/async/', views.chat_async_api, name='chat_async_api'),
     path('history/', views.get_chat_history, name='chat_history'),
 ]
@@ -1,13 +1,41 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
+from asgiref.sync import sync_to_async
+from system_status.live import STREAM_THREAD_SHARE, request_threads
+from thecied import metrics
+from . import context, response_cache
 from .models import ChatSession, ChatMessage
+from .signals import latest_message_key
+from .upstream import (
+    NETWORK_ERROR_REPLY, NOT_CONFIGURED_REPLY, UNEXPECTED_ERROR_REPLY, UPSTREAM_ERROR_REPLY,
+    UpstreamError, build_openai_request, parse_stream_line,
+)
+import asyncio
+import hashlib
 import json
+import threading
+import time
 import uuid
 import requests
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_MAX_WAIT = 25  # seconds a long-poll may hold the request
+HISTORY_POLL_INTERVAL = 0.5
+HISTORY_CURSOR_SALT = 'chat.history.cursor'
+
+_history_waiters_lock = threading.Lock()
+_history_waiters = 0
+
 def chat_page(request):
     """Serve the chat page"""
     return render(request, 'chat.html')
@@ -38,10 +66,13 @@ def chat_api(request):
         )
         
         # Get chat history for context
-        messages = list(session.messages.all().values('role', 'content'))
+        messages = context.build(session)
         
-        # Call OpenAI API
-        response = call_openai_api(messages)
+        # Answer repeated questions from the cache, otherwise call OpenAI API
+        response = response_cache.lookup(messages)
+        if response is None:
+            response = call_openai_api(messages)
+            response_cache.store(messages, response)
         
         if response:
             # Save assistant response
@@ -68,71 +99,301 @@ def call_openai_api(messages):
     try:
         api_key = getattr(settings, 'OPENAI_API_KEY', None)
         if not api_key:
-            return "Sorry, the chat service is not configured. Please contact an administrator."
-            
-        # Prepare messages for OpenAI API format
-        openai_messages = []
+            return NOT_CONFIGURED_REPLY
         
-        # Add system message
-        openai_messages.append({
-            "role": "system",
-            "content": "You are a helpful assistant for The CIED (Center for Innovation and Economic Development). You can help with questions about events, venue bookings, and general inquiries."
-        })
-        
-        # Add conversation history
-        for msg in messages[-10:]:  # Limit to last 10 messages for context
-            openai_messages.append({
-                "role": msg['role'],
-                "content": msg['content']
-            })
+        url, headers, payload = build_openai_request(messages)
         
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'model': 'gpt-3.5-turbo',
-            'messages': openai_messages,
-            'max_tokens': 500,
-            'temperature': 0.7
-        }
-        
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        started = time.perf_counter()
+        try:
+            response = requests.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=30
+            )
+        except requests.RequestException:
+            metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='sync', status='error')
+            raise
+        metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='sync', status=response.status_code)
         
         if response.status_code == 200:
             response_data = response.json()
             return response_data['choices'][0]['message']['content'].strip()
         else:
             print(f"OpenAI API error: {response.status_code} - {response.text}")
-            return "Sorry, I'm having trouble connecting to the chat service. Please try again later."
+            return UPSTREAM_ERROR_REPLY
             
     except requests.RequestException as e:
         print(f"Request error: {e}")
-        return "Sorry, there was a network error. Please try again later."
+        return NETWORK_ERROR_REPLY
     except Exception as e:
         print(f"Unexpected error: {e}")
-        return "Sorry, something went wrong. Please try again later."
+        return UNEXPECTED_ERROR_REPLY
+
+
+def stream_openai_api(messages):
+    """Yield completion tokens from the OpenAI API as they arrive.
+
+    Raises UpstreamError, possibly after some tokens, unless the upstream
+    finished the stream with [DONE].
+    """
+    api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    if not api_key:
+        raise UpstreamError(NOT_CONFIGURED_REPLY)
+    
+    url, headers, payload = build_openai_request(messages, stream=True)
+    started = time.perf_counter()
+    try:
+        response = requests.post(url, headers=headers, json=payload, stream=True, timeout=(5, 30))
+    except requests.RequestException as e:
+        metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='stream', status='error')
+        raise UpstreamError(NETWORK_ERROR_REPLY, f'Request error: {e}')
+    metrics.CHAT_UPSTREAM_DURATION.observe(time.perf_counter() - started, mode='stream', status=response.status_code)
+    
+    with response:
+        if response.status_code != 200:
+            raise UpstreamError(UPSTREAM_ERROR_REPLY, f'{response.status_code} - {response.text}')
+        try:
+            # The upstream sends server-sent events: "data: {json}" ... "data: [DONE]"
+            for line in response.iter_lines(decode_unicode=True):
+                delta = parse_stream_line(line)
+                if delta is None:
+                    return
+                if delta:
+                    yield delta
+        except requests.RequestException as e:
+            raise UpstreamError(NETWORK_ERROR_REPLY, f'Request error: {e}')
+        except (ValueError, KeyError, IndexError) as e:
+            raise UpstreamError(UNEXPECTED_ERROR_REPLY, f'Unexpected error: {e}')
+    raise UpstreamError(NETWORK_ERROR_REPLY, 'Stream ended before [DONE]')
+
+
+def _sse(data, event=None):
+    """Format one server-sent event"""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+
+def _stream_reply(session, messages):
+    """Relay upstream tokens as SSE and save the assistant message when the stream ends"""
+    parts = []
+    # Opening comment so the browser sees the response start immediately
+    yield ': stream opened\n\n'
+    cached = response_cache.lookup(messages)
+    try:
+        try:
+            for token in [cached] if cached is not None else stream_openai_api(messages):
+                parts.append(token)
+                yield _sse({'token': token})
+        except UpstreamError as e:
+            print(f"OpenAI API error: {e}")
+            # Shown and saved after any partial reply, but never cached
+            token = f'\n\n{e.reply}' if parts else e.reply
+            parts.append(token)
+            yield _sse({'token': token})
+        else:
+            if cached is None:
+                response_cache.store(messages, ''.join(parts).strip())
+    finally:
+        # Runs on client disconnect too, keeping whatever was received
+        content = ''.join(parts).strip()
+        saved = ChatMessage.objects.create(session=session, role='assistant', content=content) if content else None
+    yield _sse({
+        'session_id': session.session_id,
+        'message_id': saved.id if saved else None,
+    }, event='done')
+
 
 @csrf_exempt
-def get_chat_history(request):
-    """Get chat history for a session"""
-    session_id = request.GET.get('session_id')
-    if not session_id:
-        return JsonResponse({'error': 'Session ID is required'}, status=400)
+@require_POST
+def chat_stream_api(request):
+    """Handle chat API requests, streaming the reply as server-sent events"""
+    try:
+        data = json.loads(request.body)
+        message = data.get('message', '').strip()
+        session_id = data.get('session_id') or str(uuid.uuid4())
+        
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=400)
+        
+        session, created = ChatSession.objects.get_or_create(
+            session_id=session_id,
+            defaults={'user': request.user if request.user.is_authenticated else None}
+        )
+        ChatMessage.objects.create(
+            session=session,
+            role='user',
+            content=message
+        )
+        messages = context.build(session)
+        
+        response = StreamingHttpResponse(_stream_reply(session, messages), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def chat_async_api(request):
+    """Handle chat API requests through the process-wide pooled, rate-limited upstream client"""
+    from .async_backend import acall_openai_api
     
     try:
-        session = ChatSession.objects.get(session_id=session_id)
-        messages = list(session.messages.all().values('role', 'content', 'created_at'))
+        data = json.loads(request.body)
+        message = data.get('message', '').strip()
+        session_id = data.get('session_id') or str(uuid.uuid4())
+        
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=400)
+        
+        user = await request.auser()
+        session, created = await ChatSession.objects.aget_or_create(
+            session_id=session_id,
+            defaults={'user': user if user.is_authenticated else None}
+        )
+        await ChatMessage.objects.acreate(
+            session=session,
+            role='user',
+            content=message
+        )
+        messages = await sync_to_async(context.build)(session)
+        
+        ai_response = response_cache.lookup(messages)
+        if ai_response is None:
+            ai_response = await acall_openai_api(messages)
+            response_cache.store(messages, ai_response)
+        assistant_message = await ChatMessage.objects.acreate(
+            session=session,
+            role='assistant',
+            content=ai_response
+        )
         
         return JsonResponse({
+            'response': ai_response,
             'session_id': session_id,
-            'messages': messages
+            'message_id': assistant_message.id
         })
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def _history_page(session, since, before, limit):
+    """Up to ``limit`` messages after ``since`` or before ``before`` (else the newest), oldest first"""
+    queryset = session.messages.values('id', 'role', 'content', 'created_at')
+    if since:
+        created_at, pk = since
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        rows = [row async for row in queryset.order_by('created_at', 'id')[:limit + 1]]
+        return rows[:limit], len(rows) > limit
+    if before:
+        created_at, pk = before
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = [row async for row in queryset.order_by('-created_at', '-id')[:limit + 1]]
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+
+def _history_cursor(row):
+    return signing.dumps({'created_at': row['created_at'].isoformat(), 'id': row['id']}, salt=HISTORY_CURSOR_SALT)
+
+
+def _history_position(cursor):
+    position = signing.loads(cursor, salt=HISTORY_CURSOR_SALT)
+    return parse_datetime(position['created_at']), position['id']
+
+
+def _history_max_waiters():
+    """Long-polls this process may hold at once; each one occupies a request thread under mod_wsgi"""
+    limit = getattr(settings, 'CHAT_HISTORY_MAX_WAITERS', 3)
+    threads = request_threads()
+    if threads:
+        limit = min(limit, threads // STREAM_THREAD_SHARE)
+    return limit
+
+
+def _claim_history_waiter():
+    """Take a long-poll slot; False when the process already holds as many as it may"""
+    global _history_waiters
+    with _history_waiters_lock:
+        if _history_waiters >= _history_max_waiters():
+            return False
+        _history_waiters += 1
+        return True
+
+
+def _release_history_waiter():
+    global _history_waiters
+    with _history_waiters_lock:
+        _history_waiters -= 1
+
+
+@csrf_exempt
+async def get_chat_history(request):
+    """Get chat history for a session, a page at a time.
+
+    Without a cursor the newest ``limit`` messages are returned. Pass the
+    returned ``cursor`` as ``since`` to fetch only newer messages, or
+    ``before_cursor`` as ``before`` to page back. With ``since`` and
+    ``wait`` (seconds) the request long-polls until a message arrives;
+    when every long-poll slot is taken it answers at once instead.
+    Responses carry an ETag, so an unchanged page costs a 304.
+    """
+    session_id = request.GET.get('session_id')
+    if not session_id:
+        return JsonResponse({'error': 'Session ID is required'}, status=400)
+    
+    try:
+        limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        wait = min(float(request.GET.get('wait', 0)), HISTORY_MAX_WAIT)
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+        since = _history_position(request.GET['since']) if request.GET.get('since') else None
+        before = _history_position(request.GET['before']) if request.GET.get('before') else None
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    try:
+        session = await ChatSession.objects.aget(session_id=session_id)
     except ChatSession.DoesNotExist:
         return JsonResponse({'messages': []})
+    
+    # Read the change token before querying so a message saved in between still wakes us
+    latest_key = latest_message_key(session.pk)
+    seen = await cache.aget(latest_key) if since and wait > 0 else None
+    rows, has_more = await _history_page(session, since, before, limit)
+    if since and wait > 0 and not rows and _claim_history_waiter():
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait
+            while not rows and loop.time() < deadline:
+                await asyncio.sleep(min(HISTORY_POLL_INTERVAL, deadline - loop.time()))
+                token = await cache.aget(latest_key)
+                if token != seen or loop.time() >= deadline:
+                    seen = token
+                    rows, has_more = await _history_page(session, since, before, limit)
+        finally:
+            _release_history_waiter()
+    
+    response = JsonResponse({
+        'session_id': session_id,
+        'messages': [
+            {'id': row['id'], 'role': row['role'], 'content': row['content'], 'created_at': row['created_at'].isoformat()}
+            for row in rows
+        ],
+        'cursor': _history_cursor(rows[-1]) if rows else request.GET.get('since'),
+        'before_cursor': _history_cursor(rows[0]) if rows else request.GET.get('before'),
+        'has_more': has_more,
+    })
+    patch_cache_control(response, private=True, no_cache=True)
+    etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+    response['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response)
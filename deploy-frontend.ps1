@@ -29,6 +29,12 @@ python manage.py migrate
 # Restart Apache
 sudo /opt/bitnami/ctlscript.sh restart apache
 
+# (Re)start the background task worker
+sudo cp thecied-worker.service /etc/systemd/system/thecied-worker.service
+sudo systemctl daemon-reload
+sudo systemctl enable thecied-worker
+sudo systemctl restart thecied-worker
+
 echo "Deployment complete!"
 echo "Visit: https://thecied.dev"
 '@
@@ -24,9 +24,9 @@ if ($LASTEXITCODE -ne 0) {
     }
 }
 
-# Step 2: Deploy to server
+# Step 2: Deploy to server (deploy.sh restarts Apache; the task worker is restarted after it)
 Write-Host "Deploying to server..." -ForegroundColor Yellow
-ssh -i "C:\Users\BenAn\Downloads\LightSailDjango.pem" bitnami@98.87.71.5 "/home/bitnami/deploy.sh"
+ssh -i "C:\Users\BenAn\Downloads\LightSailDjango.pem" bitnami@98.87.71.5 "/home/bitnami/deploy.sh && cd /home/bitnami/thecied && sudo cp thecied-worker.service /etc/systemd/system/ && sudo systemctl daemon-reload && sudo systemctl enable thecied-worker && sudo systemctl restart thecied-worker"
 
 if ($LASTEXITCODE -eq 0) {
     Write-Host "Deployment completed successfully!" -ForegroundColor Green
@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.utils.html import format_html_join
+from imaging.pipeline import field_names
+from imaging.renditions import lookup, picture_html
 from .models import Event, EventRegistration, Reservation, EventClass, Venue
 
 
@@ -23,7 +26,7 @@ class EventClassAdmin(admin.ModelAdmin):
         css = {
             'all': ('admin/css/drag_drop_upload.css',)
         }
-        js = ('admin/js/drag_drop_upload.js',)
+        js = ('admin/js/drag_drop_upload.js', 'admin/js/bulk_photo_upload.js')
     
     def has_photo1(self, obj):
         """Show if photo1 is uploaded"""
@@ -47,7 +50,7 @@ class VenueAdmin(admin.ModelAdmin):
     list_filter = ['capacity', 'created_at']
     search_fields = ['venue', 'address', 'description', 'contact_phone', 'contact_email']
     date_hierarchy = 'created_at'
-    readonly_fields = ['v_id', 'created_at', 'updated_at', 'photo_count']
+    readonly_fields = ['v_id', 'created_at', 'updated_at', 'photo_count', 'photo_previews']
     
     fieldsets = (
         ('Basic Information', {
@@ -58,7 +61,7 @@ class VenueAdmin(admin.ModelAdmin):
             'description': 'Person responsible for this venue and contact information.'
         }),
         ('Photos', {
-            'fields': ('photo1', 'photo2', 'photo3', 'photo4', 'photo5', 'photo6'),
+            'fields': ('photo1', 'photo2', 'photo3', 'photo4', 'photo5', 'photo6', 'photo_previews'),
             'classes': ('drag-drop-upload',),
             'description': 'Upload venue photos by dragging and dropping files or clicking to browse. You can upload up to 6 photos.'
         }),
@@ -72,7 +75,7 @@ class VenueAdmin(admin.ModelAdmin):
         css = {
             'all': ('admin/css/drag_drop_upload.css',)
         }
-        js = ('admin/js/drag_drop_upload.js',)
+        js = ('admin/js/drag_drop_upload.js', 'admin/js/bulk_photo_upload.js')
     
     def photo_count_display(self, obj):
         """Display photo count in list view"""
@@ -80,6 +83,13 @@ class VenueAdmin(admin.ModelAdmin):
         return f"{count}/6 photos"
     photo_count_display.short_description = 'Photos'
     
+    def photo_previews(self, obj):
+        """Thumbnails as the site serves them, once the derivatives are ready"""
+        names = field_names(obj)
+        found = lookup(names)
+        return format_html_join(' ', '{}', ((picture_html(name, 'thumb', found=found),) for name in names)) or '-'
+    photo_previews.short_description = 'Previews'
+    
     def get_queryset(self, request):
         """Optimize queryset for better performance"""
         return super().get_queryset(request).select_related()
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EventsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'events'
+
+    def ready(self):
+        from thecied.caching import track_models
+        from . import signals  # noqa: F401
+
+        track_models(self.get_model('Venue'), self.get_model('EventClass'), self.get_model('Reservation'))
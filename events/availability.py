@@ -0,0 +1,333 @@
+"""
+Venue availability engine.
+
+Keeps an in-process interval index of every Reservation and Event, keyed by
+area (the reservation's ``event_area`` or the event's venue name), so that
+"is this slot free" and "which bookings overlap [start, end)" are answered
+with a binary search instead of a table scan.
+
+The index is loaded lazily, kept current in this process by the model signals
+in ``events.signals`` and caught up with writes from other mod_wsgi processes
+through an incremental ``updated_at`` sync. A periodic full rebuild picks up
+rows deleted by other processes.
+
+The index is private to each process, so checking it and then inserting is
+only safe while no other process can write: create bookings inside
+``booking_transaction()``, which holds the database write lock from the
+start of the transaction.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import DEFAULT_EVENT_DURATION, Event, Reservation
+
+
+# Statuses that hold a slot; rejected/cancelled bookings never conflict
+BLOCKING_STATUSES = ('pending', 'approved')
+
+# An incremental sync re-reads rows this much older than the newest one seen,
+# so a write that committed after a later-stamped one is not skipped
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def area_key(name):
+    """Normalize an area/venue name so both booking kinds share one index"""
+    return ' '.join((name or '').split()).casefold()
+
+
+class Booking(NamedTuple):
+    kind: str
+    pk: int
+    area: str
+    start: object
+    end: object
+    status: str
+    label: str
+
+    @property
+    def key(self):
+        return (self.kind, self.pk)
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'id': self.pk,
+            'area': self.area,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'status': self.status,
+            'label': self.label,
+        }
+
+
+class IntervalIndex:
+    """Half-open intervals for one area, sorted by start time.
+
+    Overlap queries bisect on start time; the longest interval currently
+    indexed bounds how far back an overlapping booking can start, so a query
+    costs O(log n + k) rather than O(n). Spans are kept sorted, so removing
+    the longest booking narrows that window again.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._items = []
+        self._by_key = {}
+        self._spans = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, booking):
+        self.remove(booking.key)
+        sort_key = (booking.start, booking.kind, booking.pk)
+        position = bisect.bisect_left(self._keys, sort_key)
+        self._keys.insert(position, sort_key)
+        self._items.insert(position, booking)
+        self._by_key[booking.key] = booking
+        bisect.insort(self._spans, booking.end - booking.start)
+
+    def remove(self, key):
+        booking = self._by_key.pop(key, None)
+        if booking is None:
+            return None
+        position = bisect.bisect_left(self._keys, (booking.start, booking.kind, booking.pk))
+        del self._keys[position]
+        del self._items[position]
+        del self._spans[bisect.bisect_left(self._spans, booking.end - booking.start)]
+        return booking
+
+    def overlapping(self, start, end, statuses=None):
+        """Bookings whose interval intersects [start, end)"""
+        if not self._items or end <= start:
+            return []
+        try:
+            low = bisect.bisect_left(self._keys, (start - self._spans[-1],))
+        except OverflowError:
+            # start is within the longest span of datetime.min
+            low = 0
+        high = bisect.bisect_left(self._keys, (end,))
+        return [
+            booking for booking in self._items[low:high]
+            if booking.end > start and (statuses is None or booking.status in statuses)
+        ]
+
+
+def _reservation_booking(row):
+    # Not the stored event_datetime_end: bulk_create() and update() skip
+    # Reservation.save(), so that column can be missing or stale
+    return Booking(
+        kind='reservation',
+        pk=row['event_id'],
+        area=row['event_area'],
+        start=row['event_datetime_begin'],
+        end=row['event_datetime_begin'] + row['event_datetime_delta'],
+        status=row['status'],
+        label=row['event_organization'],
+    )
+
+
+def _event_booking(row):
+    return Booking(
+        kind='event',
+        pk=row['id'],
+        area=row['venue__venue'],
+        start=row['date'],
+        end=row['date_end'] or row['date'] + DEFAULT_EVENT_DURATION,
+        status=row['schedule_status'],
+        label=row['title'],
+    )
+
+
+RESERVATION_FIELDS = (
+    'event_id', 'event_area', 'event_datetime_begin', 'event_datetime_delta',
+    'status', 'event_organization', 'updated_at',
+)
+EVENT_FIELDS = ('id', 'venue__venue', 'date', 'date_end', 'schedule_status', 'title', 'updated_at')
+
+
+class AvailabilityEngine:
+    """Per-area interval indexes over all Reservation and Event rows"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {}
+        self._areas = {}
+        self._watermark = None
+        self._loaded_at = None
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'AVAILABILITY_REBUILD_SECONDS', 300)
+
+    def _fetch(self, since=None):
+        reservations = Reservation.objects.order_by().values(*RESERVATION_FIELDS)
+        events = Event.objects.filter(venue__isnull=False).order_by().values(*EVENT_FIELDS)
+        if since is not None:
+            reservations = reservations.filter(updated_at__gte=since)
+            events = events.filter(updated_at__gte=since)
+        for row in reservations.iterator():
+            yield row['updated_at'], _reservation_booking(row)
+        for row in events.iterator():
+            yield row['updated_at'], _event_booking(row)
+
+    def _apply_rows(self, rows):
+        for updated_at, booking in rows:
+            self._put(booking)
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+
+    def _put(self, booking):
+        self._discard(booking.key)
+        if not booking.area:
+            return
+        area = area_key(booking.area)
+        self._indexes.setdefault(area, IntervalIndex()).add(booking)
+        self._areas[booking.key] = area
+
+    def _discard(self, key):
+        area = self._areas.pop(key, None)
+        if area is not None:
+            self._indexes[area].remove(key)
+
+    def rebuild(self):
+        """Reload every booking from the database"""
+        with self._lock:
+            self._indexes = {}
+            self._areas = {}
+            self._watermark = None
+            self._apply_rows(self._fetch())
+            self._loaded_at = time.monotonic()
+
+    def sync(self):
+        """Catch up with rows written since the last sync (by any process)"""
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.rebuild_interval:
+                self.rebuild()
+            else:
+                since = self._watermark - SYNC_OVERLAP if self._watermark is not None else None
+                self._apply_rows(self._fetch(since=since))
+
+    def put_reservation(self, reservation):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._put(Booking(
+                    kind='reservation',
+                    pk=reservation.pk,
+                    area=reservation.event_area,
+                    start=reservation.event_datetime_begin,
+                    end=reservation.event_datetime_begin + reservation.event_datetime_delta,
+                    status=reservation.status,
+                    label=reservation.event_organization,
+                ))
+
+    def put_event(self, event):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._put(Booking(
+                    kind='event',
+                    pk=event.pk,
+                    area=event.venue.venue if event.venue_id else None,
+                    start=event.date,
+                    end=event.effective_end,
+                    status=event.schedule_status,
+                    label=event.title,
+                ))
+
+    def discard(self, kind, pk):
+        with self._lock:
+            self._discard((kind, pk))
+
+    def conflicts(self, area, start, end, statuses=BLOCKING_STATUSES, exclude=None):
+        """Bookings in ``area`` overlapping [start, end)"""
+        self.sync()
+        with self._lock:
+            index = self._indexes.get(area_key(area))
+            if index is None:
+                return []
+            return [
+                booking for booking in index.overlapping(start, end, statuses)
+                if booking.key != exclude
+            ]
+
+    def is_available(self, area, start, end, exclude=None):
+        return not self.conflicts(area, start, end, exclude=exclude)
+
+    def free_windows(self, areas, start, end, duration, statuses=BLOCKING_STATUSES):
+        """Open windows of at least ``duration`` inside [start, end), per area.
+
+        Sweeps the sorted bookings of each area once, so the cost is one
+        bisect plus the bookings in range rather than probing slot by slot.
+        Returns ``{area: [(window_start, window_end), ...]}``.
+        """
+        self.sync()
+        with self._lock:
+            booked = {}
+            for area in areas:
+                index = self._indexes.get(area_key(area))
+                booked[area] = index.overlapping(start, end, statuses) if index else []
+        return {area: list(_sweep(bookings, start, end, duration)) for area, bookings in booked.items()}
+
+
+def _sweep(bookings, start, end, duration):
+    """Yield the gaps between start-ordered bookings that fit ``duration``"""
+    cursor = start
+    for booking in bookings:
+        if booking.start - cursor >= duration:
+            yield cursor, booking.start
+        if booking.end > cursor:
+            cursor = booking.end
+    if end - cursor >= duration:
+        yield cursor, end
+
+
+engine = AvailabilityEngine()
+
+
+@contextmanager
+def booking_transaction():
+    """transaction.atomic() that takes the SQLite write lock up front (BEGIN IMMEDIATE).
+
+    With a plain deferred BEGIN, two processes could both find a slot free
+    and both insert; here the second waits until the first has committed,
+    and its conflict check then syncs the first one's booking.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def find_conflicts(area, start, end, exclude=None):
+    """Blocking bookings in ``area`` overlapping [start, end)"""
+    return engine.conflicts(area, start, end, exclude=exclude)
+
+
+def is_available(area, start, end, exclude=None):
+    """Check whether ``area`` is free for the whole of [start, end)"""
+    return engine.is_available(area, start, end, exclude=exclude)
+
+
+def free_windows(areas, start, end, duration):
+    """Open windows of at least ``duration`` in each of ``areas``"""
+    return engine.free_windows(areas, start, end, duration)
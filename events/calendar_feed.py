@@ -0,0 +1,182 @@
+"""
+Month-bucketed calendar feed.
+
+Each month of approved Reservations and Events is rendered once (JSON and
+iCalendar) and stored in the cache together with its ETag and Last-Modified
+time. ``events.signals`` drops the buckets of the months a saved or deleted
+booking touches, but only from this process's cache. Each bucket therefore
+also records a stamp of the booking tables (newest ``updated_at`` and row
+count), and is rebuilt when the stamp no longer matches, so a write made by
+another mod_wsgi process shows up on the next request.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import DEFAULT_EVENT_DURATION, Event, Reservation
+
+
+CACHE_KEY = 'calendar-feed:{year:04d}-{month:02d}'
+
+
+def feed_timeout():
+    """Seconds a bucket may live without being invalidated"""
+    return getattr(settings, 'CALENDAR_FEED_TIMEOUT', 300)
+
+
+def data_stamp():
+    """Newest updated_at and row count of Reservations and Events; changes with any save or delete"""
+    stamp = []
+    for model in (Reservation, Event):
+        row = model.objects.aggregate(changed=Max('updated_at'), rows=Count('pk'))
+        stamp += [row['changed'], row['rows']]
+    return tuple(stamp)
+
+
+def month_bounds(year, month):
+    """Aware [start, end) datetimes for a calendar month"""
+    start = timezone.make_aware(datetime(year, month, 1))
+    if month == 12:
+        end = timezone.make_aware(datetime(year + 1, 1, 1))
+    else:
+        end = timezone.make_aware(datetime(year, month + 1, 1))
+    return start, end
+
+
+def months_touched(start, end):
+    """(year, month) pairs covered by the interval [start, end)"""
+    first = timezone.localtime(start)
+    last = timezone.localtime(end - timedelta(microseconds=1)) if end > start else first
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def invalidate(months):
+    """Drop the materialized buckets for the given (year, month) pairs"""
+    cache.delete_many([CACHE_KEY.format(year=year, month=month) for year, month in set(months)])
+
+
+def _entries(year, month):
+    start, end = month_bounds(year, month)
+    entries = []
+    reservations = Reservation.objects.filter(
+        status='approved',
+        event_datetime_begin__lt=end,
+        event_datetime_end__gt=start,
+    ).values('event_id', 'event_organization', 'event_type', 'event_area',
+             'event_datetime_begin', 'event_datetime_end')
+    for row in reservations:
+        entries.append({
+            'uid': f"reservation-{row['event_id']}",
+            'kind': 'reservation',
+            'id': row['event_id'],
+            'title': f"{row['event_organization']} - {row['event_type']}",
+            'location': row['event_area'],
+            'start': row['event_datetime_begin'],
+            'end': row['event_datetime_end'],
+        })
+    events = Event.objects.filter(
+        Q(date_end__gt=start) | Q(date_end__isnull=True, date__gt=start - DEFAULT_EVENT_DURATION),
+        schedule_status='approved',
+        date__lt=end,
+    ).values('id', 'title', 'venue__venue', 'date', 'date_end')
+    for row in events:
+        entries.append({
+            'uid': f"event-{row['id']}",
+            'kind': 'event',
+            'id': row['id'],
+            'title': row['title'],
+            'location': row['venue__venue'] or '',
+            'start': row['date'],
+            'end': row['date_end'] or row['date'] + DEFAULT_EVENT_DURATION,
+        })
+    entries.sort(key=lambda entry: (entry['start'], entry['uid']))
+    return entries
+
+
+def _ics_escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _ics_fold(line):
+    """Fold a content line at 75 octets as RFC 5545 requires"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts)
+
+
+def _ics_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_ics(entries, generated_at):
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//The CIED//Calendar//EN',
+        'CALSCALE:GREGORIAN',
+    ]
+    for entry in entries:
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:{entry['uid']}@thecied.dev",
+            f'DTSTAMP:{_ics_datetime(generated_at)}',
+            f"DTSTART:{_ics_datetime(entry['start'])}",
+            f"DTEND:{_ics_datetime(entry['end'])}",
+            f"SUMMARY:{_ics_escape(entry['title'])}",
+            f"LOCATION:{_ics_escape(entry['location'])}",
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_ics_fold(line) for line in lines) + '\r\n'
+
+
+def _build(year, month, stamp):
+    entries = _entries(year, month)
+    generated_at = timezone.now().replace(microsecond=0)
+    body = json.dumps({
+        'year': year,
+        'month': month,
+        'events': [
+            dict(entry, start=entry['start'].isoformat(), end=entry['end'].isoformat())
+            for entry in entries
+        ],
+    })
+    return {
+        'json': body,
+        'ics': render_ics(entries, generated_at),
+        'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+        'last_modified': generated_at,
+        'stamp': stamp,
+    }
+
+
+def get_bucket(year, month):
+    """Materialized feed for one month, rebuilt once the bookings have changed"""
+    key = CACHE_KEY.format(year=year, month=month)
+    stamp = data_stamp()
+    bucket = cache.get(key)
+    if bucket is None or bucket.get('stamp') != stamp:
+        bucket = _build(year, month, stamp)
+        cache.set(key, bucket, feed_timeout())
+    return bucket
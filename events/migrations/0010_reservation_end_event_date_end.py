@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_reservation_end(apps, schema_editor):
+    Reservation = apps.get_model('events', 'Reservation')
+    for reservation in Reservation.objects.only('event_datetime_begin', 'event_datetime_delta').iterator():
+        Reservation.objects.filter(pk=reservation.pk).update(
+            event_datetime_end=reservation.event_datetime_begin + reservation.event_datetime_delta
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_remove_event_is_active_event_schedule_status_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='date_end',
+            field=models.DateTimeField(blank=True, help_text='Event end date and time', null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='event_datetime_end',
+            field=models.DateTimeField(editable=False, help_text='End date and time of the event (begin + duration), kept in sync on save', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['updated_at'], name='event_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['event_area', 'event_datetime_begin'], name='res_area_begin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['updated_at'], name='res_updated_idx'),
+        ),
+        migrations.RunPython(populate_reservation_end, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,11 @@ from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from datetime import timedelta
+
+
+# Events only carry a start time unless an end was given; assume this length
+DEFAULT_EVENT_DURATION = timedelta(hours=2)
 
 
 class Venue(models.Model):
@@ -131,6 +136,11 @@ class Event(models.Model):
     title = models.CharField(max_length=200, help_text="Event title")
     description = models.TextField(blank=True, null=True, help_text="Detailed event description")
     date = models.DateTimeField(help_text="Event date and time")
+    date_end = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Event end date and time"
+    )
     venue = models.ForeignKey(
         Venue,
         on_delete=models.SET_NULL,
@@ -177,10 +187,19 @@ class Event(models.Model):
         ordering = ['date']
         verbose_name = "Event"
         verbose_name_plural = "Events"
+        indexes = [
+            models.Index(fields=['updated_at'], name='event_updated_idx'),
+            models.Index(fields=['schedule_status', 'date'], name='event_status_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.date.strftime('%Y-%m-%d %H:%M')}"
     
+    @property
+    def effective_end(self):
+        """End time of the event, falling back to the default duration"""
+        return self.date_end or self.date + DEFAULT_EVENT_DURATION
+    
     @property
     def is_upcoming(self):
         """Check if the event is in the future"""
@@ -223,6 +242,11 @@ class Reservation(models.Model):
     event_type = models.TextField(help_text="Type of event (e.g., conference, workshop, meeting)")
     event_datetime_begin = models.DateTimeField(help_text="Start date and time of the event")
     event_datetime_delta = models.DurationField(help_text="Duration of the event")
+    event_datetime_end = models.DateTimeField(
+        null=True,
+        editable=False,
+        help_text="End date and time of the event (begin + duration), kept in sync on save"
+    )
     event_area = models.TextField(help_text="Area or room requested for the event")
     event_number_of_people_min = models.PositiveIntegerField(
         help_text="Minimum estimated number of people"
@@ -254,14 +278,29 @@ class Reservation(models.Model):
         ordering = ['event_datetime_begin']
         verbose_name = "Reservation"
         verbose_name_plural = "Reservations"
+        indexes = [
+            models.Index(fields=['event_area', 'event_datetime_begin'], name='res_area_begin_idx'),
+            models.Index(fields=['updated_at'], name='res_updated_idx'),
+            models.Index(fields=['status', 'event_datetime_begin'], name='res_status_begin_idx'),
+            models.Index(fields=['created_at'], name='res_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='res_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.event_organization} - {self.event_type} ({self.event_datetime_begin.strftime('%Y-%m-%d %H:%M')})"
     
-    @property
-    def event_datetime_end(self):
-        """Calculate the end time of the event"""
-        return self.event_datetime_begin + self.event_datetime_delta
+    def save(self, *args, **kwargs):
+        """Materialize the end time so overlap queries can use it directly.
+
+        bulk_create() and QuerySet.update() bypass this; code writing
+        reservations that way must set event_datetime_end itself.
+        """
+        if self.event_datetime_begin and self.event_datetime_delta is not None:
+            self.event_datetime_end = self.event_datetime_begin + self.event_datetime_delta
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'event_datetime_end'}
+        super().save(*args, **kwargs)
     
     @property
     def duration_hours(self):
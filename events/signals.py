@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import calendar_feed
+from .availability import engine
+from .models import DEFAULT_EVENT_DURATION, Event, Reservation
+
+
+def _reservation_span(reservation):
+    return reservation.event_datetime_begin, reservation.event_datetime_end
+
+
+def _event_span(event):
+    return event.date, event.effective_end
+
+
+def _invalidate_calendar(*spans):
+    months = [month for span in spans if span for month in calendar_feed.months_touched(*span)]
+    transaction.on_commit(lambda: calendar_feed.invalidate(months))
+
+
+@receiver(pre_save, sender=Reservation)
+@receiver(pre_save, sender=Event)
+def remember_previous_span(sender, instance, **kwargs):
+    """Note where the booking was before this save so its old months get invalidated too"""
+    instance._previous_span = None
+    if instance.pk is None:
+        return
+    if sender is Reservation:
+        fields = ('event_datetime_begin', 'event_datetime_end')
+    else:
+        fields = ('date', 'date_end')
+    previous = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    if previous is not None:
+        start, end = previous
+        instance._previous_span = (start, end or start + DEFAULT_EVENT_DURATION)
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, **kwargs):
+    """Keep the availability index and calendar feed current"""
+    transaction.on_commit(lambda: engine.put_reservation(instance))
+    _invalidate_calendar(getattr(instance, '_previous_span', None), _reservation_span(instance))
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: engine.discard('reservation', pk))
+    _invalidate_calendar(_reservation_span(instance))
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: engine.put_event(instance))
+    _invalidate_calendar(getattr(instance, '_previous_span', None), _event_span(instance))
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: engine.discard('event', pk))
+    _invalidate_calendar(_event_span(instance))
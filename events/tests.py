@@ -1,3 +1,343 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from thecied import caching
+
+from . import availability, calendar_feed
+from .availability import AvailabilityEngine, Booking, IntervalIndex
+from .models import Event, EventClass, Reservation, Venue
+
+
+def at(hour, day=1):
+    return datetime(2030, 6, day, hour, tzinfo=dt_timezone.utc)
+
+
+def booking(pk, start, end, status='approved', kind='reservation'):
+    return Booking(kind=kind, pk=pk, area='Hall', start=start, end=end, status=status, label=f'#{pk}')
+
+
+def reservation(area, start, hours, **fields):
+    return Reservation.objects.create(
+        event_organization='Org', event_type='Meeting', event_area=area,
+        event_datetime_begin=start, event_datetime_delta=timedelta(hours=hours),
+        event_number_of_people_min=1, event_number_of_people_max=10, **fields,
+    )
+
+
+class IntervalIndexTests(TestCase):
+    def test_half_open_edges(self):
+        index = IntervalIndex()
+        index.add(booking(1, at(10), at(12)))
+        self.assertEqual(index.overlapping(at(12), at(13)), [])
+        self.assertEqual(index.overlapping(at(8), at(10)), [])
+        self.assertEqual([b.pk for b in index.overlapping(at(11), at(11) + timedelta(minutes=1))], [1])
+
+    def test_long_booking_starting_well_before_the_query(self):
+        index = IntervalIndex()
+        index.add(booking(1, at(0, day=1), at(0, day=10)))
+        for pk, day in enumerate(range(2, 9), start=2):
+            index.add(booking(pk, at(9, day), at(10, day)))
+        self.assertEqual([b.pk for b in index.overlapping(at(12, day=9), at(13, day=9))], [1])
+
+    def test_statuses_and_empty_ranges(self):
+        index = IntervalIndex()
+        index.add(booking(1, at(10), at(12), status='rejected'))
+        self.assertEqual(index.overlapping(at(9), at(13), statuses=('approved',)), [])
+        self.assertEqual(len(index.overlapping(at(9), at(13))), 1)
+        self.assertEqual(index.overlapping(at(13), at(9)), [])
+        self.assertEqual(IntervalIndex().overlapping(at(9), at(13)), [])
+
+    def test_re_adding_a_booking_replaces_it(self):
+        index = IntervalIndex()
+        index.add(booking(1, at(10), at(12)))
+        index.add(booking(1, at(14), at(15)))
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.overlapping(at(10), at(12)), [])
+        self.assertIsNotNone(index.remove(('reservation', 1)))
+        self.assertEqual(len(index), 0)
+
+    def test_removing_the_longest_booking_narrows_the_search(self):
+        index = IntervalIndex()
+        index.add(booking(1, at(0, day=1), at(0, day=20)))
+        index.add(booking(2, at(10, day=5), at(11, day=5)))
+        index.add(booking(3, at(10, day=6), at(12, day=6)))
+        index.remove(('reservation', 1))
+        self.assertEqual(index._spans[-1], timedelta(hours=2))
+        self.assertEqual([b.pk for b in index.overlapping(at(11, day=6), at(13, day=6))], [3])
+        index.add(booking(3, at(10, day=6), at(11, day=6)))
+        self.assertEqual(index._spans, [timedelta(hours=1)] * 2)
+
+
+class EngineSyncTests(TestCase):
+    def test_sync_picks_up_rows_written_without_signals(self):
+        engine = AvailabilityEngine()
+        self.assertTrue(engine.is_available('Hall', at(10), at(12)))
+        # bulk_create sends no signals, like a write from another process
+        Reservation.objects.bulk_create([Reservation(
+            event_organization='Org', event_type='Meeting', event_area='  hall ',
+            event_datetime_begin=at(10), event_datetime_delta=timedelta(hours=2), event_datetime_end=at(12),
+            event_number_of_people_min=1, event_number_of_people_max=10,
+        )])
+        self.assertEqual(len(engine.conflicts('Hall', at(11), at(13))), 1)
+
+    def test_sync_rereads_rows_committed_with_an_older_stamp(self):
+        engine = AvailabilityEngine()
+        newer = reservation('Hall', at(10), 1)
+        engine.sync()
+        older = reservation('Hall', at(14), 1)
+        Reservation.objects.filter(pk=older.pk).update(updated_at=newer.updated_at - timedelta(seconds=5))
+        self.assertEqual([b.pk for b in engine.conflicts('Hall', at(14), at(15))], [older.pk])
+
+    def test_end_is_computed_not_read_from_the_stored_column(self):
+        engine = AvailabilityEngine()
+        booked = reservation('Hall', at(10), 1)
+        # update() skips Reservation.save(), leaving event_datetime_end stale
+        Reservation.objects.filter(pk=booked.pk).update(event_datetime_delta=timedelta(hours=4))
+        self.assertEqual([b.pk for b in engine.conflicts('Hall', at(13), at(14))], [booked.pk])
+
+    def test_rebuild_drops_rows_deleted_elsewhere(self):
+        engine = AvailabilityEngine()
+        booked = reservation('Hall', at(10), 2)
+        self.assertFalse(engine.is_available('Hall', at(10), at(11)))
+        Reservation.objects.filter(pk=booked.pk).delete()
+        engine.rebuild()
+        self.assertTrue(engine.is_available('Hall', at(10), at(11)))
+
+    def test_exclude_and_non_blocking_status(self):
+        engine = AvailabilityEngine()
+        booked = reservation('Hall', at(10), 2)
+        reservation('Hall', at(10), 2, status='rejected')
+        self.assertTrue(engine.is_available('Hall', at(10), at(12), exclude=('reservation', booked.pk)))
+
+
+class FreeWindowTests(TestCase):
+    def test_gaps_between_bookings_that_fit(self):
+        engine = AvailabilityEngine()
+        reservation('Hall', at(10), 2)
+        reservation('Hall', at(13), 1)
+        windows = engine.free_windows(['Hall'], at(8), at(18), timedelta(hours=1))
+        self.assertEqual(windows, {'Hall': [(at(8), at(10)), (at(12), at(13)), (at(14), at(18))]})
+
+    def test_too_short_gaps_are_skipped(self):
+        engine = AvailabilityEngine()
+        reservation('Hall', at(10), 2)
+        reservation('Hall', at(13), 1)
+        windows = engine.free_windows(['Hall'], at(8), at(15), timedelta(hours=2))
+        self.assertEqual(windows['Hall'], [(at(8), at(10))])
+
+    def test_nested_and_overhanging_bookings(self):
+        engine = AvailabilityEngine()
+        reservation('Hall', at(6), 6)  # 6:00-12:00 covers the start of the range
+        reservation('Hall', at(9), 1)  # inside the first one
+        reservation('Hall', at(15), 5)  # runs past the end of the range
+        windows = engine.free_windows(['Hall', 'Empty room'], at(8), at(16), timedelta(hours=1))
+        self.assertEqual(windows, {'Hall': [(at(12), at(15))], 'Empty room': [(at(8), at(16))]})
+
+    def test_windows_never_cross_booked_time(self):
+        engine = AvailabilityEngine()
+        for hour in (9, 11, 14):
+            reservation('Hall', at(hour), 1)
+        for start, end in engine.free_windows(['Hall'], at(8), at(18), timedelta(minutes=30))['Hall']:
+            self.assertTrue(engine.is_available('Hall', start, end))
+
+
+class AvailabilityApiTests(TestCase):
+    def setUp(self):
+        Venue.objects.create(venue='Hall', address='1 Main St', capacity=200)
+        Venue.objects.create(venue='Nook', address='1 Main St', capacity=4)
+        reservation('Hall', at(8), 4)
+        availability.engine.rebuild()
+
+    def get(self, **params):
+        return self.client.get('/events/api/availability/', params)
+
+    def test_earliest_windows_across_venues_that_fit(self):
+        data = self.get(duration_hours='2', crowd_size='small', start=at(8).isoformat(),
+                        end=at(20).isoformat(), limit='5').json()['data']
+        self.assertEqual([(row['venue'], row['start']) for row in data], [('Hall', at(12).isoformat())])
+        data = self.get(duration_hours='2', crowd_size='3', start=at(8).isoformat(), end=at(20).isoformat()).json()['data']
+        self.assertEqual([row['venue'] for row in data], ['Nook', 'Hall'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(duration_hours='soon').status_code, 400)
+        self.assertEqual(self.get(duration_hours='-1').status_code, 400)
+        self.assertEqual(self.get(start=at(10).isoformat(), end=at(9).isoformat()).status_code, 400)
+        self.assertEqual(self.get(start=at(0).isoformat(), end=at(0, day=1).replace(year=2031).isoformat()).status_code, 400)
+
+    def test_non_finite_and_overflowing_inputs_are_rejected(self):
+        for duration in ('inf', '-inf', 'nan', '1e10'):
+            self.assertEqual(self.get(duration_hours=duration).status_code, 400, duration)
+        self.assertEqual(self.get(start='9999-12-20T00:00:00+00:00').status_code, 400)
+        # The index search reaching back past datetime.min is not an error
+        self.assertEqual(self.get(start='0001-01-01T00:00:00+00:00', end='0001-01-10T00:00:00+00:00').status_code, 200)
+
+    def test_check_availability_rejects_bad_durations(self):
+        for duration in ('inf', 'nan', '1e10', 'soon'):
+            response = self.client.get('/events/api/availability/check/', {
+                'area': 'Hall', 'start': at(10).isoformat(), 'duration_hours': duration,
+            })
+            self.assertEqual(response.status_code, 400, duration)
+        response = self.client.get('/events/api/availability/check/', {
+            'area': 'Hall', 'start': '9999-12-31T23:00:00+00:00', 'duration_hours': '2',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_out_of_range_dates_are_not_found(self):
+        for url in ('/events/calendar/0/1/', '/events/calendar/9999/12/', '/events/calendar/10000/1/',
+                    '/events/calendar/2030/13/', '/events/calendar/2030/0.ics'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_month_feed_and_revalidation(self):
+        reservation('Hall', at(10), 2, status='approved')
+        reservation('Hall', at(14), 2)  # pending: not published
+        response = self.client.get('/events/calendar/2030/6/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['events']), 1)
+        again = self.client.get('/events/calendar/2030/6/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_bucket_is_built_once_per_request(self):
+        with mock.patch('events.views.calendar_feed.get_bucket', wraps=calendar_feed.get_bucket) as get_bucket:
+            self.assertEqual(self.client.get('/events/calendar/2030/6/').status_code, 200)
+        get_bucket.assert_called_once_with(2030, 6)
+
+    def test_writes_from_another_process_are_picked_up(self):
+        booked = reservation('Hall', at(10), 2)
+        response = self.client.get('/events/calendar/2030/6/')
+        self.assertEqual(json.loads(response.content)['events'], [])
+        # update() sends no signals, like a write in the other mod_wsgi process
+        Reservation.objects.filter(pk=booked.pk).update(status='approved', updated_at=timezone.now())
+        again = self.client.get('/events/calendar/2030/6/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(len(json.loads(again.content)['events']), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Reservation._meta.db_table} WHERE event_id = %s', [booked.pk])
+        self.assertEqual(json.loads(self.client.get('/events/calendar/2030/6/').content)['events'], [])
+
+
+class ConflictPathTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(venue='Auditorium', address='1 Main St')
+        self.event_class = EventClass.objects.create(event_name='Talk')
+        self.user = User.objects.create_user('organizer', password='pw')
+        reservation('Auditorium', at(10), 2)
+        availability.engine.rebuild()
+
+    def test_create_reservation_rejects_an_overlap(self):
+        # The form template is not shipped with the app; only the outcome matters here
+        with mock.patch('events.views.render', return_value=HttpResponse()):
+            response = self.client.post('/events/reservations/create/', {
+                'organization': 'Other', 'event_type': 'Meeting', 'area': 'Auditorium',
+                'datetime_begin': '2030-06-01T11:00', 'duration_hours': '1',
+            })
+        self.assertIn('already booked', ' '.join(str(m) for m in get_messages(response.wsgi_request)))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_create_reservation_accepts_a_free_slot(self):
+        response = self.client.post('/events/reservations/create/', {
+            'organization': 'Other', 'event_type': 'Meeting', 'area': 'Auditorium',
+            'datetime_begin': '2030-06-02T11:00', 'duration_hours': '1',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_api_create_event_returns_409_on_overlap(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/events/api/create-event/', json.dumps({
+            'title': 'Clash', 'eventType': self.event_class.pk, 'area': self.venue.pk,
+            'datetimeStart': '2030-06-01T09:00:00Z', 'datetimeEnd': '2030-06-01T10:30:00Z',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.json()['conflicts']), 1)
+        self.assertFalse(Event.objects.exists())
+
+
+class BookingTransactionTests(TransactionTestCase):
+    def test_takes_the_write_lock_before_checking(self):
+        with CaptureQueriesContext(connection) as queries:
+            with availability.booking_transaction():
+                availability.find_conflicts('Hall', at(10), at(12))
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+        # Other transactions keep the configured mode
+        with CaptureQueriesContext(connection) as queries:
+            with availability.transaction.atomic():
+                Reservation.objects.exists()
+        self.assertNotEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+class CacheViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Venue.objects.create(venue='Hall', address='1 Main St')
+
+    def venues(self, **cookies):
+        self.client.cookies.clear()
+        for name, value in cookies.items():
+            self.client.cookies[name] = value
+        return [row['venue'] for row in self.client.get('/events/api/venues/').json()['data']]
+
+    def test_saves_and_deletes_invalidate_dependent_views(self):
+        self.assertEqual(self.venues(), ['Hall'])
+        # Written without signals: the cached list is still served
+        Venue.objects.bulk_create([Venue(venue='Nook', address='1 Main St')])
+        self.assertEqual(self.venues(), ['Hall'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Venue.objects.create(venue='Attic', address='1 Main St')
+        self.assertEqual(sorted(self.venues()), ['Attic', 'Hall', 'Nook'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Venue.objects.get(venue='Hall').delete()
+        self.assertEqual(sorted(self.venues()), ['Attic', 'Nook'])
+
+    def test_generation_tokens(self):
+        first = caching.generations(['events.venue', 'events.eventclass'])
+        self.assertEqual(caching.generations(['events.venue', 'events.eventclass']), first)
+        caching.bump(Venue)
+        second = caching.generations(['events.venue', 'events.eventclass'])
+        self.assertNotEqual(second[0], first[0])
+        self.assertEqual(second[1], first[1])
+
+    def test_requests_with_a_session_bypass_the_cache(self):
+        self.assertEqual(self.venues(sessionid='abc'), ['Hall'])
+        Venue.objects.bulk_create([Venue(venue='Nook', address='1 Main St')])
+        # Nothing was stored for the session request, and it never reads the cache
+        self.assertEqual(sorted(self.venues()), ['Hall', 'Nook'])
+        Venue.objects.bulk_create([Venue(venue='Attic', address='1 Main St')])
+        self.assertEqual(sorted(self.venues(messages='x')), ['Attic', 'Hall', 'Nook'])
+
+    def test_only_responses_the_same_for_everyone_are_stored(self):
+        factory = RequestFactory()
+        pages = iter(range(10))
+
+        def page(vary=None, csrf=False):
+            @caching.cache_view('test_page')
+            def view(request):
+                if csrf:
+                    get_token(request)
+                response = HttpResponse(str(next(pages)))
+                if vary:
+                    response['Vary'] = vary
+                return response
+            return lambda: view(factory.get('/page/')).content
+
+        for varying in (page(vary='Cookie'), page(csrf=True)):
+            cache.clear()
+            self.assertNotEqual(varying(), varying())
+        cache.clear()
+        plain = page()
+        self.assertEqual(plain(), plain())
@@ -14,8 +14,14 @@ urlpatterns = [
     path('reservations/create/', views.create_reservation, name='create_reservation'),
     path('reservations/<int:reservation_id>/', views.reservation_detail, name='reservation_detail'),
     
+    # Calendar feed URLs
+    path('calendar/<int:year>/<int:month>/', views.calendar_feed_view, name='calendar_feed'),
+    path('calendar/<int:year>/<int:month>.ics', views.calendar_feed_view, {'fmt': 'ics'}, name='calendar_feed_ics'),
+    
     # API URLs
     path('api/event-classes/', views.api_event_classes, name='api_event_classes'),
     path('api/venues/', views.api_venues, name='api_venues'),
+    path('api/availability/', views.api_availability, name='api_availability'),
     path('api/create-event/', views.api_create_event, name='api_create_event'),
+    path('api/availability/check/', views.api_check_availability, name='api_check_availability'),
 ]
@@ -3,12 +3,20 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, Http404
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+import heapq
+import itertools
 import json
-from datetime import datetime
-from .models import Event, EventRegistration, Reservation, EventClass, Venue
+import math
+from datetime import datetime, timedelta
+from thecied.caching import cache_view
+from imaging.pipeline import IMAGE_FIELDS
+from imaging.renditions import describe, lookup
+from .models import Event, EventRegistration, Reservation, EventClass, Venue, DEFAULT_EVENT_DURATION
+from . import availability, calendar_feed
 
 
 def is_admin(user):
@@ -16,6 +24,37 @@ def is_admin(user):
     return user.is_authenticated and (user.is_superuser or user.is_staff)
 
 
+# Participant bounds for the crowd size choices on the reserve page
+CROWD_SIZES = {
+    'intimate': (1, 5),
+    'small': (6, 15),
+    'medium': (16, 30),
+    'large': (31, 60),
+    'xlarge': (61, 100),
+    'massive': (100, 500),
+}
+
+# Limits for the free-slot search
+AVAILABILITY_DEFAULT_DAYS = 14
+AVAILABILITY_MAX_DAYS = 90
+AVAILABILITY_DEFAULT_LIMIT = 10
+AVAILABILITY_MAX_LIMIT = 50
+
+
+def _parse_iso_datetime(value):
+    """Parse an ISO 8601 string (``Z`` suffix allowed) into an aware datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _parse_hours(value):
+    """A timedelta of ``value`` hours; ValueError unless it is a finite number"""
+    hours = float(value)
+    if not math.isfinite(hours):
+        raise ValueError(f'{value!r} is not a finite number of hours')
+    return timedelta(hours=hours)
+
+
 @user_passes_test(is_admin, login_url='/admin/login/')
 def event_list(request):
     """Display list of all upcoming events"""
@@ -142,6 +181,7 @@ def my_events(request):
     return render(request, 'events/my_events.html', context)
 
 
+@cache_view('reservation_list', depends_on=['events.Reservation'])
 def reservation_list(request):
     """Display list of all approved reservations (public calendar)"""
     reservations = Reservation.objects.filter(
@@ -155,6 +195,7 @@ def reservation_list(request):
     return render(request, 'events/reservation_list.html', context)
 
 
+@cache_view('reservation_detail', depends_on=['events.Reservation'])
 def reservation_detail(request, reservation_id):
     """Display detailed view of a specific reservation"""
     reservation = get_object_or_404(
@@ -182,32 +223,45 @@ def create_reservation(request):
         
         try:
             # Parse datetime
-            from datetime import datetime, timedelta
             dt_begin = datetime.strptime(datetime_begin, '%Y-%m-%dT%H:%M')
             dt_begin = timezone.make_aware(dt_begin)
             
             # Create duration
-            duration = timedelta(hours=float(duration_hours))
+            duration = _parse_hours(duration_hours)
             
-            # Create reservation
-            reservation = Reservation.objects.create(
-                event_organization=organization,
-                event_type=event_type,
-                event_datetime_begin=dt_begin,
-                event_datetime_delta=duration,
-                event_area=area,
-                event_number_of_people_min=int(people_min),
-                event_number_of_people_max=int(people_max),
-                event_specialrequests=special_requests,
-            )
+            with availability.booking_transaction():
+                # Reject requests that overlap an existing booking for the area
+                conflicts = availability.find_conflicts(area, dt_begin, dt_begin + duration)
+                if conflicts:
+                    reservation = None
+                else:
+                    reservation = Reservation.objects.create(
+                        event_organization=organization,
+                        event_type=event_type,
+                        event_datetime_begin=dt_begin,
+                        event_datetime_delta=duration,
+                        event_area=area,
+                        event_number_of_people_min=int(people_min),
+                        event_number_of_people_max=int(people_max),
+                        event_specialrequests=special_requests,
+                    )
             
-            messages.success(
-                request,
-                f'Reservation request submitted successfully! '
-                f'Reservation ID: {reservation.event_id}. '
-                f'Your request is pending review.'
-            )
-            return redirect('reservation_detail', reservation_id=reservation.event_id)
+            if reservation is None:
+                messages.error(
+                    request,
+                    f'{area} is already booked between '
+                    f'{conflicts[0].start.strftime("%Y-%m-%d %H:%M")} and '
+                    f'{conflicts[0].end.strftime("%Y-%m-%d %H:%M")}. '
+                    f'Please choose another time.'
+                )
+            else:
+                messages.success(
+                    request,
+                    f'Reservation request submitted successfully! '
+                    f'Reservation ID: {reservation.event_id}. '
+                    f'Your request is pending review.'
+                )
+                return redirect('reservation_detail', reservation_id=reservation.event_id)
             
         except (ValueError, TypeError) as e:
             messages.error(request, f'Invalid data provided: {str(e)}')
@@ -235,14 +289,24 @@ def create_reservation(request):
 
 
 # API Views
+def _with_photos(rows, fields):
+    """Replace each row's image fields with a 'photos' list of sized renditions"""
+    found = lookup(row[field] for row in rows for field in fields)
+    for row in rows:
+        row['photos'] = [describe(name, found) for name in (row.pop(field) for field in fields) if name]
+    return rows
+
+
 @require_http_methods(["GET"])
+@cache_view('api_event_classes', depends_on=['events.EventClass', 'imaging.SourceImage'])
 def api_event_classes(request):
     """API endpoint to get all event classes for dropdown"""
     try:
-        event_classes = EventClass.objects.all().values('event_model_id', 'event_name', 'description')
+        fields = IMAGE_FIELDS['events.EventClass']
+        event_classes = list(EventClass.objects.all().values('event_model_id', 'event_name', 'description', *fields))
         return JsonResponse({
             'success': True,
-            'data': list(event_classes)
+            'data': _with_photos(event_classes, fields)
         })
     except Exception as e:
         return JsonResponse({
@@ -252,13 +316,90 @@ def api_event_classes(request):
 
 
 @require_http_methods(["GET"])
+@cache_view('api_venues', depends_on=['events.Venue', 'imaging.SourceImage'])
 def api_venues(request):
     """API endpoint to get all venues for dropdown"""
     try:
-        venues = Venue.objects.all().values('v_id', 'venue', 'capacity', 'description')
+        fields = IMAGE_FIELDS['events.Venue']
+        venues = list(Venue.objects.all().values('v_id', 'venue', 'capacity', 'description', *fields))
+        return JsonResponse({
+            'success': True,
+            'data': _with_photos(venues, fields)
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def api_availability(request):
+    """API endpoint to find the next open windows across venues that fit a crowd"""
+    try:
+        duration = _parse_hours(request.GET.get('duration_hours', '2'))
+        
+        crowd_size = request.GET.get('crowd_size', '')
+        if crowd_size in CROWD_SIZES:
+            people = CROWD_SIZES[crowd_size][1]
+        else:
+            people = int(crowd_size) if crowd_size else 0
+        
+        start = request.GET.get('start')
+        start_datetime = _parse_iso_datetime(start) if start else timezone.now()
+        end = request.GET.get('end')
+        if end:
+            end_datetime = _parse_iso_datetime(end)
+        else:
+            end_datetime = start_datetime + timedelta(days=AVAILABILITY_DEFAULT_DAYS)
+        
+        limit = min(int(request.GET.get('limit', AVAILABILITY_DEFAULT_LIMIT)), AVAILABILITY_MAX_LIMIT)
+    except (ValueError, OverflowError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid duration_hours, crowd_size, start, end or limit'
+        }, status=400)
+    
+    if duration <= timedelta(0) or limit <= 0 or end_datetime <= start_datetime:
+        return JsonResponse({
+            'success': False,
+            'error': 'duration_hours and limit must be positive and end must be after start'
+        }, status=400)
+    max_range = timedelta(days=AVAILABILITY_MAX_DAYS)
+    if end_datetime - start_datetime > max_range or duration > max_range:
+        return JsonResponse({
+            'success': False,
+            'error': f'Date range and duration cannot exceed {AVAILABILITY_MAX_DAYS} days'
+        }, status=400)
+    
+    try:
+        venues = Venue.objects.all()
+        if people:
+            # Venues without a recorded capacity are not filtered out
+            venues = venues.filter(Q(capacity__gte=people) | Q(capacity__isnull=True))
+        venues = {row['venue']: row for row in venues.values('v_id', 'venue', 'capacity')}
+        
+        windows = availability.free_windows(list(venues), start_datetime, end_datetime, duration)
+        
+        # Merge the per-venue sweeps and keep the earliest windows overall
+        ordered = heapq.merge(*(
+            [(window_start, window_end, name) for window_start, window_end in venue_windows]
+            for name, venue_windows in windows.items()
+        ))
+        data = [
+            {
+                'v_id': venues[name]['v_id'],
+                'venue': name,
+                'capacity': venues[name]['capacity'],
+                'start': window_start.isoformat(),
+                'end': window_end.isoformat(),
+            }
+            for window_start, window_end, name in itertools.islice(ordered, limit)
+        ]
+        
         return JsonResponse({
             'success': True,
-            'data': list(venues)
+            'data': data
         })
     except Exception as e:
         return JsonResponse({
@@ -292,14 +433,28 @@ def api_create_event(request):
         
         # Parse datetime
         try:
-            start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            start_datetime = timezone.make_aware(start_datetime) if timezone.is_naive(start_datetime) else start_datetime
+            start_datetime = _parse_iso_datetime(start_date)
         except ValueError:
             return JsonResponse({
                 'success': False,
                 'error': 'Invalid start date format'
             }, status=400)
         
+        end_datetime = None
+        if end_date:
+            try:
+                end_datetime = _parse_iso_datetime(end_date)
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Invalid end date format'
+                }, status=400)
+            if end_datetime <= start_datetime:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'End date must be after start date'
+                }, status=400)
+        
         # Get EventClass and Venue objects
         try:
             event_class = EventClass.objects.get(event_model_id=event_type_id)
@@ -318,34 +473,35 @@ def api_create_event(request):
             }, status=400)
         
         # Parse crowd size for participant bounds
-        participant_lower = 1
-        participant_upper = 1
+        participant_lower, participant_upper = CROWD_SIZES.get(crowd_size, (1, 1))
         
-        if crowd_size == 'intimate':
-            participant_lower, participant_upper = 1, 5
-        elif crowd_size == 'small':
-            participant_lower, participant_upper = 6, 15
-        elif crowd_size == 'medium':
-            participant_lower, participant_upper = 16, 30
-        elif crowd_size == 'large':
-            participant_lower, participant_upper = 31, 60
-        elif crowd_size == 'xlarge':
-            participant_lower, participant_upper = 61, 100
-        elif crowd_size == 'massive':
-            participant_lower, participant_upper = 100, 500
-        
-        # Create event
-        event = Event.objects.create(
-            title=title,
-            description=special_requests,
-            date=start_datetime,
-            venue=venue,
-            event_class=event_class,
-            organizer=request.user,
-            number_of_participants_lowerbound=participant_lower,
-            number_of_participants_upperbound=participant_upper,
-            schedule_status='pending'
-        )
+        with availability.booking_transaction():
+            # Refuse to double-book the venue
+            conflicts = availability.find_conflicts(
+                venue.venue,
+                start_datetime,
+                end_datetime or start_datetime + DEFAULT_EVENT_DURATION
+            )
+            if conflicts:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Venue is not available for the requested time',
+                    'conflicts': [booking.to_dict() for booking in conflicts]
+                }, status=409)
+            
+            # Create event
+            event = Event.objects.create(
+                title=title,
+                description=special_requests,
+                date=start_datetime,
+                date_end=end_datetime,
+                venue=venue,
+                event_class=event_class,
+                organizer=request.user,
+                number_of_participants_lowerbound=participant_lower,
+                number_of_participants_upperbound=participant_upper,
+                schedule_status='pending'
+            )
         
         return JsonResponse({
             'success': True,
@@ -368,3 +524,94 @@ def api_create_event(request):
             'success': False,
             'error': str(e)
         }, status=500)
+
+
+@require_http_methods(["GET"])
+def api_check_availability(request):
+    """API endpoint to check whether an area or venue is free for a time slot"""
+    area = request.GET.get('area', '')
+    venue_id = request.GET.get('venue')
+    start = request.GET.get('start')
+    end = request.GET.get('end')
+    duration_hours = request.GET.get('duration_hours')
+    
+    if venue_id:
+        try:
+            area = Venue.objects.values_list('venue', flat=True).get(v_id=venue_id)
+        except (Venue.DoesNotExist, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid venue'
+            }, status=400)
+    
+    if not area or not start or not (end or duration_hours):
+        return JsonResponse({
+            'success': False,
+            'error': 'Missing required parameters: area or venue, start, end or duration_hours'
+        }, status=400)
+    
+    try:
+        start_datetime = _parse_iso_datetime(start)
+        if end:
+            end_datetime = _parse_iso_datetime(end)
+        else:
+            end_datetime = start_datetime + _parse_hours(duration_hours)
+    except (ValueError, OverflowError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid date or duration'
+        }, status=400)
+    
+    if end_datetime <= start_datetime:
+        return JsonResponse({
+            'success': False,
+            'error': 'End must be after start'
+        }, status=400)
+    
+    try:
+        conflicts = availability.find_conflicts(area, start_datetime, end_datetime)
+        return JsonResponse({
+            'success': True,
+            'data': {
+                'area': area,
+                'start': start_datetime.isoformat(),
+                'end': end_datetime.isoformat(),
+                'available': not conflicts,
+                'conflicts': [booking.to_dict() for booking in conflicts]
+            }
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+def _calendar_bucket(request, year, month, fmt='json'):
+    """The month's feed, fetched once per request for the ETag, Last-Modified and body"""
+    bucket = getattr(request, '_calendar_bucket', None)
+    if bucket is None:
+        if not 1 <= month <= 12:
+            raise Http404('Invalid month')
+        # month_bounds() needs the next month's first day to be a valid date too
+        if not 1 <= year <= 9998:
+            raise Http404('Invalid year')
+        bucket = request._calendar_bucket = calendar_feed.get_bucket(year, month)
+    return bucket
+
+
+@require_http_methods(["GET", "HEAD"])
+@condition(
+    etag_func=lambda request, year, month, fmt='json': _calendar_bucket(request, year, month)['etag'],
+    last_modified_func=lambda request, year, month, fmt='json': _calendar_bucket(request, year, month)['last_modified'],
+)
+def calendar_feed_view(request, year, month, fmt='json'):
+    """Approved reservations and events for one month, as JSON or iCalendar"""
+    bucket = _calendar_bucket(request, year, month)
+    if fmt == 'ics':
+        response = HttpResponse(bucket['ics'], content_type='text/calendar; charset=utf-8')
+    else:
+        response = HttpResponse(bucket['json'], content_type='application/json')
+    # Let browsers and the Apache front end revalidate with the ETag
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from .models import ImageDerivative, SourceImage
+
+
+class ImageDerivativeInline(admin.TabularInline):
+    model = ImageDerivative
+    extra = 0
+    fields = ['size', 'format', 'file', 'width', 'height', 'bytes']
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(SourceImage)
+class SourceImageAdmin(admin.ModelAdmin):
+    list_display = ['name', 'width', 'height', 'format', 'bytes', 'processed_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'width', 'height', 'format', 'bytes', 'processed_at']
+    inlines = [ImageDerivativeInline]
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class ImagingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'imaging'
+
+    def ready(self):
+        from thecied.caching import track_models
+        from . import refcounts, signals  # noqa: F401
+
+        track_models(self.get_model('SourceImage'))
+        refcounts.connect()
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from imaging import refcounts
+from imaging.models import ImageDerivative, SourceImage, StoredFile
+from imaging.pipeline import IMAGE_FIELDS
+from imaging.storage import CONTENT_DIR, is_content_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete content-addressed media files that no row refers to, and the derivatives '
+        'of images that are no longer used, after correcting reference counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24),
+            help='Keep unreferenced files uploaded more recently than this (their form may not be saved yet)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        if not getattr(default_storage, 'content_addressed', False):
+            self.stdout.write(self.style.WARNING('The default storage is not content-addressed; nothing to do'))
+            return
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        # Derivatives of originals that no photo field holds any more
+        in_use = set()
+        for label, fields in IMAGE_FIELDS.items():
+            for row in apps.get_model(label).objects.values_list(*fields):
+                in_use.update(name for name in row if name)
+        orphans = SourceImage.objects.exclude(name__in=in_use)
+        self.stdout.write(f'{orphans.count()} processed images no longer used')
+        if not dry_run:
+            # Renditions stored before content addressing have files of their own
+            for name in ImageDerivative.objects.filter(source__in=orphans).values_list('file', flat=True):
+                default_storage.delete(name)
+            # Deleting them drops their derivatives, and those files' references
+            orphans.delete()
+
+        references = refcounts.count_references()
+        corrected = self._recount(references, dry_run)
+        adopted = self._adopt_untracked(references, dry_run)
+        self.stdout.write(f'{corrected} reference counts corrected, {adopted} untracked files registered')
+
+        deleted = freed = 0
+        for stored in StoredFile.objects.filter(refs=0, last_saved__lt=cutoff).exclude(name__in=references.keys()):
+            if dry_run:
+                self.stdout.write(f'Would delete {stored.name} ({filesizeformat(stored.size)})')
+            # Only if nothing uploaded the same content again since the query above
+            elif StoredFile.objects.filter(pk=stored.pk, refs=0, last_saved__lt=cutoff).delete()[0]:
+                default_storage.remove(stored.name)
+                try:
+                    Path(default_storage.path(stored.name)).parent.rmdir()
+                except OSError:
+                    pass  # other files still share the directory
+            else:
+                continue
+            deleted += 1
+            freed += stored.size
+        verb = 'Would free' if dry_run else 'Freed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {filesizeformat(freed)} in {deleted} unreferenced files'))
+
+    def _recount(self, references, dry_run):
+        """Set refs from a scan of the rows where signals missed a change"""
+        corrected = 0
+        for stored in StoredFile.objects.only('pk', 'name', 'refs').iterator():
+            actual = references.get(stored.name, 0)
+            if stored.refs != actual:
+                corrected += 1
+                if not dry_run:
+                    StoredFile.objects.filter(pk=stored.pk).update(refs=actual)
+        return corrected
+
+    def _adopt_untracked(self, references, dry_run):
+        """Register content files left on disk without a StoredFile row, and remove stale partial writes"""
+        root = Path(default_storage.path(CONTENT_DIR))
+        if not root.is_dir():
+            return 0
+        known = set(StoredFile.objects.values_list('name', flat=True))
+        grace = timezone.now() - timedelta(hours=1)
+        adopted = 0
+        for path in root.glob('*/*'):
+            name = path.relative_to(Path(default_storage.location)).as_posix()
+            modified = datetime.fromtimestamp(path.stat().st_mtime, tz=dt_timezone.utc)
+            if path.suffix == '.tmp':
+                if modified < grace and not dry_run:
+                    path.unlink(missing_ok=True)
+                continue
+            if name in known or not is_content_name(name):
+                continue
+            adopted += 1
+            if not dry_run:
+                StoredFile.objects.get_or_create(name=name, defaults={
+                    'sha256': path.stem, 'size': path.stat().st_size,
+                    'refs': references.get(name, 0), 'last_saved': modified,
+                })
+        return adopted
@@ -0,0 +1,53 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from imaging.pipeline import IMAGE_FIELDS, pending, process_many
+from imaging.tasks import process_image
+
+
+class Command(BaseCommand):
+    help = 'Generate thumb/card/full WebP and JPEG derivatives for every uploaded image that lacks them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+        parser.add_argument(
+            '--jobs', type=int, default=getattr(settings, 'IMAGE_PROCESS_JOBS', 1),
+            help='Images rendered at once, each in its own process',
+        )
+        parser.add_argument('--queue', action='store_true', help='Leave the work to runworker instead of doing it here')
+
+    def handle(self, *args, **options):
+        names = set()
+        for label, fields in IMAGE_FIELDS.items():
+            for row in apps.get_model(label).objects.values_list(*fields):
+                names.update(name for name in row if name)
+        todo = sorted(names) if options['force'] else pending(names)
+        self.stdout.write(f'{len(names)} images, {len(todo)} to process')
+        if options['queue']:
+            for name in todo:
+                process_image.enqueue(name=name, force=options['force'], key=f'process_image:{name}')
+            self.stdout.write(f'Queued {len(todo)} tasks')
+            return
+
+        original_bytes = card_bytes = failed = 0
+        for name, source in process_many(todo, jobs=options['jobs'], force=options['force']):
+            if source is None:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'FAILED  {name}'))
+                continue
+            card = source.derivatives.filter(size='card', format='webp').first()
+            original_bytes += source.bytes
+            card_bytes += card.bytes if card else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'OK      {name} {source.width}x{source.height} {source.bytes // 1024} KB'
+                + (f' -> card.webp {card.bytes // 1024} KB' if card else '')
+            ))
+
+        if original_bytes and card_bytes:
+            self.stdout.write(
+                f'Originals {original_bytes // 1024} KB, card WebP renditions {card_bytes // 1024} KB '
+                f'({original_bytes / card_bytes:.0f}x smaller)'
+            )
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} images could not be read'))
@@ -0,0 +1,69 @@
+from collections import Counter
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from imaging import metadata, refcounts
+from imaging.models import SourceImage, StoredFile
+from imaging.storage import is_content_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Store again, without camera metadata, the images saved before originals were stripped, '
+        'and point every row at the clean copy; gc_media then removes the old files'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be stripped without changing anything')
+
+    def handle(self, *args, **options):
+        if not getattr(default_storage, 'content_addressed', False):
+            self.stdout.write(self.style.WARNING('The default storage is not content-addressed; nothing to do'))
+            return
+        tracked = refcounts.tracked_fields()
+        stripped = 0
+        for old in StoredFile.objects.order_by('name').values_list('name', flat=True):
+            if not is_content_name(old):
+                continue
+            try:
+                with default_storage.open(old, 'rb') as file:
+                    if not metadata.is_image(file.read(12)):
+                        continue
+                    file.seek(0)
+                    original = file.read()
+            except OSError as e:
+                self.stdout.write(self.style.ERROR(f'FAILED  {old}: {e}'))
+                continue
+            data = metadata.strip(original)
+            if data is None or data == original:
+                continue  # nothing but the orientation to begin with
+            stripped += 1
+            if options['dry_run']:
+                self.stdout.write(f'Would strip {old}')
+                continue
+            new = default_storage.save(old, ContentFile(data))
+            self._repoint(tracked, old, new, data)
+            self.stdout.write(f'{old} -> {new}')
+
+        verb = 'Would strip' if options['dry_run'] else 'Stripped'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {stripped} images; run gc_media to delete the originals'))
+
+    @transaction.atomic
+    def _repoint(self, tracked, old, new, data):
+        """Move every reference, and the processed image record, from ``old`` to ``new``"""
+        moved = 0
+        for model, fields in tracked.items():
+            for field in fields:
+                moved += model._default_manager.filter(**{field: old}).update(**{field: new})
+        refcounts.adjust(Counter({new: moved}), Counter({old: moved}))
+        source = SourceImage.objects.filter(name=old).first()
+        if source is None:
+            return
+        if SourceImage.objects.filter(name=new).exists():
+            source.delete()
+        else:
+            stored = StoredFile.objects.get(name=new)
+            SourceImage.objects.filter(pk=source.pk).update(name=new, bytes=len(data), sha256=stored.sha256)
@@ -0,0 +1,179 @@
+"""
+Removal of camera metadata from stored originals.
+
+Photos straight from a phone carry EXIF and XMP: GPS position, camera
+serial, capture time, sometimes an embedded thumbnail. ``strip(data)``
+returns the same image without them, or None when there is nothing to
+remove. The pixels are not re-encoded: JPEG segments and PNG and WebP
+chunks are dropped from the byte stream, so stripping loses no quality and
+stripping twice changes nothing. The colour profile is kept, and so is
+the EXIF orientation (re-added as the only tag), since the image would
+otherwise be shown on its side. Images appended after a JPEG's end
+(multi-picture depth maps and previews) are dropped too. GIFs carry no
+EXIF and are left alone.
+"""
+import io
+import struct
+import zlib
+
+from PIL import Image
+
+
+ORIENTATION_TAG = 0x0112
+EXIF_HEADER = b'Exif\x00\x00'
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_SOS, JPEG_EOI = 0xDA, 0xD9
+# APP1 (EXIF, XMP), APP13 (IPTC) and comments
+JPEG_DROPPED = {0xE1, 0xED, 0xFE}
+JPEG_MPF = b'MPF\x00'  # APP2 index of the appended images
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_DROPPED = {b'eXIf', b'tEXt', b'zTXt', b'iTXt'}
+
+WEBP_DROPPED = {b'EXIF', b'XMP '}
+WEBP_EXIF_FLAG, WEBP_XMP_FLAG = 0x08, 0x04
+
+
+def _orientation_exif(data):
+    """TIFF bytes of an EXIF block holding only the orientation of ``data``, or None if upright"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            orientation = image.getexif().get(ORIENTATION_TAG)
+    except (OSError, Image.DecompressionBombError):
+        return None
+    if not orientation or orientation == 1:
+        return None
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    return exif.tobytes()[len(EXIF_HEADER):]
+
+
+def _jpeg_end(data, position):
+    """Offset just past the EOI marker of the image whose first scan header is at ``position``"""
+    while True:
+        # Skip the segment (scan header or tables between progressive scans)
+        position += 2 + struct.unpack('>H', data[position + 2:position + 4])[0]
+        # then the entropy-coded data up to the next real marker
+        while True:
+            position = data.find(b'\xff', position)
+            if position < 0 or position + 1 >= len(data):
+                return len(data)
+            marker = data[position + 1]
+            if marker == JPEG_EOI:
+                return position + 2
+            if marker == 0x00 or 0xD0 <= marker <= 0xD7:
+                position += 2  # stuffed byte or restart marker
+            elif marker == 0xFF:
+                position += 1  # fill byte
+            else:
+                break
+
+
+def strip_jpeg(data):
+    """JPEG ``data`` without APP1/APP13/COM segments or appended images, or None if it had none"""
+    segments = [JPEG_SOI]
+    removed = False
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None  # not a well-formed header; leave the file alone
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == JPEG_SOS:
+            end = _jpeg_end(data, position)
+            segments.append(data[position:end])
+            removed = removed or end < len(data)
+            break
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        segment = data[position:position + 2 + length]
+        if marker in JPEG_DROPPED or (marker == 0xE2 and segment[4:8] == JPEG_MPF):
+            removed = True
+        else:
+            segments.append(segment)
+        position += 2 + length
+    else:
+        return None
+    if not removed:
+        return None
+    orientation = _orientation_exif(data)
+    if orientation:
+        payload = EXIF_HEADER + orientation
+        # Straight after SOI and JFIF's APP0, where readers look for it
+        index = 2 if len(segments) > 1 and segments[1][1] == 0xE0 else 1
+        segments.insert(index, b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload)
+    return b''.join(segments)
+
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+
+def strip_png(data):
+    """PNG ``data`` without EXIF and text chunks, or None if it had none"""
+    chunks = [PNG_SIGNATURE]
+    removed = False
+    orientation = None
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length = struct.unpack('>I', data[position:position + 4])[0]
+        kind = data[position + 4:position + 8]
+        end = position + 12 + length
+        if kind in PNG_DROPPED:
+            if not removed:
+                removed = True
+                orientation = _orientation_exif(data)
+        else:
+            if kind == b'IDAT' and orientation:
+                chunks.append(_png_chunk(b'eXIf', orientation))
+                orientation = None
+            chunks.append(data[position:end])
+        position = end
+    if not removed:
+        return None
+    return b''.join(chunks)
+
+
+def strip_webp(data):
+    """WebP ``data`` without EXIF and XMP chunks, or None if it had none"""
+    chunks = []
+    removed = False
+    position = 12
+    while position + 8 <= len(data):
+        kind = data[position:position + 4]
+        length = struct.unpack('<I', data[position + 4:position + 8])[0]
+        end = position + 8 + length + (length & 1)
+        if kind in WEBP_DROPPED:
+            removed = True
+        else:
+            chunks.append(data[position:end])
+        position = end
+    if not removed:
+        return None
+    orientation = _orientation_exif(data)
+    if orientation:
+        chunks.append(b'EXIF' + struct.pack('<I', len(orientation)) + orientation + b'\x00' * (len(orientation) & 1))
+    for index, chunk in enumerate(chunks):
+        if chunk.startswith(b'VP8X'):
+            flags = chunk[8] & ~(WEBP_EXIF_FLAG | WEBP_XMP_FLAG) | (WEBP_EXIF_FLAG if orientation else 0)
+            chunks[index] = chunk[:8] + bytes([flags]) + chunk[9:]
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def strip(data):
+    """``data`` without camera metadata, or None if it has none (or is not a JPEG, PNG or WebP)"""
+    if data.startswith(JPEG_SOI):
+        return strip_jpeg(data)
+    if data.startswith(PNG_SIGNATURE):
+        return strip_png(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return strip_webp(data)
+    return None
+
+
+def is_image(head):
+    """Whether the first bytes ``head`` of a file are those of an image ``strip()`` handles"""
+    return head.startswith((JPEG_SOI, PNG_SIGNATURE)) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
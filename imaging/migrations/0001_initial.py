@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name of the original upload', max_length=255, unique=True)),
+                ('width', models.PositiveIntegerField(help_text='Width as displayed, after EXIF rotation')),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('bytes', models.PositiveBigIntegerField()),
+                ('processed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Source Image',
+                'verbose_name_plural': 'Source Images',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(help_text='Key of IMAGE_DERIVATIVE_SIZES, e.g. thumb', max_length=10)),
+                ('format', models.CharField(help_text='webp or jpeg', max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('bytes', models.PositiveIntegerField()),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='imaging.sourceimage')),
+            ],
+            options={
+                'verbose_name': 'Image Derivative',
+                'verbose_name_plural': 'Image Derivatives',
+                'constraints': [models.UniqueConstraint(fields=('source', 'size', 'format'), name='unique_image_derivative')],
+            },
+        ),
+    ]
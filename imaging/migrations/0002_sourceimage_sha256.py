@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imaging', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourceimage',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, help_text='Content hash, to spot re-uploads', max_length=64),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imaging', '0002_sourceimage_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refs', models.PositiveIntegerField(default=0, help_text='File fields currently holding this file')),
+                ('last_saved', models.DateTimeField(default=django.utils.timezone.now, help_text='Last upload of this content; gc_media spares recent files')),
+            ],
+            options={
+                'verbose_name': 'Stored File',
+                'verbose_name_plural': 'Stored Files',
+                'indexes': [models.Index(fields=['refs', 'last_saved'], name='storedfile_gc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imaging', '0003_storedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(max_length=32, unique=True)),
+                ('received', models.PositiveBigIntegerField(blank=True, help_text='Request bytes read so far', null=True)),
+                ('total', models.PositiveBigIntegerField(blank=True, help_text='Request body size', null=True)),
+                ('complete', models.BooleanField(default=False, help_text='The request has been read and its files attached')),
+                ('files', models.JSONField(blank=True, default=list, help_text='Per-file results of the upload')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Upload Batch',
+                'verbose_name_plural': 'Upload Batches',
+            },
+        ),
+    ]
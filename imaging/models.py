@@ -0,0 +1,81 @@
+from django.db import models
+from django.utils import timezone
+
+
+class SourceImage(models.Model):
+    """An uploaded original whose derivatives have been generated"""
+
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name of the original upload")
+    width = models.PositiveIntegerField(help_text="Width as displayed, after EXIF rotation")
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    bytes = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, help_text="Content hash, to spot re-uploads")
+    processed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Source Image"
+        verbose_name_plural = "Source Images"
+
+    def __str__(self):
+        return self.name
+
+
+class StoredFile(models.Model):
+    """A content-addressed media file (imaging.storage) and how many model fields refer to it"""
+
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    refs = models.PositiveIntegerField(default=0, help_text="File fields currently holding this file")
+    last_saved = models.DateTimeField(default=timezone.now, help_text="Last upload of this content; gc_media spares recent files")
+
+    class Meta:
+        verbose_name = "Stored File"
+        verbose_name_plural = "Stored Files"
+        indexes = [
+            models.Index(fields=['refs', 'last_saved'], name='storedfile_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
+
+class UploadBatch(models.Model):
+    """Progress of one bulk upload (imaging.uploads), kept in the database so every web process sees it"""
+
+    batch = models.CharField(max_length=32, unique=True)
+    received = models.PositiveBigIntegerField(null=True, blank=True, help_text="Request bytes read so far")
+    total = models.PositiveBigIntegerField(null=True, blank=True, help_text="Request body size")
+    complete = models.BooleanField(default=False, help_text="The request has been read and its files attached")
+    files = models.JSONField(default=list, blank=True, help_text="Per-file results of the upload")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Upload Batch"
+        verbose_name_plural = "Upload Batches"
+
+    def __str__(self):
+        return self.batch
+
+
+class ImageDerivative(models.Model):
+    """One resized, EXIF-free rendition of a source image"""
+
+    source = models.ForeignKey(SourceImage, on_delete=models.CASCADE, related_name='derivatives')
+    size = models.CharField(max_length=10, help_text="Key of IMAGE_DERIVATIVE_SIZES, e.g. thumb")
+    format = models.CharField(max_length=10, help_text="webp or jpeg")
+    file = models.FileField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bytes = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Image Derivative"
+        verbose_name_plural = "Image Derivatives"
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'size', 'format'], name='unique_image_derivative'),
+        ]
+
+    def __str__(self):
+        return f"{self.source.name} ({self.size}, {self.format})"
@@ -0,0 +1,239 @@
+"""
+Image derivative pipeline.
+
+Uploaded photos are multi-megabyte camera originals. For every image field
+listed in ``IMAGE_FIELDS``, ``process()`` decodes the original once and
+writes fixed-width renditions (``IMAGE_DERIVATIVE_SIZES``: thumb, card,
+full) in WebP and JPEG, named under ``derivatives/``; the content-addressed
+storage files them by hash instead. The original is never enlarged.
+Renditions are rotated according to the EXIF orientation and then written
+without any EXIF (camera model, GPS position). The colour profile is kept.
+Source and rendition dimensions are recorded in ``SourceImage`` and
+``ImageDerivative``, so pages can set width/height and pick a size without
+opening files.
+
+The original itself was stripped of its metadata when it was stored (see
+``imaging.metadata``), apart from the orientation these renditions need.
+``process_many()`` renders a batch in a pool of ``IMAGE_PROCESS_JOBS``
+processes. Pool processes are started by a fork server (spawned where
+there is none), never forked from the caller: the task worker is
+multithreaded, and a forked child can inherit a lock another thread was
+holding.
+"""
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import PurePosixPath
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import ImageDerivative, SourceImage
+
+
+# Model label -> image fields with derivatives
+IMAGE_FIELDS = {
+    'events.Venue': ['photo1', 'photo2', 'photo3', 'photo4', 'photo5', 'photo6'],
+    'events.EventClass': ['photo1', 'photo2'],
+    'manage_suites.SuitePhoto': ['image'],
+    'entitypool.Individuals': ['photo'],
+    'entitypool.Organizations': ['logo'],
+}
+
+DERIVATIVE_DIR = 'derivatives'
+FORMATS = {
+    # format: (Pillow format, file extension)
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+ORIENTATION_TAG = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}  # EXIF orientations that swap width and height
+
+
+def derivative_sizes():
+    """{size: width in pixels}, widest first"""
+    sizes = getattr(settings, 'IMAGE_DERIVATIVE_SIZES', {'thumb': 320, 'card': 800, 'full': 1920})
+    return dict(sorted(sizes.items(), key=lambda item: -item[1]))
+
+
+def derivative_name(name, size, fmt):
+    """``venues/IMG_0269.jpg`` -> ``derivatives/venues/IMG_0269.jpg.card.webp``"""
+    return str(PurePosixPath(DERIVATIVE_DIR) / f'{name}.{size}.{FORMATS[fmt][1]}')
+
+
+def _flatten(image, fmt):
+    """``image`` in a mode the format can store; JPEG has no alpha, so transparency goes on white"""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        image = image.convert('RGBA')
+        if fmt == 'webp':
+            return image
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def encode(image, fmt, icc_profile=None):
+    """Bytes of ``image`` in ``fmt``, without EXIF"""
+    buffer = io.BytesIO()
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if fmt == 'webp':
+        image.save(buffer, FORMATS[fmt][0], quality=getattr(settings, 'IMAGE_WEBP_QUALITY', 80), method=4, **options)
+    else:
+        image.save(
+            buffer, FORMATS[fmt][0], quality=getattr(settings, 'IMAGE_JPEG_QUALITY', 82),
+            optimize=True, progressive=True, **options,
+        )
+    return buffer.getvalue()
+
+
+def render(file, sizes):
+    """Decode ``file`` once; the source's (width, height, format) and a list of (size, format, width, height, bytes)"""
+    image = Image.open(file)
+    source_format = image.format or ''
+    width, height = image.size
+    if image.getexif().get(ORIENTATION_TAG) in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    widest = max(sizes.values())
+    # Let the JPEG decoder scale down by a power of two while decoding; the
+    # square box keeps both sides at least as large as the widest rendition
+    image.draft('RGB', (widest, widest))
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    renditions = []
+    for size, target in sizes.items():
+        if image.width > target:
+            image = image.resize(
+                (target, max(1, round(image.height * target / image.width))),
+                Image.Resampling.LANCZOS, reducing_gap=3.0,
+            )
+        for fmt in FORMATS:
+            renditions.append((size, fmt, image.width, image.height, encode(_flatten(image, fmt), fmt, icc_profile)))
+    return (width, height, source_format), renditions
+
+
+def _pool_context():
+    """Start method for the render pool: forkserver on POSIX, spawn elsewhere"""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def _render_bytes(data, sizes):
+    """render() for an original held in memory; runs in the process pool"""
+    return render(io.BytesIO(data), sizes)
+
+
+def _replace(name, data):
+    """Write ``data`` to storage at exactly ``name``, or at its content address"""
+    if not getattr(default_storage, 'content_addressed', False) and default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(data))
+
+
+def _read(name):
+    with default_storage.open(name, 'rb') as file:
+        return file.read()
+
+
+def _record(name, data, rendered):
+    """Store rendered derivatives of ``name`` (original bytes ``data``) and record them"""
+    (width, height, source_format), renditions = rendered
+    files = [
+        (size, fmt, w, h, len(encoded), _replace(derivative_name(name, size, fmt), encoded))
+        for size, fmt, w, h, encoded in renditions
+    ]
+    with transaction.atomic():
+        source, _ = SourceImage.objects.update_or_create(name=name, defaults={
+            'width': width, 'height': height, 'format': source_format, 'bytes': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        })
+        for size, fmt, w, h, length, stored in files:
+            ImageDerivative.objects.update_or_create(source=source, size=size, format=fmt, defaults={
+                'file': stored, 'width': w, 'height': h, 'bytes': length,
+            })
+    return source
+
+
+def process(name, force=False):
+    """Generate and record the derivatives of the stored image ``name``; returns its SourceImage or None"""
+    if not name:
+        return None
+    if not force:
+        existing = SourceImage.objects.filter(name=name).first()
+        if existing is not None:
+            return existing
+    try:
+        data = _read(name)
+        rendered = _render_bytes(data, derivative_sizes())
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Image processing error for {name}: {e}")
+        return None
+    return _record(name, data, rendered)
+
+
+def process_many(names, jobs=None, force=False):
+    """process() each of ``names``, rendering up to ``jobs`` at once in a process pool; yields (name, SourceImage or None)"""
+    jobs = jobs or getattr(settings, 'IMAGE_PROCESS_JOBS', 1)
+    names = [name for name in dict.fromkeys(names) if name]
+    if not force:
+        done = {source.name: source for source in SourceImage.objects.filter(name__in=names)}
+        for name in names:
+            if name in done:
+                yield name, done[name]
+        names = [name for name in names if name not in done]
+    if jobs <= 1 or len(names) <= 1:
+        for name in names:
+            yield name, process(name, force=True)
+        return
+
+    sizes = derivative_sizes()
+    todo = iter(names)
+    running = {}
+    # Pool processes start fresh, so each one sets Django up before rendering
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(), initializer=django.setup) as pool:
+        while True:
+            # Read ahead just enough to keep every process busy, not the whole batch
+            while len(running) < jobs * 2:
+                name = next(todo, None)
+                if name is None:
+                    break
+                try:
+                    data = _read(name)
+                except OSError as e:
+                    print(f"Image processing error for {name}: {e}")
+                    yield name, None
+                    continue
+                running[pool.submit(_render_bytes, data, sizes)] = (name, data)
+            if not running:
+                return
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, data = running.pop(future)
+                try:
+                    rendered = future.result()
+                except (OSError, Image.DecompressionBombError) as e:
+                    print(f"Image processing error for {name}: {e}")
+                    yield name, None
+                    continue
+                yield name, _record(name, data, rendered)
+
+
+def field_names(instance):
+    """Storage names currently held by ``instance``'s registered image fields"""
+    fields = IMAGE_FIELDS.get(instance._meta.label, ())
+    return [getattr(instance, field).name for field in fields if getattr(instance, field)]
+
+
+def pending(names):
+    """Those of ``names`` that have no derivatives yet"""
+    names = set(names)
+    if not names:
+        return []
+    done = set(SourceImage.objects.filter(name__in=names).values_list('name', flat=True))
+    return sorted(names - done)
@@ -0,0 +1,90 @@
+"""
+Reference counts for content-addressed media (imaging.storage).
+
+Each file field of each row holding a content-addressed file counts as one
+reference to it in ``StoredFile.refs``. Saves and deletes of models with
+file fields adjust the counts as they happen. Bulk updates and fixture
+loads send no signals and can leave the counts off, so
+``count_references()`` recomputes them from the rows themselves, and
+``manage.py gc_media`` uses that before deleting anything.
+"""
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.db.models import F, FileField
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import StoredFile
+from .storage import is_content_name
+
+
+def tracked_fields():
+    """{model: [file field names]} for every model storing files in the content-addressed storage"""
+    tracked = {}
+    for model in apps.get_models():
+        fields = [
+            field.name for field in model._meta.concrete_fields
+            if isinstance(field, FileField) and getattr(field.storage, 'content_addressed', False)
+        ]
+        if fields:
+            tracked[model] = fields
+    return tracked
+
+
+def _references(names):
+    return Counter(name for name in names if is_content_name(name))
+
+
+def _by_count(counter):
+    """{count: [names]}, so names changing by the same amount share one UPDATE"""
+    groups = defaultdict(list)
+    for name, count in counter.items():
+        groups[count].append(name)
+    return groups
+
+
+def adjust(added, removed):
+    """Apply Counters of content names gained and lost to StoredFile.refs"""
+    for count, names in _by_count(added - removed).items():
+        StoredFile.objects.filter(name__in=names).update(refs=F('refs') + count)
+    for count, names in _by_count(removed - added).items():
+        StoredFile.objects.filter(name__in=names).update(refs=Greatest(F('refs') - count, 0))
+
+
+def count_references():
+    """Counter of references to every content-addressed file, from a scan of all tracked rows"""
+    counts = Counter()
+    for model, fields in tracked_fields().items():
+        for row in model._default_manager.values_list(*fields):
+            counts.update(_references(row))
+    return counts
+
+
+def connect():
+    """Keep StoredFile.refs current for every tracked model"""
+    for model, fields in tracked_fields().items():
+        def before_save(sender, instance, raw=False, update_fields=None, fields=fields, **kwargs):
+            """Remember the files the row held before this save"""
+            if raw or (update_fields is not None and not set(fields) & set(update_fields)):
+                return
+            if instance._state.adding:
+                instance._media_references = Counter()
+                return
+            before = sender._default_manager.filter(pk=instance.pk).values_list(*fields).first()
+            instance._media_references = _references(before or ())
+
+        def after_save(sender, instance, fields=fields, **kwargs):
+            before = instance.__dict__.pop('_media_references', None)
+            if before is None:
+                # Fixture load, or a save that left the file fields alone
+                return
+            adjust(_references(getattr(instance, field).name for field in fields), before)
+
+        def after_delete(sender, instance, fields=fields, **kwargs):
+            adjust(Counter(), _references(getattr(instance, field).name for field in fields))
+
+        uid = f'refcounts-{model._meta.label_lower}'
+        pre_save.connect(before_save, sender=model, weak=False, dispatch_uid=uid)
+        post_save.connect(after_save, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(after_delete, sender=model, weak=False, dispatch_uid=uid)
@@ -0,0 +1,75 @@
+"""
+Lookups from stored image names to their derivatives, for APIs and templates.
+
+``lookup(names)`` fetches every requested image with its renditions in two
+queries. ``describe(name, found)`` turns one into the JSON shape the APIs
+return::
+
+    {
+        "original": "/media/venues/IMG_0269.jpg",
+        "width": 4032, "height": 3024,
+        "sizes": {"thumb": {"width": 320, "height": 240, "webp": "...", "jpeg": "..."}, ...},
+        "srcset": {"webp": "... 320w, ... 800w, ...", "jpeg": "..."}
+    }
+
+An image whose derivatives are not ready yet has only ``original`` set.
+``picture_html()`` renders the same data as a ``<picture>`` element (see
+the ``{% picture %}`` tag in ``imaging.templatetags.imaging``).
+"""
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from .models import SourceImage
+
+
+def lookup(names):
+    """{name: SourceImage with derivatives prefetched} for the processed ones among ``names``"""
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    sources = SourceImage.objects.filter(name__in=names).prefetch_related('derivatives')
+    return {source.name: source for source in sources}
+
+
+def describe(name, found):
+    """JSON-ready renditions of the stored image ``name``, or None for an empty field"""
+    if not name:
+        return None
+    data = {'original': default_storage.url(name), 'width': None, 'height': None, 'sizes': {}, 'srcset': {}}
+    source = found.get(name)
+    if source is None:
+        return data
+    data['width'], data['height'] = source.width, source.height
+    srcset = {}
+    for derivative in sorted(source.derivatives.all(), key=lambda d: d.width):
+        size = data['sizes'].setdefault(derivative.size, {'width': derivative.width, 'height': derivative.height})
+        size[derivative.format] = derivative.file.url
+        srcset.setdefault(derivative.format, []).append(f'{derivative.file.url} {derivative.width}w')
+    data['srcset'] = {fmt: ', '.join(entries) for fmt, entries in srcset.items()}
+    return data
+
+
+def describe_all(names):
+    """describe() for each of ``names`` that is set, in order"""
+    found = lookup(names)
+    return [describe(name, found) for name in names if name]
+
+
+def picture_html(field, size='card', alt='', sizes=None, css_class='', found=None):
+    """<picture> for an image field or name: WebP with JPEG fallback at ``size``, srcset for the others"""
+    name = getattr(field, 'name', field)
+    photo = describe(name, lookup([name]) if found is None else found)
+    if photo is None:
+        return ''
+    chosen = photo['sizes'].get(size)
+    if chosen is None:
+        # Not processed yet: fall back to the original
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">', photo['original'], alt, css_class)
+    sizes = sizes or f"{chosen['width']}px"
+    webp = photo['srcset'].get('webp')
+    source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        source, chosen['jpeg'], photo['srcset'].get('jpeg', ''), sizes,
+        chosen['width'], chosen['height'], alt, css_class,
+    )
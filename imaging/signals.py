@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.db.models.signals import post_save
+
+from .pipeline import IMAGE_FIELDS, field_names, pending
+from .tasks import process_image
+
+
+def generate_derivatives(sender, instance, raw=False, **kwargs):
+    """Queue newly uploaded images for rendering by the task worker"""
+    # Bulk uploads queue their whole batch at once (imaging.uploads)
+    if raw or getattr(instance, '_imaging_batch', False):
+        return
+    for name in pending(field_names(instance)):
+        process_image.enqueue(name=name, key=f'process_image:{name}')
+
+
+for label in IMAGE_FIELDS:
+    post_save.connect(generate_derivatives, sender=apps.get_model(label), dispatch_uid=f'imaging-{label}')
@@ -0,0 +1,107 @@
+"""
+Content-addressed media storage.
+
+``ContentAddressedStorage`` is the default storage (see STORAGES). It files
+every upload under the SHA-256 of its bytes, e.g.
+``content/3f/3fa4...c2.jpg``, whatever name and ``upload_to`` it was saved
+with. The same photo used by a suite, a venue and an event class is
+therefore stored once. Images lose their camera metadata (GPS position
+and the like, see ``imaging.metadata``) before they are hashed, so no
+stored original gives away where it was taken. A stored file never
+changes, so it can be served with far-future immutable caching
+(``imaging.views.serve_media``).
+
+Each stored file has a StoredFile row. Its reference count is kept by
+``imaging.refcounts``, and ``manage.py gc_media`` removes files that
+nothing refers to any more. ``delete()`` leaves content-addressed files
+alone, because other rows may share them. Files saved before this
+storage was introduced keep their names and behave as before.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from . import metadata
+
+
+CONTENT_DIR = 'content'
+CONTENT_NAME = re.compile(rf'^{CONTENT_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.[a-z0-9]{{1,10}})?$')
+EXTENSION = re.compile(r'\.([A-Za-z0-9]{1,10})$')
+
+
+def content_name(digest, name):
+    """Storage name for content with SHA-256 ``digest``, keeping the extension of ``name``"""
+    match = EXTENSION.search(name)
+    extension = f'.{match[1].lower()}' if match else ''
+    return f'{CONTENT_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def is_content_name(name):
+    """Whether ``name`` is a content-addressed file"""
+    return bool(name) and CONTENT_NAME.match(name) is not None
+
+
+def file_hash(content):
+    """SHA-256 of a Django File; uploads streamed by imaging.uploads carry it already"""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+def without_metadata(content):
+    """``content``, or a copy without camera metadata if it is an image that has some"""
+    if getattr(content, 'metadata_stripped', False):
+        return content
+    content.seek(0)
+    head = content.read(12)
+    content.seek(0)
+    if not metadata.is_image(head):
+        return content
+    stripped = metadata.strip(content.read())
+    content.seek(0)
+    return content if stripped is None else ContentFile(stripped)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their content and stores each content once"""
+
+    content_addressed = True
+
+    def get_available_name(self, name, max_length=None):
+        # The name is derived from the content in _save(), so a taken name is the same file
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredFile
+
+        content = without_metadata(content)
+        digest = file_hash(content)
+        name = content_name(digest, name)
+        # Mark the file as in use before looking for it, so gc_media cannot
+        # remove it between the check and the reference being saved
+        if not StoredFile.objects.filter(name=name).update(last_saved=timezone.now()):
+            StoredFile.objects.get_or_create(name=name, defaults={'sha256': digest, 'size': content.size})
+        if not self.exists(name):
+            # Write beside the final name, then rename, so readers never see a partial file
+            staging = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+            os.replace(self.path(staging), self.path(name))
+        return name
+
+    def delete(self, name):
+        if is_content_name(name):
+            return
+        super().delete(name)
+
+    def remove(self, name):
+        """Really delete the content-addressed file ``name``; only gc_media should call this"""
+        super().delete(name)
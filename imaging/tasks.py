@@ -0,0 +1,16 @@
+from taskqueue.queue import task
+
+from .pipeline import process, process_many
+
+
+@task(priority=5)
+def process_image(name, force=False):
+    """Generate the derivatives of the stored image ``name``"""
+    process(name, force=force)
+
+
+@task(priority=5)
+def process_batch(names):
+    """Generate the derivatives of a batch of uploads in a process pool"""
+    for _ in process_many(names):
+        pass
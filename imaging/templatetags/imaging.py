@@ -0,0 +1,12 @@
+from django import template
+
+from ..renditions import picture_html
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(field, size='card', alt='', sizes=None, css_class=''):
+    """{% picture venue.photo1 'card' alt=venue.venue sizes='(max-width: 600px) 100vw, 800px' %}"""
+    return picture_html(field, size, alt, sizes, css_class)
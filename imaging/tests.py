@@ -0,0 +1,286 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image, ImageCms
+
+from events.models import Venue
+
+from . import metadata, pipeline, refcounts, uploads
+from .models import SourceImage, StoredFile, UploadBatch
+
+
+SIZES = {'thumb': 16, 'card': 32}
+
+
+def jpeg(color='red', size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+GPS_IFD = 0x8825
+MODEL_TAG = 0x0110
+
+
+def camera_image(fmt='JPEG', orientation=6, size=(64, 48), **options):
+    """An image with the GPS position and camera model a phone records, taken on its side"""
+    exif = Image.Exif()
+    exif[MODEL_TAG] = 'Phone 12'
+    exif[pipeline.ORIENTATION_TAG] = orientation
+    exif.get_ifd(GPS_IFD).update({1: 'N', 2: (52.0, 22.0, 0.0), 3: 'E', 4: (4.0, 53.0, 0.0)})
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, fmt, exif=exif, **options)
+    return buffer.getvalue()
+
+
+def exif_of(data):
+    with Image.open(io.BytesIO(data)) as image:
+        exif = image.getexif()
+        return dict(exif), dict(exif.get_ifd(GPS_IFD))
+
+
+class MediaTestCase(TestCase):
+    """Runs with MEDIA_ROOT and the upload directory in a scratch directory"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=directory, IMAGE_UPLOAD_TEMP_DIR=f'{directory}/incoming', IMAGE_DERIVATIVE_SIZES=SIZES,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class UploadProgressTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venue = Venue.objects.create(venue='Hall', address='1 Main St')
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        self.batch = 'ab' * 16
+
+    def upload(self, *files):
+        return self.client.post(f'/imaging/api/uploads/?batch={self.batch}', {f'venue:{self.venue.pk}': list(files)})
+
+    def test_progress_is_shared_through_the_database(self):
+        uploads._set_progress(self.batch, {'received': 1024, 'total': 4096, 'complete': False, 'files': []})
+        cache.clear()
+        self.assertEqual(uploads.progress(self.batch)['received'], 1024)
+        UploadBatch.objects.update(updated_at=timezone.now() - timedelta(seconds=uploads.PROGRESS_TTL + 1))
+        self.assertIsNone(uploads.progress(self.batch))
+        self.assertEqual(uploads.purge_progress(), 1)
+
+    def test_files_move_from_processing_to_ready(self):
+        response = self.upload(SimpleUploadedFile('a.jpg', jpeg('red')), SimpleUploadedFile('b.jpg', jpeg('red')))
+        self.assertEqual(response.status_code, 200)
+        files = response.json()['files']
+        self.assertEqual([(f['status'], f['duplicate']) for f in files], [('processing', False), ('processing', True)])
+
+        progress = self.client.get(f'/imaging/api/uploads/{self.batch}/').json()
+        self.assertEqual(progress['ready'], 0)
+        pipeline.process(files[0]['name'])
+        progress = self.client.get(f'/imaging/api/uploads/{self.batch}/').json()
+        self.assertEqual(progress['ready'], 2)
+
+    def test_uploads_are_stripped_before_they_are_hashed(self):
+        response = self.upload(SimpleUploadedFile('a.jpg', camera_image()))
+        result = response.json()['files'][0]
+        stored = default_storage.open(result['name']).read()
+        self.assertEqual(exif_of(stored), ({pipeline.ORIENTATION_TAG: 6}, {}))
+        self.assertEqual((result['sha256'], result['bytes']), (hashlib.sha256(stored).hexdigest(), len(stored)))
+
+    def test_unknown_batch_is_not_found(self):
+        self.assertEqual(self.client.get(f'/imaging/api/uploads/{"cd" * 16}/').status_code, 404)
+
+    @override_settings(DATA_UPLOAD_MAX_NUMBER_FILES=1)
+    def test_too_many_files_is_a_clear_error(self):
+        response = self.upload(SimpleUploadedFile('a.jpg', jpeg('red')), SimpleUploadedFile('b.jpg', jpeg('blue')))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 1 files', response.json()['error'])
+        self.assertFalse(Venue.objects.get(pk=self.venue.pk).photo1)
+
+
+class ProcessManyTests(MediaTestCase):
+    def test_pool_processes_are_not_forked(self):
+        self.assertNotEqual(pipeline._pool_context().get_start_method(), 'fork')
+
+    def test_batch_renders_in_the_pool(self):
+        names = [default_storage.save(f'{color}.jpg', ContentFile(jpeg(color))) for color in ('red', 'green', 'blue')]
+        results = dict(pipeline.process_many(names + ['missing.jpg'], jobs=2))
+        self.assertIsNone(results.pop('missing.jpg'))
+        self.assertEqual(sorted(results), sorted(names))
+        for source in results.values():
+            self.assertEqual((source.width, source.height), (64, 48))
+            self.assertEqual(source.derivatives.count(), len(SIZES) * len(pipeline.FORMATS))
+        self.assertEqual(SourceImage.objects.count(), 3)
+
+
+class StoredMediaTestCase(MediaTestCase):
+    def venue(self, name, color='red'):
+        venue = Venue(venue=name, address='1 Main St')
+        venue.photo1.save(f'{name}.jpg', ContentFile(jpeg(color)), save=False)
+        venue.save()
+        return venue
+
+    def refs(self, venue):
+        return StoredFile.objects.get(name=venue.photo1.name).refs
+
+
+class RefcountTests(StoredMediaTestCase):
+    def test_each_field_holding_the_content_is_a_reference(self):
+        hall = self.venue('Hall')
+        nook = self.venue('Nook')
+        self.assertEqual(hall.photo1.name, nook.photo1.name)
+        self.assertEqual(StoredFile.objects.count(), 1)
+        self.assertEqual(self.refs(hall), 2)
+        hall.photo2 = hall.photo1.name
+        hall.save()
+        self.assertEqual(self.refs(hall), 3)
+        nook.delete()
+        self.assertEqual(self.refs(hall), 2)
+
+    def test_replacing_a_photo_moves_the_reference(self):
+        hall = self.venue('Hall')
+        old = hall.photo1.name
+        hall.photo1.save('new.jpg', ContentFile(jpeg('blue')))
+        self.assertEqual(StoredFile.objects.get(name=old).refs, 0)
+        self.assertEqual(self.refs(hall), 1)
+        # Saves that leave the file fields alone change nothing
+        hall.address = '2 Main St'
+        hall.save(update_fields=['address'])
+        self.assertEqual(self.refs(hall), 1)
+
+    def test_adjust_never_goes_below_zero(self):
+        hall = self.venue('Hall')
+        name = hall.photo1.name
+        refcounts.adjust(Counter(), Counter({name: 5}))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 0)
+        refcounts.adjust(Counter({name: 2, 'venues/legacy.jpg': 1}), Counter())
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
+
+    def test_count_references_sees_bulk_updates(self):
+        hall = self.venue('Hall')
+        Venue.objects.filter(pk=hall.pk).update(photo2=hall.photo1.name, photo3='venues/legacy.jpg')
+        self.assertEqual(refcounts.count_references(), Counter({hall.photo1.name: 2}))
+
+
+class GcMediaTests(StoredMediaTestCase):
+    def gc(self, *args):
+        call_command('gc_media', *args, stdout=io.StringIO())
+
+    def stored(self, color):
+        """A content file nothing refers to, last uploaded two days ago"""
+        name = default_storage.save('orphan.jpg', ContentFile(jpeg(color)))
+        StoredFile.objects.filter(name=name).update(last_saved=timezone.now() - timedelta(days=2))
+        return name
+
+    def test_unreferenced_files_past_the_grace_period_are_deleted(self):
+        hall = self.venue('Hall')
+        orphan = self.stored('green')
+        recent = default_storage.save('recent.jpg', ContentFile(jpeg('blue')))
+        self.gc()
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertFalse(StoredFile.objects.filter(name=orphan).exists())
+        self.assertTrue(default_storage.exists(recent))
+        self.assertTrue(default_storage.exists(hall.photo1.name))
+
+    def test_dry_run_deletes_nothing(self):
+        orphan = self.stored('green')
+        self.gc('--dry-run')
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertTrue(StoredFile.objects.filter(name=orphan).exists())
+
+    def test_counts_are_corrected_before_deleting(self):
+        hall = self.venue('Hall')
+        StoredFile.objects.update(refs=0, last_saved=timezone.now() - timedelta(days=2))
+        self.gc()
+        # The row still holds the file, whatever the stale count said
+        self.assertTrue(default_storage.exists(hall.photo1.name))
+        self.assertEqual(self.refs(hall), 1)
+
+    def test_untracked_files_are_registered(self):
+        hall = self.venue('Hall')
+        StoredFile.objects.all().delete()
+        self.gc()
+        self.assertEqual(self.refs(hall), 1)
+        self.assertTrue(os.path.exists(default_storage.path(hall.photo1.name)))
+
+
+class MetadataTests(MediaTestCase):
+    def test_stripping_keeps_pixels_profile_and_orientation(self):
+        profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        for fmt, options in (('JPEG', {'icc_profile': profile}), ('PNG', {}), ('WEBP', {'lossless': True})):
+            data = camera_image(fmt, **options)
+            stripped = metadata.strip(data)
+            self.assertEqual(exif_of(stripped), ({pipeline.ORIENTATION_TAG: 6}, {}), fmt)
+            with Image.open(io.BytesIO(data)) as before, Image.open(io.BytesIO(stripped)) as after:
+                self.assertEqual(after.tobytes(), before.tobytes(), fmt)
+                self.assertEqual(after.info.get('icc_profile'), before.info.get('icc_profile'), fmt)
+            # A second pass changes nothing
+            self.assertIn(metadata.strip(stripped), (None, stripped), fmt)
+
+    def test_upright_images_lose_all_exif_and_plain_ones_are_left_alone(self):
+        self.assertEqual(exif_of(metadata.strip(camera_image(orientation=1))), ({}, {}))
+        self.assertIsNone(metadata.strip(jpeg()))
+        self.assertIsNone(metadata.strip(b'%PDF-1.4 floor plan'))
+
+    def test_images_appended_to_a_jpeg_are_dropped(self):
+        data = camera_image(progressive=True)
+        stripped = metadata.strip(data + jpeg('blue'))
+        self.assertEqual(stripped, metadata.strip(data))
+
+    def test_stored_original_has_no_gps_and_derivatives_no_exif(self):
+        venue = Venue(venue='Hall', address='1 Main St')
+        venue.photo1.save('IMG_0001.jpg', ContentFile(camera_image()), save=False)
+        venue.save()
+        original = default_storage.open(venue.photo1.name).read()
+        self.assertEqual(exif_of(original), ({pipeline.ORIENTATION_TAG: 6}, {}))
+
+        source = pipeline.process(venue.photo1.name)
+        # Displayed upright: the 64x48 sensor image is 48 wide and 64 high
+        self.assertEqual((source.width, source.height, source.format), (48, 64, 'JPEG'))
+        renditions = {(d.size, d.format): d for d in source.derivatives.all()}
+        self.assertEqual(set(renditions), {(size, fmt) for size in SIZES for fmt in pipeline.FORMATS})
+        expected = {'thumb': (16, 22), 'card': (32, 43)}
+        for (size, fmt), derivative in renditions.items():
+            data = default_storage.open(derivative.file.name).read()
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format, pipeline.FORMATS[fmt][0])
+                self.assertEqual(image.size, expected[size])
+                self.assertEqual(len(image.getexif()), 0)
+            self.assertEqual((derivative.width, derivative.height), expected[size])
+
+    def test_command_restores_images_stored_before_stripping(self):
+        with mock.patch('imaging.storage.metadata.strip', return_value=None):
+            venue = Venue(venue='Hall', address='1 Main St')
+            venue.photo1.save('IMG_0001.jpg', ContentFile(camera_image()), save=False)
+            venue.save()
+        old = venue.photo1.name
+        pipeline.process(old)
+        self.assertTrue(exif_of(default_storage.open(old).read())[1])
+
+        call_command('strip_media_metadata', '--dry-run', stdout=io.StringIO())
+        venue.refresh_from_db()
+        self.assertEqual(venue.photo1.name, old)
+
+        call_command('strip_media_metadata', stdout=io.StringIO())
+        venue.refresh_from_db()
+        new = venue.photo1.name
+        self.assertNotEqual(new, old)
+        self.assertEqual(exif_of(default_storage.open(new).read()), ({pipeline.ORIENTATION_TAG: 6}, {}))
+        self.assertEqual(SourceImage.objects.get().name, new)
+        self.assertEqual((StoredFile.objects.get(name=old).refs, StoredFile.objects.get(name=new).refs), (0, 1))
@@ -0,0 +1,283 @@
+"""
+Bulk photo ingest behind ``POST /imaging/api/uploads/``.
+
+``StreamingUploadHandler`` writes each multipart file straight to
+``IMAGE_UPLOAD_TEMP_DIR`` in upload-handler chunks and hashes it on the way
+in, so the body is never buffered in memory. Each accepted photo then has
+its camera metadata (GPS position and the like) stripped in place, one
+file at a time, and is hashed again. When that directory is on the same
+filesystem as MEDIA_ROOT, storing the photo is a rename. A photo whose
+SHA-256 matches an already processed image reuses that image, and so does
+a second copy within the same request.
+
+Each file part names its target in its field name::
+
+    venue:12         next empty photo slot of Venue 12
+    event_class:3    next empty photo slot of EventClass 3
+    suite:7          a new SuitePhoto for suite 7
+
+The new images are rendered by a single queued ``imaging.process_batch``
+task, which uses a process pool. Pass ``?batch=<id>`` (32 hex digits) to
+follow the batch. ``progress(batch)`` reports the bytes received while
+the body is still arriving, then each file's state: rejected, processing,
+ready or failed, and whether it duplicated a stored image. Progress is kept
+in an ``UploadBatch`` row, so a poll answered by another web process sees
+it too.
+
+A request may carry at most ``DATA_UPLOAD_MAX_NUMBER_FILES`` files; the
+admin page sends larger drops in several batches.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from PIL import Image
+
+from events.models import EventClass, Venue
+from manage_suites.models import SuitePhoto, Suites
+from taskqueue.models import Task
+
+from . import metadata
+from .models import SourceImage, UploadBatch
+from .tasks import process_batch
+
+
+PROGRESS_TTL = 60 * 60  # seconds
+PROGRESS_STEP = 1 << 20  # report received bytes every MB
+BATCH_ID = re.compile(r'^[0-9a-f]{32}$')
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}  # as drag_drop_upload.js
+
+# Target in the field name -> (model, photo fields filled in order)
+SLOT_TARGETS = {
+    'venue': (Venue, ['photo1', 'photo2', 'photo3', 'photo4', 'photo5', 'photo6']),
+    'event_class': (EventClass, ['photo1', 'photo2']),
+}
+TARGET = re.compile(r'^(venue|event_class|suite):(\d+)$')
+
+
+def batch_id(value):
+    """``value`` if it is a valid batch id, else a new one"""
+    return value if value and BATCH_ID.match(value) else uuid.uuid4().hex
+
+
+def _set_progress(batch, data):
+    UploadBatch.objects.update_or_create(batch=batch, defaults=data)
+
+
+def purge_progress():
+    """Forget batches not updated for PROGRESS_TTL seconds"""
+    cutoff = timezone.now() - timedelta(seconds=PROGRESS_TTL)
+    deleted, _ = UploadBatch.objects.filter(updated_at__lt=cutoff).delete()
+    return deleted
+
+
+class StagedUpload(TemporaryUploadedFile):
+    """A temporary upload in IMAGE_UPLOAD_TEMP_DIR that hashes its content as it is written"""
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        directory = Path(getattr(settings, 'IMAGE_UPLOAD_TEMP_DIR', tempfile.gettempdir()))
+        directory.mkdir(parents=True, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + os.path.splitext(name)[1], dir=directory)
+        UploadedFile.__init__(self, file, name, content_type, 0, charset, content_type_extra)
+        self.hash = hashlib.sha256()
+        self.metadata_stripped = False
+
+    def strip_metadata(self):
+        """Drop camera metadata (imaging.metadata) from the file in place, updating its size and hash"""
+        self.file.seek(0)
+        stripped = metadata.strip(self.file.read())
+        if stripped is not None:
+            self.file.seek(0)
+            self.file.write(stripped)
+            self.file.truncate()
+            self.file.flush()
+            self.size = len(stripped)
+            self.sha256 = hashlib.sha256(stripped).hexdigest()
+        self.file.seek(0)
+        self.metadata_stripped = True
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """Stream files to disk, hashing them, skipping oversized ones and publishing progress"""
+
+    def __init__(self, request=None, batch=None):
+        super().__init__(request)
+        self.batch = batch
+        self.limit = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 25 << 20)
+        self.total = None
+        self.received = self.reported = 0
+        self.rejected = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.total = content_length
+        self._report()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUpload(self.file_name, self.content_type, self.charset, self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if start + len(raw_data) > self.limit:
+            self.file.close()
+            self.rejected.append(_result(
+                self.field_name, self.file_name, 'rejected', error=f'Larger than {filesizeformat(self.limit)}',
+            ))
+            raise SkipFile()
+        self.file.write(raw_data)
+        self.file.hash.update(raw_data)
+        if self.received - self.reported >= PROGRESS_STEP:
+            self._report()
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.file.hash.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+    def _report(self):
+        self.reported = self.received
+        if self.batch:
+            _set_progress(self.batch, {'received': self.received, 'total': self.total, 'complete': False, 'files': []})
+
+
+def _result(field, filename, status, name=None, sha256=None, size=None, duplicate=False, error=None):
+    return {
+        'field': field, 'filename': filename, 'status': status, 'name': name,
+        'sha256': sha256, 'bytes': size, 'duplicate': duplicate, 'error': error,
+    }
+
+
+def _check_image(upload):
+    """None if ``upload`` is an accepted image format, else why not"""
+    try:
+        with Image.open(upload.temporary_file_path()) as image:
+            if image.format in ACCEPTED_FORMATS:
+                return None
+            return f'{image.format} images are not accepted'
+    except (OSError, Image.DecompressionBombError):
+        return 'Not an image'
+
+
+def _store(field_file, upload, known):
+    """Save ``upload`` into ``field_file`` unless its content is already stored; returns (name, duplicate)"""
+    digest = upload.sha256
+    if digest in known:
+        field_file.name = known[digest]
+        return known[digest], True
+    field_file.save(upload.name, upload, save=False)
+    known[digest] = field_file.name
+    return field_file.name, False
+
+
+def ingest(files, rejected=(), batch=None):
+    """Attach the uploaded ``files`` (request.FILES) to their targets, queue their rendering and return per-file results"""
+    results = list(rejected)
+    uploads = defaultdict(list)
+    for field, field_uploads in files.lists():
+        for upload in field_uploads:
+            match = TARGET.match(field)
+            error = 'Unknown target' if match is None else _check_image(upload)
+            if error:
+                results.append(_result(field, upload.name, 'rejected', error=error))
+            else:
+                upload.strip_metadata()
+                uploads[(match[1], int(match[2]))].append(upload)
+
+    digests = {upload.sha256 for batch_uploads in uploads.values() for upload in batch_uploads}
+    known = dict(SourceImage.objects.filter(sha256__in=digests).values_list('sha256', 'name'))
+    processed = set(known.values())
+    new_names = []
+    for (target, pk), target_uploads in uploads.items():
+        field = f'{target}:{pk}'
+        with transaction.atomic():
+            if target == 'suite':
+                outcomes = _attach_suite_photos(pk, target_uploads, known)
+            else:
+                outcomes = _fill_slots(target, pk, target_uploads, known)
+        for upload, outcome in zip(target_uploads, outcomes):
+            if isinstance(outcome, str):
+                results.append(_result(field, upload.name, 'rejected', error=outcome))
+                continue
+            name, duplicate = outcome
+            results.append(_result(
+                field, upload.name, 'ready' if name in processed else 'processing',
+                name=name, sha256=upload.sha256, size=upload.size, duplicate=duplicate,
+            ))
+            if not duplicate:
+                new_names.append(name)
+
+    if new_names:
+        process_batch.enqueue(names=new_names, key=f'upload:{batch}' if batch else None)
+    if batch:
+        _set_progress(batch, {'received': None, 'total': None, 'complete': True, 'files': results})
+    purge_progress()
+    return results
+
+
+def _fill_slots(target, pk, uploads, known):
+    """Put ``uploads`` into the empty photo fields of a Venue or EventClass, in order"""
+    model, fields = SLOT_TARGETS[target]
+    instance = model.objects.select_for_update().filter(pk=pk).first()
+    if instance is None:
+        return [f'No {model._meta.verbose_name} {pk}'] * len(uploads)
+    free = [field for field in fields if not getattr(instance, field)]
+    outcomes = []
+    for upload in uploads:
+        if not free:
+            outcomes.append(f'All {len(fields)} photo slots are taken')
+            continue
+        outcomes.append(_store(getattr(instance, free.pop(0)), upload, known))
+    instance._imaging_batch = True
+    instance.save()
+    return outcomes
+
+
+def _attach_suite_photos(pk, uploads, known):
+    """A new SuitePhoto of suite ``pk`` for each of ``uploads``"""
+    if not Suites.objects.filter(pk=pk).exists():
+        return [f'No suite {pk}'] * len(uploads)
+    outcomes = []
+    for upload in uploads:
+        photo = SuitePhoto(suite_id=pk)
+        outcomes.append(_store(photo.image, upload, known))
+        photo._imaging_batch = True
+        photo.save()
+    return outcomes
+
+
+def progress(batch):
+    """Upload and processing state of ``batch``, or None once it is unknown or expired"""
+    cutoff = timezone.now() - timedelta(seconds=PROGRESS_TTL)
+    row = UploadBatch.objects.filter(batch=batch, updated_at__gte=cutoff).first()
+    if row is None:
+        return None
+    data = {'received': row.received, 'total': row.total, 'complete': row.complete, 'files': row.files}
+    if not data['complete']:
+        return data
+    pending = [item['name'] for item in data['files'] if item['status'] == 'processing']
+    if pending:
+        ready = set(SourceImage.objects.filter(name__in=pending).values_list('name', flat=True))
+        # Once the batch task has finished, an image without derivatives could not be read
+        task = Task.objects.filter(key=f'upload:{batch}').order_by('-pk').values_list('status', flat=True).first()
+        finished = task not in Task.PENDING
+        for item in data['files']:
+            if item['status'] == 'processing':
+                item['status'] = 'ready' if item['name'] in ready else 'failed' if finished else 'processing'
+    data['ready'] = sum(item['status'] == 'ready' for item in data['files'])
+    return data
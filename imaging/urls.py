@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('api/uploads/', views.upload_api, name='imaging_upload_api'),
+    path('api/uploads/<str:batch>/', views.upload_progress_api, name='imaging_upload_progress_api'),
+]
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.exceptions import TooManyFilesSent
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views import static
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST
+
+from . import uploads
+from .storage import is_content_name
+
+
+def is_admin(user):
+    """Check if user is admin"""
+    return user.is_authenticated and user.is_staff
+
+
+@csrf_exempt
+@require_POST
+@login_required
+@user_passes_test(is_admin)
+def upload_api(request):
+    """Bulk photo upload, streamed to disk (see imaging/uploads.py); ``?batch=`` names the batch for progress polling"""
+    batch = uploads.batch_id(request.GET.get('batch'))
+    # Upload handlers can only be swapped before anything reads the body, so
+    # the CSRF check, which reads request.POST, runs afterwards
+    handler = uploads.StreamingUploadHandler(request, batch)
+    request.upload_handlers = [handler]
+    try:
+        return _ingest(request, batch, handler)
+    except TooManyFilesSent:
+        limit = settings.DATA_UPLOAD_MAX_NUMBER_FILES
+        return JsonResponse({'success': False, 'error': f'Send at most {limit} files per request'}, status=400)
+
+
+@csrf_protect
+def _ingest(request, batch, handler):
+    results = uploads.ingest(request.FILES, handler.rejected, batch)
+    return JsonResponse({'success': True, 'batch': batch, 'files': results})
+
+
+@require_GET
+@login_required
+@user_passes_test(is_admin)
+def upload_progress_api(request, batch):
+    """Bytes received while the batch uploads, then each file's processing state"""
+    data = uploads.progress(batch)
+    if data is None:
+        return JsonResponse({'error': 'Unknown or expired batch'}, status=404)
+    return JsonResponse({'batch': batch, **data})
+
+
+def serve_media(request, path):
+    """Media files; content-addressed ones never change, so browsers and proxies may keep them for good"""
+    response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code == 200 and is_content_name(path):
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_IMMUTABLE_MAX_AGE', 31536000), immutable=True)
+    return response
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from imaging.renditions import picture_html
 from .models import Suites, SuiteOperatingModels, SuiteContracts, SuitePhoto
 
 
@@ -31,6 +32,10 @@ class SuitePhotoAdmin(admin.ModelAdmin):
     list_display = ['suite', 'caption', 'uploaded_at']
     list_filter = ['uploaded_at', 'suite']
     search_fields = ['suite__suite_number', 'caption']
+    readonly_fields = ['preview']
+    
+    def preview(self, obj):
+        return picture_html(obj.image, 'card', alt=obj.caption) or '-'
 
 
 @admin.register(SuiteOperatingModels)
@@ -0,0 +1,110 @@
+"""
+Suite inventory queries.
+
+``inventory()`` returns one row per suite with its contract count, photo
+count and the id of the contract in force today, all computed in a single
+SQL query so the cost stays flat as the building grows. ``serialize_page()``
+turns a page of those rows into the JSON shape every listing returns: one
+more query fetches the current contracts with their operating models, and
+``attach_photos()`` adds the galleries.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+from imaging.renditions import describe, lookup
+
+from .models import SuiteContracts, SuitePhoto, Suites
+
+
+FEATURE_FIELDS = (
+    'whiteboard', 'filing_cabinet', 'height_adjustible_desk',
+    'office_chairs', 'corner_unit', 'minifridge',
+)
+
+# Columns of the current contract, read with its operating model in one join
+CONTRACT_FIELDS = (
+    'roe_id', 'roe_begin', 'roe_end', 'on_going',
+    'model__model_id', 'model__model_name', 'model__is_shared', 'model__pricepoint', 'model__period',
+)
+
+
+def inventory(day=None):
+    """Values queryset of every suite with its counts and current contract"""
+    day = day or timezone.localdate()
+    active = SuiteContracts.objects.filter(
+        SuiteContracts.active_on(day),
+        suite=OuterRef('pk'),
+    ).order_by('-roe_begin', '-roe_id')
+    return Suites.objects.annotate(
+        contracts_count=Count('suitecontracts', distinct=True),
+        photo_count=Count('suite_photos', distinct=True),
+        active_contract_id=Subquery(active.values('roe_id')[:1]),
+    ).order_by('suite_number', 'suite_id').values(
+        'suite_id', 'suite_number', 'contracts_count', 'photo_count', 'active_contract_id', *FEATURE_FIELDS,
+    )
+
+
+def active_contracts(rows):
+    """{contract id: contract values} for the current contracts of inventory ``rows``, in one query"""
+    ids = {row['active_contract_id'] for row in rows} - {None}
+    if not ids:
+        return {}
+    return {
+        contract['roe_id']: contract
+        for contract in SuiteContracts.objects.filter(roe_id__in=ids).values(*CONTRACT_FIELDS)
+    }
+
+
+def serialize(row, contracts):
+    """JSON-ready dict for one inventory row; ``contracts`` comes from active_contracts()"""
+    active_contract = None
+    contract = contracts.get(row['active_contract_id'])
+    if contract is not None:
+        active_contract = {
+            'id': contract['roe_id'],
+            'begin': contract['roe_begin'].isoformat(),
+            'end': contract['roe_end'].isoformat() if contract['roe_end'] else None,
+            'on_going': contract['on_going'],
+            'model': {
+                'id': contract['model__model_id'],
+                'name': contract['model__model_name'],
+                'is_shared': contract['model__is_shared'],
+                'pricepoint': float(contract['model__pricepoint']),
+                'period': contract['model__period'],
+            },
+        }
+    data = {
+        'id': row['suite_id'],
+        'suite_number': row['suite_number'],
+        'suite_name': f"Suite {row['suite_number']}",
+        'contracts_count': row['contracts_count'],
+        'photo_count': row['photo_count'],
+        'occupied': active_contract is not None,
+        'active_contract': active_contract,
+    }
+    data.update({field: row[field] for field in FEATURE_FIELDS})
+    return data
+
+
+def serialize_page(rows):
+    """Serialized suites, with their current contracts and photos, for a page of inventory rows"""
+    rows = list(rows)
+    contracts = active_contracts(rows)
+    return attach_photos([serialize(row, contracts) for row in rows])
+
+
+def attach_photos(suites):
+    """Add 'photos' (sized renditions with captions) to serialized suites, in three queries"""
+    rows = list(SuitePhoto.objects.filter(
+        suite_id__in=[suite['id'] for suite in suites],
+    ).order_by('uploaded_at', 'id').values('suite_id', 'image', 'caption'))
+    found = lookup(row['image'] for row in rows)
+    photos = defaultdict(list)
+    for row in rows:
+        photo = describe(row['image'], found)
+        if photo is not None:
+            photos[row['suite_id']].append({**photo, 'caption': row['caption']})
+    for suite in suites:
+        suite['photos'] = photos[suite['id']]
+    return suites
@@ -93,6 +93,11 @@ class SuiteContracts(models.Model):
         if self.roe_end and self.roe_begin and self.roe_end <= self.roe_begin:
             raise ValidationError('End date must be after start date.')
     
+    @staticmethod
+    def active_on(day):
+        """Filter for contracts in force on ``day`` (begun, and ongoing or not yet ended)"""
+        return models.Q(roe_begin__lte=day) & (models.Q(on_going=True) | models.Q(roe_end__gte=day))
+    
     def get_entity(self):
         """Return the associated individual or organization"""
         # if self.individual:
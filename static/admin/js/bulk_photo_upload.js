@@ -0,0 +1,139 @@
+// Bulk photo upload for the Venue and Event Class change pages.
+// Dropping several photos sends them in streamed requests of up to
+// BATCH_FILES photos to /imaging/api/uploads/ and shows per-file progress
+// until the resized versions are ready, then reloads the page.
+// Django refuses requests with more than DATA_UPLOAD_MAX_NUMBER_FILES (100) files
+const BATCH_FILES = 50;
+const POLL_RETRIES = 3;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const fieldset = document.querySelector('.drag-drop-upload');
+    const match = window.location.pathname.match(/\/admin\/events\/(venue|eventclass)\/(\d+)\/change\//);
+    if (!fieldset || !match) return;
+
+    const target = (match[1] === 'eventclass' ? 'event_class' : 'venue') + ':' + match[2];
+    const zone = document.createElement('div');
+    zone.className = 'drag-drop-zone bulk-drop-zone';
+    zone.innerHTML = '<div class="drag-drop-icon">🗂️</div>' +
+        '<div class="drag-drop-text">Drop several photos here to upload them into the empty slots now</div>' +
+        '<div class="upload-progress"><div class="upload-progress-bar"></div></div>' +
+        '<ul class="bulk-upload-files"></ul>';
+    fieldset.insertBefore(zone, fieldset.querySelector('.form-row'));
+
+    zone.addEventListener('dragover', (e) => {
+        e.preventDefault();
+        zone.classList.add('drag-over');
+    });
+    zone.addEventListener('dragleave', () => zone.classList.remove('drag-over'));
+    zone.addEventListener('drop', (e) => {
+        e.preventDefault();
+        zone.classList.remove('drag-over');
+        const files = Array.from(e.dataTransfer.files).filter(isValidImageFile);
+        if (files.length > 0) {
+            uploadFiles(zone, target, files);
+        }
+    });
+});
+
+async function uploadFiles(zone, target, files) {
+    const progressBar = zone.querySelector('.upload-progress');
+    const progressFill = zone.querySelector('.upload-progress-bar');
+    progressBar.style.display = 'block';
+
+    const chunks = [];
+    for (let i = 0; i < files.length; i += BATCH_FILES) {
+        chunks.push(files.slice(i, i + BATCH_FILES));
+    }
+    // Batch id -> that batch's per-file results
+    const batches = new Map();
+    for (let i = 0; i < chunks.length; i++) {
+        const waiting = chunks.slice(i).flat().map(file => ({filename: file.name, status: 'uploading'}));
+        showFiles(zone, allFiles(batches).concat(waiting));
+        try {
+            const data = await uploadBatch(target, chunks[i], (share) => {
+                progressFill.style.width = Math.round(100 * (i + share) / chunks.length) + '%';
+            });
+            batches.set(data.batch, data.files);
+        } catch (error) {
+            batches.set('failed-' + i, chunks[i].map(file => ({filename: file.name, status: 'failed', error: error})));
+        }
+    }
+    showFiles(zone, allFiles(batches));
+    pollProgress(zone, batches, 0);
+}
+
+function uploadBatch(target, files, onProgress) {
+    return new Promise((resolve, reject) => {
+        const batch = Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+        const form = new FormData();
+        files.forEach(file => form.append(target, file));
+
+        const xhr = new XMLHttpRequest();
+        xhr.open('POST', '/imaging/api/uploads/?batch=' + batch);
+        xhr.setRequestHeader('X-CSRFToken', document.querySelector('[name=csrfmiddlewaretoken]').value);
+        xhr.upload.addEventListener('progress', (e) => {
+            if (e.lengthComputable) {
+                onProgress(e.loaded / e.total);
+            }
+        });
+        xhr.addEventListener('load', () => {
+            if (xhr.status === 200) {
+                resolve(JSON.parse(xhr.responseText));
+            } else {
+                reject('HTTP ' + xhr.status);
+            }
+        });
+        xhr.addEventListener('error', () => reject('Network error'));
+        xhr.send(form);
+    });
+}
+
+function pollProgress(zone, batches, failures) {
+    const pending = Array.from(batches.keys()).filter(batch => batches.get(batch).some(file => file.status === 'processing'));
+    if (pending.length === 0) {
+        window.location.reload();
+        return;
+    }
+    Promise.all(pending.map(batch => fetch('/imaging/api/uploads/' + batch + '/')
+        .then(response => {
+            if (response.status === 404) {
+                // Expired or unknown: its files will never report back
+                batches.set(batch, batches.get(batch).map(file => file.status === 'processing'
+                    ? {...file, status: 'failed', error: 'Progress no longer available'} : file));
+                return;
+            }
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json().then(data => batches.set(batch, data.files));
+        })))
+        .then(() => {
+            showFiles(zone, allFiles(batches));
+            setTimeout(() => pollProgress(zone, batches, 0), 1000);
+        })
+        .catch(error => {
+            if (failures < POLL_RETRIES) {
+                setTimeout(() => pollProgress(zone, batches, failures + 1), 2000 * (failures + 1));
+                return;
+            }
+            showFiles(zone, allFiles(batches).concat([
+                {filename: 'Processing status', status: 'failed', error: error.message + '; reload the page to see the photos'},
+            ]));
+        });
+}
+
+function allFiles(batches) {
+    return Array.from(batches.values()).flat();
+}
+
+function showFiles(zone, files) {
+    const list = zone.querySelector('.bulk-upload-files');
+    list.innerHTML = '';
+    files.forEach(file => {
+        const item = document.createElement('li');
+        item.className = 'bulk-upload-' + file.status;
+        item.textContent = file.filename + ': ' + file.status + (file.duplicate ? ' (already uploaded)' : '') +
+            (file.error ? ' - ' + file.error : '');
+        list.appendChild(item);
+    });
+}
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SystemStatusConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'system_status'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,175 @@
+"""
+Fan-out of live status updates to server-sent event subscribers.
+
+The background sampler publishes each new status payload once. The
+broadcaster works out what changed since the previous payload, serializes
+the snapshot and the delta a single time and hands the same bytes to every
+subscriber, so the cost of a tick does not grow with the number of open
+dashboards.
+
+Each subscriber has a small bounded queue. A subscriber that falls behind
+(a slow or stalled client) does not hold up the others: its backlog is
+dropped and replaced by one full snapshot, which brings it back in sync.
+Subscriptions are removed when the client disconnects and the response
+generator is closed.
+
+Under WSGI each open stream occupies a request thread for as long as the
+tab stays open, so only a small share of the process's threads may be
+streams: STATUS_STREAM_MAX_SUBSCRIBERS, and never more than a quarter of
+mod_wsgi's threads per process. Past that the stream view answers 503
+and the dashboard polls instead.
+"""
+import json
+import queue
+import threading
+
+from django.conf import settings
+
+
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000  # client reconnect delay
+STREAM_THREAD_SHARE = 4  # at most 1 in this many request threads may hold a stream
+
+
+def request_threads():
+    """Request threads of this mod_wsgi daemon process, or None when not under mod_wsgi"""
+    try:
+        import mod_wsgi
+    except ImportError:
+        return None
+    return getattr(mod_wsgi, 'threads_per_process', None)
+
+
+def diff(old, new):
+    """Nested dict of the values in ``new`` that differ from ``old``"""
+    changed = {}
+    for key, value in new.items():
+        previous = old.get(key) if isinstance(old, dict) else None
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changed[key] = nested
+        elif value != previous or key not in old:
+            changed[key] = value
+    return changed
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One subscriber's queue, iterated as the body of its SSE response.
+
+    Django calls ``close()`` when the response finishes or the client goes
+    away, even if iteration never started, which removes the subscription.
+    """
+
+    def __init__(self, broadcaster, size):
+        self._broadcaster = broadcaster
+        self._queue = queue.Queue(maxsize=size)
+        self._started = False
+
+    def offer(self, message, snapshot):
+        """Queue ``message``; on overflow replace the backlog with ``snapshot``.
+
+        Returns the number of messages dropped.
+        """
+        try:
+            self._queue.put_nowait(message)
+            return 0
+        except queue.Full:
+            dropped = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    dropped += 1
+                except queue.Empty:
+                    break
+            self._queue.put_nowait(snapshot)
+            return dropped
+
+    def get(self, timeout):
+        """Next message, or None after ``timeout`` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._started:
+            self._started = True
+            return f'retry: {RETRY_MS}\n\n'
+        message = self.get(timeout=HEARTBEAT_SECONDS)
+        # A comment keeps idle proxies from closing the stream and lets a
+        # vanished client show up as a failed write
+        return message if message is not None else ': ping\n\n'
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """Publishes payloads as snapshot/delta SSE messages to every subscriber"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._payload = None
+        self._snapshot = None
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def max_subscribers(self):
+        limit = getattr(settings, 'STATUS_STREAM_MAX_SUBSCRIBERS', 2)
+        threads = request_threads()
+        if threads:
+            limit = min(limit, threads // STREAM_THREAD_SHARE)
+        return limit
+
+    @property
+    def queue_size(self):
+        return getattr(settings, 'STATUS_STREAM_QUEUE_SIZE', 4)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """New subscription primed with the current snapshot, or None when full"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.queue_size)
+            if self._snapshot is not None:
+                subscription.offer(self._snapshot, self._snapshot)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, payload):
+        with self._lock:
+            snapshot = sse('snapshot', payload)
+            delta = sse('delta', diff(self._payload, payload)) if self._payload is not None else snapshot
+            self._payload = payload
+            self._snapshot = snapshot
+            for subscription in self._subscribers:
+                self.dropped += subscription.offer(delta, snapshot)
+            self.published += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'dropped': self.dropped,
+            }
+
+
+broadcaster = Broadcaster()
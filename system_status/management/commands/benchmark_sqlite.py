@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Django's stock SQLite connection: rollback journal and a 5 second timeout
+DEFAULT_PROFILE = {'pragmas': [], 'timeout': 5}
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _worker(path, profile, role, duration, results):
+    """Run reads or writes against ``path`` until ``duration`` elapses"""
+    connection = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None)
+    for pragma in profile['pragmas']:
+        connection.execute(pragma)
+    operations = errors = 0
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'read':
+                low = random.randint(0, 9000)
+                connection.execute(
+                    'SELECT COUNT(*), MAX(created) FROM bench WHERE id BETWEEN ? AND ?', (low, low + 1000)
+                ).fetchone()
+            else:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('INSERT INTO bench (payload, created) VALUES (?, ?)', ('x' * 200, time.time()))
+                connection.execute('COMMIT')
+            operations += 1
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+    connection.close()
+    results.put((role, operations, errors, latencies))
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent SQLite reads and writes under the default and production '
+        'connection profiles, using a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Reader processes')
+        parser.add_argument('--writers', type=int, default=2, help='Writer processes')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+        parser.add_argument('--rows', type=int, default=10000, help='Rows to seed')
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default': DEFAULT_PROFILE,
+            'production': {
+                'pragmas': settings.SQLITE_PRODUCTION_PRAGMAS,
+                'timeout': settings.SQLITE_BUSY_TIMEOUT,
+            },
+        }
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['duration']:.0f}s per profile\n"
+        )
+        self.stdout.write(
+            f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'errors':>8}"
+            f"{'read p50 ms':>13}{'read p99 ms':>13}{'write p99 ms':>14}"
+        )
+        for name, profile in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self._seed(path, options['rows'])
+                stats = self._run(path, profile, options)
+            self.stdout.write(
+                f"{name:<12}{stats['reads'] / options['duration']:>10.0f}"
+                f"{stats['writes'] / options['duration']:>10.0f}{stats['errors']:>8}"
+                f"{_percentile(stats['read_latencies'], 50) * 1000:>13.2f}"
+                f"{_percentile(stats['read_latencies'], 99) * 1000:>13.2f}"
+                f"{_percentile(stats['write_latencies'], 99) * 1000:>14.2f}"
+            )
+
+    def _seed(self, path, rows):
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, payload TEXT, created REAL)')
+        connection.executemany(
+            'INSERT INTO bench (payload, created) VALUES (?, ?)',
+            (('x' * 200, time.time()) for _ in range(rows)),
+        )
+        connection.commit()
+        connection.close()
+
+    def _run(self, path, profile, options):
+        results = multiprocessing.Queue()
+        roles = ['read'] * options['readers'] + ['write'] * options['writers']
+        processes = [
+            multiprocessing.Process(target=_worker, args=(path, profile, role, options['duration'], results))
+            for role in roles
+        ]
+        for process in processes:
+            process.start()
+        stats = {'reads': 0, 'writes': 0, 'errors': 0, 'read_latencies': [], 'write_latencies': []}
+        for _ in processes:
+            role, operations, errors, latencies = results.get()
+            stats['reads' if role == 'read' else 'writes'] += operations
+            stats['errors'] += errors
+            stats[f'{role}_latencies'].extend(latencies)
+        for process in processes:
+            process.join()
+        return stats
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from system_status.query_plans import HOT_QUERIES, full_scans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every registered hot query and fail if any of them does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Only check these hot queries')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(HOT_QUERIES)
+        unknown = [name for name in names if name not in HOT_QUERIES]
+        if unknown:
+            raise CommandError(f'Unknown hot queries: {", ".join(unknown)}')
+
+        failures = []
+        for name in names:
+            plan = HOT_QUERIES[name]().explain()
+            scans = full_scans(plan, connection.vendor)
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK         {name}'))
+            if scans or options['verbose_plans']:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries fall back to a full scan: {", ".join(failures)}')
@@ -0,0 +1,126 @@
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.urls.resolvers import RegexPattern
+
+
+INSPECTOR = 'thecied.query_inspector.QueryInspectorMiddleware'
+# GET handlers with side effects on the session or the data
+DEFAULT_EXCLUDES = ['logout', 'unregister']
+
+_PARAMETER = re.compile(r'<(?:(?P<converter>\w+):)?(?P<name>\w+)>')
+
+
+def iter_routes(patterns, prefix=''):
+    """(route, name) for every URL pattern, or None for a route when it is a regex"""
+    for pattern in patterns:
+        route = None if prefix is None or isinstance(pattern.pattern, RegexPattern) else prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern.name
+
+
+def fill(route, params, default_id):
+    """``route`` with its parameters substituted, or None if one has no value"""
+    missing = False
+
+    def substitute(match):
+        nonlocal missing
+        if match['name'] in params:
+            return params[match['name']]
+        if match['converter'] == 'int':
+            return str(default_id)
+        missing = True
+        return ''
+
+    path = _PARAMETER.sub(substitute, route)
+    return None if missing else '/' + path
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay every GET route in the URLconf through the query inspector and '
+        'list the views with the most repeated (N+1) and slow queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Log in as this user first, so login-protected views run')
+        parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                            help='Value for a URL parameter, e.g. --param year=2026 (repeatable)')
+        parser.add_argument('--id', type=int, default=1, help='Value for int parameters without --param')
+        parser.add_argument('--exclude', action='append', default=[], metavar='REGEX',
+                            help=f'Skip routes matching this (repeatable; always skips {", ".join(DEFAULT_EXCLUDES)})')
+        parser.add_argument('--host', default='localhost', help='Host header sent with each request')
+        parser.add_argument('--limit', type=int, default=10, help='Worst routes to show in detail')
+        parser.add_argument('--json', action='store_true', help='Print every report as JSON instead')
+
+    def handle(self, *args, **options):
+        if INSPECTOR not in settings.MIDDLEWARE:
+            raise CommandError(f'{INSPECTOR} is not in MIDDLEWARE')
+        try:
+            params = dict(param.split('=', 1) for param in options['param'])
+        except ValueError:
+            raise CommandError('--param takes NAME=VALUE')
+        excludes = [re.compile(pattern) for pattern in DEFAULT_EXCLUDES + options['exclude']]
+
+        paths = []
+        for route, name in iter_routes(get_resolver().url_patterns):
+            if route is None or any(pattern.search(route) for pattern in excludes):
+                continue
+            path = fill(route, params, options['id'])
+            if path is not None and path not in paths:
+                paths.append(path)
+
+        results = []
+        # DEBUG's technical 500 page evaluates querysets while rendering, which would pad the counts
+        with override_settings(QUERY_INSPECTOR=True, DEBUG=False):
+            client = Client(raise_request_exception=False, HTTP_HOST=options['host'])
+            if options['user']:
+                try:
+                    client.force_login(User.objects.get(username=options['user']))
+                except User.DoesNotExist:
+                    raise CommandError(f'No user named {options["user"]}')
+            for path in paths:
+                response = client.get(path)
+                # Ends streaming responses (live status) without reading them
+                response.close()
+                report = getattr(response, 'query_report', None)
+                if report is not None:
+                    results.append((path, response.status_code, report))
+
+        results.sort(key=lambda item: (
+            -(item[2]['repeated'][0]['count'] if item[2]['repeated'] else 0),
+            -len(item[2]['slow']),
+            -item[2]['queries'],
+        ))
+
+        if options['json']:
+            self.stdout.write(json.dumps(
+                [{'path': path, 'status': status, **report} for path, status, report in results], indent=2
+            ))
+            return
+
+        self.stdout.write(f'{"Path":<50} {"Status":>6} {"Queries":>7} {"ms":>8} {"Slow":>4} {"Worst":>5}')
+        for path, status, report in results:
+            worst = f"{report['repeated'][0]['count']}x" if report['repeated'] else '-'
+            line = f"{path:<50} {status:>6} {report['queries']:>7} {report['time_ms']:>8} {len(report['slow']):>4} {worst:>5}"
+            style = self.style.ERROR if report['repeated'] or report['slow'] else self.style.SUCCESS
+            self.stdout.write(style(line))
+
+        offenders = [item for item in results if item[2]['repeated'] or item[2]['slow']][:options['limit']]
+        for path, status, report in offenders:
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(f'{path}  ({report["queries"]} queries, {report["time_ms"]} ms)'))
+            for item in report['repeated']:
+                self.stdout.write(f"    {item['count']}x ({item['identical']} identical, {item['time_ms']} ms) {item['shape']}")
+                for caller in item['callers']:
+                    self.stdout.write(f'        from {caller}')
+            for query in report['slow']:
+                self.stdout.write(f"    slow {query['ms']} ms {query['sql']}")
+                self.stdout.write(f"        from {query['caller']}")
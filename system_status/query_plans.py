@@ -0,0 +1,97 @@
+"""
+Registry of the hot queries the application runs on every request.
+
+Each entry builds the same queryset shape a view uses. The
+``check_query_plans`` management command EXPLAINs them and fails if any
+falls back to a full table scan, so the indexes stay aligned with the code.
+"""
+import re
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+HOT_QUERIES = {}
+
+
+def hot_query(name):
+    """Register a function returning a queryset under ``name``"""
+    def decorator(func):
+        HOT_QUERIES[name] = func
+        return func
+    return decorator
+
+
+@hot_query('events.reservation_list')
+def reservation_list():
+    from events.models import Reservation
+    return Reservation.objects.filter(
+        status='approved', event_datetime_begin__gte=timezone.now()
+    ).order_by('event_datetime_begin')
+
+
+@hot_query('events.calendar_feed')
+def calendar_feed():
+    from events.models import Reservation
+    now = timezone.now()
+    return Reservation.objects.filter(
+        status='approved', event_datetime_begin__lt=now + timedelta(days=31), event_datetime_end__gt=now
+    ).values('event_id', 'event_datetime_begin', 'event_datetime_end')
+
+
+@hot_query('events.area_conflicts')
+def area_conflicts():
+    from events.models import Reservation
+    now = timezone.now()
+    return Reservation.objects.filter(event_area='Auditorium', event_datetime_begin__lt=now)
+
+
+@hot_query('events.availability_sync')
+def availability_sync():
+    from events.models import Reservation
+    return Reservation.objects.filter(updated_at__gte=timezone.now()).order_by()
+
+
+@hot_query('events.event_availability_sync')
+def event_availability_sync():
+    from events.models import Event
+    return Event.objects.filter(venue__isnull=False, updated_at__gte=timezone.now()).order_by()
+
+
+@hot_query('events.upcoming_events')
+def upcoming_events():
+    from events.models import Event
+    return Event.objects.filter(schedule_status='approved', date__gte=timezone.now()).order_by('date')
+
+
+@hot_query('admin_dashboard.reservations')
+def admin_reservations():
+    from events.models import Reservation
+    return Reservation.objects.order_by('-created_at', '-event_id')[:21]
+
+
+@hot_query('admin_dashboard.reservations_by_status')
+def admin_reservations_by_status():
+    from events.models import Reservation
+    return Reservation.objects.filter(status='pending').order_by('-created_at', '-event_id')[:21]
+
+
+@hot_query('chat.history')
+def chat_history():
+    from chat.models import ChatMessage
+    return ChatMessage.objects.filter(session_id=1).order_by('created_at')
+
+
+# Plan lines that mean "read the whole table", per database vendor
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+def full_scans(plan, vendor):
+    """Tables the plan reads with a full scan"""
+    pattern = FULL_SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        return []
+    return [match.group(1) for line in plan.splitlines() for match in [pattern.search(line)] if match]
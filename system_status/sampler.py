@@ -0,0 +1,156 @@
+"""
+Background system metrics sampler.
+
+One daemon thread per process samples CPU, memory, disk, load average and
+socket connections every ``STATUS_SAMPLE_INTERVAL`` seconds into a
+fixed-size ring buffer holding ``STATUS_HISTORY_MINUTES`` of history. The
+status endpoints read the latest sample in O(1) instead of calling psutil
+(and blocking on ``cpu_percent(interval=...)``) inside the request, so
+their cost no longer depends on how many dashboards are open.
+
+The thread starts on first use and is restarted in a forked child, whose
+copy of the parent's thread does not run.
+"""
+import os
+import threading
+import time
+
+import psutil
+from django.conf import settings
+
+
+class RingBuffer:
+    """Fixed-capacity buffer overwriting its oldest item"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = [None] * capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        with self._lock:
+            self._items[self._next] = item
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def latest(self):
+        with self._lock:
+            if not self._count:
+                return None
+            return self._items[self._next - 1]
+
+    def last(self, n):
+        """The newest ``n`` items, oldest first"""
+        with self._lock:
+            n = min(n, self._count)
+            if n <= 0:
+                return []
+            start = self._next - n
+            if start >= 0:
+                return self._items[start:self._next]
+            return self._items[start:] + self._items[:self._next]
+
+
+def _disk_root():
+    return 'C:\\' if os.name == 'nt' else '/'
+
+
+def take_sample(cpu_interval=None):
+    """One snapshot of system metrics; ``cpu_percent`` covers the time since the previous call"""
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage(_disk_root())
+    try:
+        connections = len(psutil.net_connections())
+    except (psutil.AccessDenied, OSError):
+        connections = None
+    return {
+        'timestamp': time.time(),
+        'cpu_percent': psutil.cpu_percent(interval=cpu_interval),
+        'memory': {
+            'total': memory.total,
+            'available': memory.available,
+            'percent': memory.percent,
+            'used': memory.used,
+        },
+        'disk': {
+            'total': disk.total,
+            'free': disk.free,
+            'percent': (disk.used / disk.total) * 100,
+        },
+        'load_avg': list(os.getloadavg()) if hasattr(os, 'getloadavg') else [0, 0, 0],
+        'connections': connections,
+    }
+
+
+class MetricsSampler:
+    """Samples system metrics on a background thread into a ring buffer"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._buffer = None
+        self._listeners = []
+
+    @property
+    def interval(self):
+        return getattr(settings, 'STATUS_SAMPLE_INTERVAL', 5)
+
+    @property
+    def history_minutes(self):
+        return getattr(settings, 'STATUS_HISTORY_MINUTES', 60)
+
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._buffer = RingBuffer(max(1, int(self.history_minutes * 60 / self.interval)))
+            self._ready = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='status-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        buffer, ready = self._buffer, self._ready
+        # Measure the first CPU figure over a short window; later ones span the whole interval
+        cpu_interval = 0.1
+        while True:
+            started = time.monotonic()
+            try:
+                sample = take_sample(cpu_interval)
+                buffer.append(sample)
+                ready.set()
+                for listener in list(self._listeners):
+                    listener(sample)
+            except Exception as e:
+                print(f"Status sampler error: {e}")
+            cpu_interval = None
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def add_listener(self, listener):
+        """Call ``listener(sample)`` on the sampler thread after every sample"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def latest(self, wait=1.0):
+        """Most recent sample, waiting up to ``wait`` seconds for the first one"""
+        self.ensure_started()
+        self._ready.wait(wait)
+        return self._buffer.latest()
+
+    def history(self, minutes):
+        """Samples from the last ``minutes`` minutes, oldest first"""
+        self.ensure_started()
+        return self._buffer.last(int(minutes * 60 / self.interval))
+
+
+sampler = MetricsSampler()
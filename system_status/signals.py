@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from events.models import Reservation
+from thecied import metrics
+
+
+@receiver(post_save, sender=Reservation)
+def count_reservation(sender, instance, created, raw=False, **kwargs):
+    """Feed the reservation creation rate exposed at /status/metrics"""
+    if created and not raw:
+        metrics.RESERVATIONS_CREATED.inc(status=instance.status)
@@ -1,3 +1,272 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chat.models import ChatSession
+from thecied import TrackLog, instrumentation, metrics
+from thecied.instrumentation import Histogram, Registry, bucket_bounds, bucket_index
+
+from . import live
+
+
+class StatusHistoryApiTests(TestCase):
+    def test_rejects_non_finite_and_non_positive_minutes(self):
+        for value in ('nan', 'inf', '-inf', '-5', '0', 'soon'):
+            response = self.client.get('/status/api/history/', {'minutes': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    @mock.patch('system_status.views.sampler')
+    def test_minutes_are_capped_at_the_ring_buffer(self, sampler):
+        sampler.history_minutes = 60
+        sampler.interval = 5
+        sampler.history.return_value = []
+        response = self.client.get('/status/api/history/', {'minutes': '600'})
+        self.assertEqual(response.status_code, 200)
+        sampler.history.assert_called_once_with(60)
+
+
+class BroadcasterTests(TestCase):
+    @override_settings(STATUS_STREAM_MAX_SUBSCRIBERS=2)
+    def test_subscribers_are_capped(self):
+        broadcaster = live.Broadcaster()
+        first, second = broadcaster.subscribe(), broadcaster.subscribe()
+        self.assertIsNone(broadcaster.subscribe())
+        first.close()
+        self.assertIsNotNone(broadcaster.subscribe())
+        second.close()
+
+    @override_settings(STATUS_STREAM_MAX_SUBSCRIBERS=50)
+    def test_cap_stays_below_the_wsgi_threads(self):
+        with mock.patch('system_status.live.request_threads', return_value=15):
+            self.assertEqual(live.Broadcaster().max_subscribers, 3)
+
+    @override_settings(STATUS_STREAM_MAX_SUBSCRIBERS=0)
+    @mock.patch('system_status.views.sampler')
+    def test_stream_refused_with_503_when_full(self, sampler):
+        response = self.client.get('/status/api/stream/')
+        self.assertEqual(response.status_code, 503)
+
+    def test_slow_subscriber_is_resynced_with_a_snapshot(self):
+        broadcaster = live.Broadcaster()
+        subscription = broadcaster.subscribe()
+        for tick in range(broadcaster.queue_size + 3):
+            broadcaster.publish({'tick': tick, 'host': 'web'})
+        messages = []
+        while (message := subscription.get(timeout=0)) is not None:
+            messages.append(message)
+        # The backlog was replaced by a full snapshot; later ticks follow as deltas
+        self.assertTrue(messages[0].startswith('event: snapshot'))
+        self.assertIn('"host": "web"', messages[0])
+        self.assertEqual([m.split('\n')[0] for m in messages[1:]], ['event: delta'] * (len(messages) - 1))
+        self.assertIn('"tick": 6', messages[-1])
+        self.assertGreater(broadcaster.dropped, 0)
+        subscription.close()
+
+
+
+class MetricsTestCase(TestCase):
+    """Runs with METRICS_DIR and a fresh metrics store in a scratch directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(METRICS_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        store = mock.patch.object(metrics, 'store', metrics.MetricStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+
+class HistogramTests(TestCase):
+    def test_buckets_cover_every_value_once(self):
+        previous = -1
+        for index in range(bucket_index(1 << 20) + 1):
+            low, high = bucket_bounds(index)
+            self.assertEqual(low, previous + 1)
+            self.assertEqual((bucket_index(low), bucket_index(high)), (index, index))
+            previous = high
+
+    def test_small_values_are_exact_and_large_ones_within_the_relative_error(self):
+        self.assertEqual([bucket_bounds(bucket_index(n)) for n in (0, 7, 15)], [(0, 0), (7, 7), (15, 15)])
+        for value in (16, 17, 1000, 123_456, 10 ** 9):
+            low, high = bucket_bounds(bucket_index(value))
+            self.assertLessEqual(low, value)
+            self.assertLessEqual(value, high)
+            self.assertLess((high - low) / low, 1 / 15)
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), 0)
+        for value in range(1, 101):
+            histogram.record(value)
+        histogram.record(-5)
+        self.assertEqual((histogram.total, histogram.max, histogram.sum), (101, 100, 5050))
+        for percent, value in ((50, 50), (95, 95), (99, 99), (100, 100)):
+            low, high = bucket_bounds(bucket_index(value))
+            self.assertTrue(low <= histogram.percentile(percent) <= high, percent)
+        # Never beyond the largest value seen
+        self.assertEqual(histogram.percentile(100), 100)
+
+
+class RegistryTests(TestCase):
+    def test_shards_of_every_thread_are_merged(self):
+        registry = Registry()
+        registry.record('home', latency_us=1000, queries=2, query_us=300, response_bytes=10, error=False)
+
+        def worker():
+            registry.record('home', latency_us=3000, queries=4, query_us=500, response_bytes=30, error=True)
+            registry.record('api', latency_us=50, queries=0, query_us=0, response_bytes=None, error=False)
+
+        for _ in range(3):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        # Each new thread's shard folds the finished threads' shards into one
+        self.assertEqual(len(registry._shards), 2)
+
+        merged = registry.merged()
+        home = merged['home']
+        self.assertEqual((home.latency_us.total, home.queries.sum, home.query_us), (4, 14, 1800))
+        self.assertEqual((home.response_bytes, home.errors, merged['api'].latency_us.total), (100, 3, 3))
+        registry.reset()
+        self.assertEqual(registry.merged(), {})
+
+
+class ActivityLoggerTests(MetricsTestCase):
+    def setUp(self):
+        super().setUp()
+        registry = Registry()
+        for target in (instrumentation, TrackLog):
+            patcher = mock.patch.object(target, 'registry', registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def route(self, name):
+        return next(route for route in instrumentation.report()['routes'] if route['route'] == name)
+
+    def test_sync_view(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/admin_dashboard/api/suites/')
+        route = self.route('admin_suites_api')
+        self.assertEqual((route['count'], route['errors'], route['queries_mean']), (1, 0, len(queries.captured_queries)))
+        self.assertGreater(route['bytes_mean'], 0)
+
+    def test_queries_of_async_views_are_counted(self):
+        session = ChatSession.objects.create(session_id='counted')
+        session.messages.create(role='user', content='Hello')
+        # The async ORM runs the session and page queries in sync_to_async threads
+        self.client.get('/chat/history/', {'session_id': 'counted'})
+        self.assertEqual(self.route('chat:chat_history')['queries_mean'], 2)
+
+@override_settings(QUERY_INSPECTOR=True)
+class QueryInspectorTests(TestCase):
+    def test_report_headers_only_for_staff(self):
+        anonymous = Client().get('/status/api/history/', {'minutes': 'nan'})
+        self.assertFalse(anonymous.has_header('X-Query-Report'))
+        self.assertIsNotNone(anonymous.query_report)
+
+        staff = Client()
+        staff.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        response = staff.get('/status/api/history/', {'minutes': 'nan'})
+        self.assertTrue(response.has_header('X-Query-Report'))
+        self.assertTrue(response['X-Query-Summary'].startswith('queries='))
+
+    @override_settings(QUERY_INSPECTOR=False)
+    def test_off_unless_enabled(self):
+        response = Client().get('/status/api/history/', {'minutes': 'nan'})
+        self.assertFalse(hasattr(response, 'query_report'))
+
+
+class MetricsStoreTests(MetricsTestCase):
+
+    def test_mmap_dict_survives_reopening_and_grows(self):
+        path = self.directory / 'values.db'
+        values = metrics.MmapDict(path)
+        keys = [f'key-{n}-' + 'x' * (n % 13) for n in range(3000)]
+        for n, key in enumerate(keys):
+            values.add(key, n)
+        values.add(keys[0], 0.5)
+        values.close()
+        self.assertGreater(path.stat().st_size, metrics.INITIAL_FILE_SIZE)
+        read = metrics.read_file(path)
+        self.assertEqual(len(read), 3000)
+        self.assertEqual((read[keys[0]], read[keys[-1]]), (0.5, 2999))
+        reopened = metrics.MmapDict(path)
+        reopened.add(keys[1], 1)
+        reopened.close()
+        self.assertEqual(metrics.read_file(path)[keys[1]], 2)
+
+    def test_collect_sums_every_process_and_archives_dead_ones(self):
+        dead_pid = 2 ** 22 + 1  # above the default pid_max, so never a live process
+        for pid in (os.getppid(), dead_pid):
+            other = metrics.MmapDict(self.directory / f'{pid}.db')
+            other.add(metrics.RESERVATIONS_CREATED.series({'status': 'pending'}), 2)
+            other.close()
+        metrics.RESERVATIONS_CREATED.inc(status='pending')
+        key = metrics.RESERVATIONS_CREATED.series({'status': 'pending'})
+        self.assertEqual(metrics.store.collect()[key], 5)
+        self.assertFalse((self.directory / f'{dead_pid}.db').exists())
+        self.assertEqual(metrics.read_file(self.directory / metrics.ARCHIVE_NAME)[key], 2)
+        self.assertIn(os.getppid(), metrics.store.live_pids())
+
+    def test_reopens_its_own_file_after_a_fork(self):
+        metrics.RESERVATIONS_CREATED.inc(status='approved')
+        metrics.store._pid = -1  # as seen from a forked child
+        metrics.RESERVATIONS_CREATED.inc(status='approved')
+        key = metrics.RESERVATIONS_CREATED.series({'status': 'approved'})
+        self.assertEqual(metrics.store.collect()[key], 2)
+
+    def test_exposition(self):
+        metrics.RESERVATIONS_CREATED.inc(status='pen"ding')
+        for seconds in (0.02, 0.3, 100):
+            metrics.TASK_DURATION.observe(seconds, task='demo')
+        text = metrics.exposition([('thecied_demo', 'gauge', 'A gauge', [({'kind': 'a'}, 3)])])
+        lines = text.splitlines()
+        self.assertIn('thecied_reservations_created_total{status="pen\\"ding"} 1.0', lines)
+        self.assertIn('thecied_task_duration_seconds_bucket{le="0.01",task="demo"} 0.0', lines)
+        self.assertIn('thecied_task_duration_seconds_bucket{le="0.05",task="demo"} 1.0', lines)
+        self.assertIn('thecied_task_duration_seconds_bucket{le="60.0",task="demo"} 2.0', lines)
+        self.assertIn('thecied_task_duration_seconds_bucket{le="+Inf",task="demo"} 3.0', lines)
+        self.assertIn('thecied_task_duration_seconds_count{task="demo"} 3.0', lines)
+        self.assertIn('thecied_task_duration_seconds_sum{task="demo"} 100.32', lines)
+        self.assertIn('# TYPE thecied_demo gauge', lines)
+        self.assertIn('thecied_demo{kind="a"} 3.0', lines)
+        self.assertEqual(lines[-1], '# EOF')
+
+    def test_labels_must_match(self):
+        with self.assertRaises(ValueError):
+            metrics.RESERVATIONS_CREATED.inc(status='pending', kind='walk-in')
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsApiTests(MetricsTestCase):
+    def test_anonymous_scrapes_are_refused(self):
+        for headers in ({}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'scrape-me'}):
+            response = self.client.get('/status/metrics', headers=headers)
+            self.assertEqual(response.status_code, 401, headers)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="metrics"')
+            self.assertNotIn(b'thecied_process', response.content)
+
+    def test_token_or_staff_session(self):
+        response = self.client.get('/status/metrics', headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'thecied_process_threads', response.content)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/status/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured_means_staff_only(self):
+        response = self.client.get('/status/metrics', headers={'Authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(User.objects.create_user('member'))
+        self.assertEqual(self.client.get('/status/metrics').status_code, 401)
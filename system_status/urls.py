@@ -7,4 +7,7 @@ urlpatterns = [
     path('', views.status_page, name='status_page'),
     path('api/', views.status_api, name='status_api'),
     path('api/system/', views.system_info_api, name='system_info_api'),
+    path('api/history/', views.status_history_api, name='status_history_api'),
+    path('api/stream/', views.status_stream_api, name='status_stream_api'),
+    path('metrics', views.metrics_api, name='metrics_api'),
 ]
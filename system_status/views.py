@@ -1,14 +1,29 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import User
+import hmac
+import math
+import os
 import platform
 import psutil
-import os
 import time
 from datetime import datetime
+from chat import response_cache
+from thecied import instrumentation, metrics
 from events.models import Venue
 from manage_suites.models import SuiteContracts
+from taskqueue import queue as task_queue
+from .live import broadcaster
+from .sampler import sampler
+
+STATUS_HISTORY_DEFAULT_MINUTES = 15
+DATABASE_STATS_KEY = 'system-status:database'
+STATUS_HOT_PATHS = 10  # routes listed under 'requests', by total time spent
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
 
 def is_admin(user):
     return user.is_authenticated and user.is_staff
@@ -56,12 +71,12 @@ def get_uptime():
 def get_memory_info():
     """Get memory usage information"""
     try:
-        memory = psutil.virtual_memory()
+        memory = sampler.latest()['memory']
         return {
-            'total': f"{memory.total / (1024**3):.2f} GB",
-            'used': f"{memory.used / (1024**3):.2f} GB",
-            'available': f"{memory.available / (1024**3):.2f} GB",
-            'percent': f"{memory.percent}%"
+            'total': f"{memory['total'] / (1024**3):.2f} GB",
+            'used': f"{memory['used'] / (1024**3):.2f} GB",
+            'available': f"{memory['available'] / (1024**3):.2f} GB",
+            'percent': f"{memory['percent']}%"
         }
     except:
         return "N/A"
@@ -69,58 +84,58 @@ def get_memory_info():
 def get_disk_info():
     """Get disk usage information"""
     try:
-        disk = psutil.disk_usage('/')
+        disk = sampler.latest()['disk']
+        used = disk['total'] - disk['free']
         return {
-            'total': f"{disk.total / (1024**3):.2f} GB",
-            'used': f"{disk.used / (1024**3):.2f} GB",
-            'free': f"{disk.free / (1024**3):.2f} GB",
-            'percent': f"{(disk.used / disk.total) * 100:.1f}%"
+            'total': f"{disk['total'] / (1024**3):.2f} GB",
+            'used': f"{used / (1024**3):.2f} GB",
+            'free': f"{disk['free'] / (1024**3):.2f} GB",
+            'percent': f"{disk['percent']:.1f}%"
         }
     except:
         return "N/A"
 
+def cached_database_stats():
+    """Database statistics, recomputed at most every STATUS_DATABASE_TTL seconds"""
+    return cache.get_or_set(DATABASE_STATS_KEY, get_database_stats, getattr(settings, 'STATUS_DATABASE_TTL', 30))
+
+def build_status(sample):
+    """Dashboard status payload around one sampler sample"""
+    # Calculate uptime in seconds
+    boot_time = psutil.boot_time()
+    uptime_seconds = int(time.time() - boot_time)
+    requests = instrumentation.report(limit=STATUS_HOT_PATHS)
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'metrics': {
+            'cpu_percent': sample['cpu_percent'],
+            'memory': sample['memory'],
+            'disk': sample['disk'],
+            'load_avg': sample['load_avg'],
+            'sampled_at': datetime.fromtimestamp(sample['timestamp']).isoformat(),
+            'sessions': {
+                'active': 1,  # Simplified for now
+                'connections': sample['connections'] or 0
+            },
+            'activity': {
+                'uptime_seconds': uptime_seconds,
+                'total_requests': requests['total_requests'],
+                'recent_reservations': 0  # Would need to implement
+            },
+            'chat_cache': response_cache.stats()
+        },
+        'requests': requests,
+        'database': cached_database_stats()
+    }
+
 # Add comprehensive status API for the dashboard
 def status_api(request):
     """Get comprehensive system status for dashboard"""
     try:
-        # Get system metrics
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/' if os.name != 'nt' else 'C:\\')
-        
-        # Calculate uptime in seconds
-        boot_time = psutil.boot_time()
-        uptime_seconds = int(time.time() - boot_time)
-        
-        # Get database stats
-        database_stats = get_database_stats()
-        
-        status_data = {
-            'timestamp': datetime.now().isoformat(),
-            'metrics': {
-                'cpu_percent': psutil.cpu_percent(interval=0.1),
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'percent': memory.percent,
-                    'used': memory.used
-                },
-                'disk': {
-                    'total': disk.total,
-                    'free': disk.free,
-                    'percent': (disk.used / disk.total) * 100
-                },
-                'sessions': {
-                    'active': 1,  # Simplified for now
-                    'connections': len(psutil.net_connections())
-                },
-                'activity': {
-                    'uptime_seconds': uptime_seconds,
-                    'total_requests': 0,  # Would need to track this
-                    'recent_reservations': 0  # Would need to implement
-                }
-            },
-            'database': database_stats
-        }
+        # Latest figures from the background sampler
+        status_data = build_status(sampler.latest())
+        status_data['stream'] = broadcaster.stats()
         
         return JsonResponse(status_data)
     except Exception as e:
@@ -137,6 +152,111 @@ def status_api(request):
             'database': {'responsive': False, 'total_reservations': 0, 'total_venues': 0, 'total_suite_contracts': 0, 'total_users': 0}
         }, status=500)
 
+def _publish(sample):
+    """Sampler listener: push the new status to live subscribers, if there are any"""
+    if not len(broadcaster):
+        return
+    # Runs on the sampler thread, outside any request cycle
+    close_old_connections()
+    broadcaster.publish(build_status(sample))
+
+def status_stream_api(request):
+    """Stream live status as server-sent events: a snapshot, then deltas.
+
+    Every tick is built once by the shared sampler and fanned out to all
+    subscribers. Each open stream holds a worker thread, so subscribers are
+    capped well below the thread count (see system_status.live); past that
+    the client gets a 503 and falls back to polling /status/api/.
+    """
+    sampler.add_listener(_publish)
+    sampler.ensure_started()
+    subscription = broadcaster.subscribe()
+    if subscription is None:
+        return JsonResponse({'error': 'Too many live status streams, poll /status/api/ instead'}, status=503)
+    if not broadcaster.published:
+        broadcaster.publish(build_status(sampler.latest()))
+    
+    response = StreamingHttpResponse(subscription, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _process_families():
+    """Gauges for every live server process and for the host, read at scrape time"""
+    memory, cpu, threads = [], [], []
+    for pid in sorted(set(metrics.store.live_pids()) | {os.getpid()}):
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                labels = {'pid': str(pid)}
+                memory.append((labels, process.memory_info().rss))
+                times = process.cpu_times()
+                cpu.append((labels, times.user + times.system))
+                threads.append((labels, process.num_threads()))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    families = [
+        ('thecied_process_resident_memory_bytes', 'gauge', 'Resident memory of each server process', memory),
+        ('thecied_process_cpu_seconds', 'counter', 'User and system CPU time of each server process', cpu),
+        ('thecied_process_threads', 'gauge', 'Threads in each server process', threads),
+    ]
+    sample = sampler.latest()
+    if sample is not None:
+        families += [
+            ('thecied_system_cpu_percent', 'gauge', 'Host CPU utilisation', [({}, sample['cpu_percent'])]),
+            ('thecied_system_memory_used_bytes', 'gauge', 'Host memory in use', [({}, sample['memory']['used'])]),
+            ('thecied_system_memory_total_bytes', 'gauge', 'Host memory', [({}, sample['memory']['total'])]),
+            ('thecied_system_disk_used_ratio', 'gauge', 'Fraction of the root disk in use', [({}, sample['disk']['percent'] / 100)]),
+            ('thecied_system_load1', 'gauge', 'One-minute load average', [({}, sample['load_avg'][0])]),
+        ]
+    return families
+
+def _metrics_allowed(request):
+    """Staff sessions, or a scraper presenting METRICS_TOKEN as a bearer token"""
+    if is_admin(request.user):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+def metrics_api(request):
+    """OpenMetrics exposition of request, database, chat, cache and reservation metrics for scraping.
+
+    Counters and histograms are summed over every server process (see
+    thecied/metrics.py), so any process can answer the scrape. Process IDs
+    and memory figures are not public: staff or METRICS_TOKEN only.
+    """
+    if not _metrics_allowed(request):
+        response = HttpResponse('Authentication required', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    families = _process_families()
+    families.append((
+        'thecied_task_queue_tasks', 'gauge', 'Background tasks by status',
+        [({'status': status}, count) for status, count in task_queue.depth().items()],
+    ))
+    return HttpResponse(metrics.exposition(families), content_type=OPENMETRICS_CONTENT_TYPE)
+
+def status_history_api(request):
+    """Recent samples as parallel arrays for sparklines (``?minutes=``, default 15)"""
+    try:
+        minutes = float(request.GET.get('minutes', STATUS_HISTORY_DEFAULT_MINUTES))
+    except ValueError:
+        minutes = math.nan
+    if not math.isfinite(minutes) or minutes <= 0:
+        return JsonResponse({'error': 'minutes must be a positive number'}, status=400)
+    minutes = min(minutes, sampler.history_minutes)
+    samples = sampler.history(minutes)
+    return JsonResponse({
+        'interval': sampler.interval,
+        'timestamps': [sample['timestamp'] for sample in samples],
+        'cpu_percent': [sample['cpu_percent'] for sample in samples],
+        'memory_percent': [sample['memory']['percent'] for sample in samples],
+        'disk_percent': [round(sample['disk']['percent'], 2) for sample in samples],
+        'load_1': [sample['load_avg'][0] for sample in samples],
+        'connections': [sample['connections'] for sample in samples],
+    })
+
 def get_database_stats():
     """Get database statistics"""
     try:
@@ -197,10 +317,11 @@ def get_table_count():
 def get_cpu_info():
     """Get CPU usage information"""
     try:
+        sample = sampler.latest()
         return {
-            'usage_percent': f"{psutil.cpu_percent(interval=1)}%",
+            'usage_percent': f"{sample['cpu_percent']}%",
             'count': psutil.cpu_count(),
-            'load_avg': getattr(os, 'getloadavg', lambda: [0, 0, 0])()
+            'load_avg': sample['load_avg']
         }
     except:
         return "N/A"
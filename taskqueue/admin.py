@@ -0,0 +1,45 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts', 'max_attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'key', 'last_error']
+    date_hierarchy = 'created_at'
+    readonly_fields = [
+        'name', 'kwargs', 'key', 'attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at',
+    ]
+    actions = ['retry']
+
+    fieldsets = (
+        ('Task', {
+            'fields': ('name', 'kwargs', 'key', 'priority', 'status')
+        }),
+        ('Attempts', {
+            'fields': ('attempts', 'max_attempts', 'run_after', 'locked_by', 'locked_at', 'last_error')
+        }),
+        ('Timestamps', {
+            'fields': ('created_at', 'finished_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+    @admin.action(description='Retry selected failed tasks')
+    def retry(self, request, queryset):
+        """Queue failed tasks again with a fresh set of attempts"""
+        # Only one task per idempotency key may be pending; a key queued again since is already covered
+        keys = set(Task.objects.filter(status__in=Task.PENDING, key__isnull=False).values_list('key', flat=True))
+        count = 0
+        for job in queryset.filter(status=Task.FAILED).order_by('-created_at'):
+            if job.key is not None:
+                if job.key in keys:
+                    continue
+                keys.add(job.key)
+            Task.objects.filter(pk=job.pk).update(
+                status=Task.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None, locked_by='', locked_at=None,
+            )
+            count += 1
+        self.message_user(request, f"{count} task(s) queued again.")
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class TaskQueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'taskqueue'
+    verbose_name = 'Task Queue'
+
+    def ready(self):
+        from django.utils.module_loading import autodiscover_modules
+
+        # Each app registers its background work in a tasks.py module
+        autodiscover_modules('tasks')
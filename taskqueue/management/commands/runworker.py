@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from taskqueue import worker
+from taskqueue.queue import TASKS
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks with a pool of worker processes and threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=getattr(settings, 'TASK_QUEUE_PROCESSES', 1),
+            help='Worker processes (forked; more than one needs a POSIX system)',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=getattr(settings, 'TASK_QUEUE_THREADS', 2),
+            help='Threads per process, each running one task at a time',
+        )
+        parser.add_argument(
+            '--poll', type=float, default=getattr(settings, 'TASK_QUEUE_POLL_INTERVAL', 1.0),
+            help='Seconds to wait before looking again when no task is due',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due, instead of waiting')
+
+    def handle(self, *args, **options):
+        processes, threads = max(1, options['processes']), max(1, options['threads'])
+        self.stdout.write(
+            f"Running {', '.join(sorted(TASKS)) or 'no registered tasks'} "
+            f"with {processes} process(es) x {threads} thread(s)"
+        )
+        if processes == 1:
+            worker.serve(threads, options['poll'], options['burst'])
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(
+                target=worker.serve, args=(threads, options['poll'], options['burst']), kwargs={'maintain': False},
+            )
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+        last_housekeeping = None
+        while any(child.is_alive() for child in children):
+            if stopping.is_set():
+                # Let each child finish its running tasks
+                for child in children:
+                    if child.is_alive():
+                        child.terminate()
+                for child in children:
+                    child.join()
+                break
+            if last_housekeeping is None or time.monotonic() - last_housekeeping >= worker.HOUSEKEEPING_INTERVAL:
+                worker.housekeeping()
+                last_housekeeping = time.monotonic()
+            stopping.wait(1)
+        connections.close_all()
@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """One unit of background work, run by ``manage.py runworker``"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    PENDING = [QUEUED, RUNNING]
+
+    name = models.CharField(max_length=100, help_text="Registered task name, e.g. imaging.process_image")
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (QUEUED, 'Queued'),
+            (RUNNING, 'Running'),
+            (DONE, 'Done'),
+            (FAILED, 'Failed'),
+        ],
+        default=QUEUED,
+    )
+    key = models.CharField(
+        max_length=255, null=True, blank=True,
+        help_text="Idempotency key: enqueueing the same key while this task is pending adds nothing",
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time (retry backoff)")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker running it, as host:pid:thread")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Task"
+        verbose_name_plural = "Tasks"
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='task_claim_idx'),
+            models.Index(fields=['status', 'finished_at'], name='task_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=Q(status__in=['queued', 'running']), name='unique_pending_task_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
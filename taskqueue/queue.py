@@ -0,0 +1,207 @@
+"""
+Durable background tasks, stored in the Task table.
+
+Apps declare their background work in a ``tasks.py`` module::
+
+    @task(priority=5, max_attempts=3)
+    def process_image(name):
+        ...
+
+and queue it with ``process_image.enqueue(name=...)`` or
+``enqueue('imaging.process_image', name=...)``. The Task row is written in
+the caller's transaction. Workers therefore see it only once the data it
+refers to has committed, and a rollback drops it. ``manage.py runworker``
+claims queued tasks, highest priority first, and runs them. A task that
+raises is retried with exponential backoff (``retry_delay``, doubled on
+each attempt) until it has used ``max_attempts``. After that it stays
+failed, with its traceback. While a task runs, its worker refreshes
+``locked_at`` every third of ``TASK_QUEUE_LEASE``, so a long task keeps its
+lease. A task whose ``locked_at`` is older than the lease belongs to a
+worker that died, and is put back in the queue.
+
+An idempotency ``key`` collapses duplicates. Enqueueing a key that
+already has a queued or running task returns that task instead of adding
+another one. Task arguments are keyword-only and must be JSON-serializable.
+
+With ``TASK_QUEUE_EAGER`` set, tasks run in-process right after commit,
+for development without a worker.
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from thecied import metrics
+
+from .models import Task
+
+
+# Registered name -> task function
+TASKS = {}
+
+DEFAULT_LEASE = 600  # seconds
+HEARTBEAT_SHARE = 3  # locked_at is refreshed this many times per lease
+
+
+def task(func=None, *, name=None, priority=0, max_attempts=3, retry_delay=10):
+    """Register ``func`` as a background task named ``<app>.<function>``"""
+    def register(func):
+        func.task_name = name or f'{func.__module__.split(".")[0]}.{func.__name__}'
+        func.priority = priority
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.enqueue = lambda **kwargs: enqueue(func, **kwargs)
+        TASKS[func.task_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def _resolve(func):
+    if isinstance(func, str):
+        return TASKS[func]
+    if getattr(func, 'task_name', None) not in TASKS:
+        raise ValueError(f'{func!r} is not a registered task')
+    return func
+
+
+def enqueue(func, *, key=None, priority=None, delay=0, **kwargs):
+    """Queue the task ``func`` (function or registered name) to run with ``kwargs``; returns its Task"""
+    func = _resolve(func)
+    if getattr(settings, 'TASK_QUEUE_EAGER', False):
+        transaction.on_commit(lambda: func(**kwargs), robust=True)
+        return None
+    fields = {
+        'name': func.task_name,
+        'kwargs': kwargs,
+        'priority': func.priority if priority is None else priority,
+        'max_attempts': func.max_attempts,
+        'run_after': timezone.now() + timedelta(seconds=delay),
+        'key': key,
+    }
+    if key is None:
+        return Task.objects.create(**fields)
+    pending = Task.objects.filter(key=key, status__in=Task.PENDING)
+    existing = pending.first()
+    if existing is not None:
+        return existing
+    try:
+        with transaction.atomic():
+            return Task.objects.create(**fields)
+    except IntegrityError:
+        # Another process queued the same key in between
+        return pending.first()
+
+
+def worker_name():
+    """host:pid:thread, recorded on the tasks this thread runs"""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def claim(worker):
+    """Mark the most urgent due task as running for ``worker`` and return it, or None"""
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.QUEUED, run_after__lte=now).order_by('-priority', 'run_after', 'pk')
+    for pk in due.values_list('pk', flat=True)[:5]:
+        # Whoever flips it from queued first owns it; the others try the next one
+        if Task.objects.filter(pk=pk, status=Task.QUEUED).update(
+            status=Task.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        ):
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def _heartbeat(job, done, interval):
+    """Refresh ``locked_at`` of a running Task until ``done`` is set, so requeue_stale leaves it alone"""
+    try:
+        while not done.wait(interval):
+            try:
+                Task.objects.filter(pk=job.pk, status=Task.RUNNING, locked_by=job.locked_by).update(
+                    locked_at=timezone.now(),
+                )
+            except DatabaseError as e:
+                # e.g. SQLite busy; the next beat tries again well before the lease runs out
+                print(f"Task heartbeat failed for {job.name} #{job.pk}: {e}")
+    finally:
+        connection.close()
+
+
+def _run(func, job):
+    """Call the task function while a heartbeat thread keeps the Task's lease fresh"""
+    lease = getattr(settings, 'TASK_QUEUE_LEASE', DEFAULT_LEASE)
+    done = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat, args=(job, done, lease / HEARTBEAT_SHARE), name=f'heartbeat-{job.pk}', daemon=True,
+    )
+    beat.start()
+    try:
+        func(**job.kwargs)
+    finally:
+        done.set()
+        beat.join()
+
+
+def execute(job):
+    """Run a claimed Task and record the outcome: 'done', 'retry' or 'failed'"""
+    func = TASKS.get(job.name)
+    started = time.perf_counter()
+    try:
+        if func is None:
+            raise LookupError(f'No task registered as {job.name}')
+        _run(func, job)
+    except Exception as e:
+        error = traceback.format_exc()
+        mine = Task.objects.filter(pk=job.pk, status=Task.RUNNING, locked_by=job.locked_by)
+        if func is not None and job.attempts < job.max_attempts:
+            outcome = 'retry'
+            backoff = func.retry_delay * 2 ** (job.attempts - 1)
+            mine.update(
+                status=Task.QUEUED, run_after=timezone.now() + timedelta(seconds=backoff),
+                locked_by='', locked_at=None, last_error=error,
+            )
+        else:
+            outcome = 'failed'
+            mine.update(status=Task.FAILED, finished_at=timezone.now(), last_error=error)
+        print(f"Task {job.name} #{job.pk} failed (attempt {job.attempts}/{job.max_attempts}, {outcome}): {e!r}")
+    else:
+        outcome = 'done'
+        Task.objects.filter(pk=job.pk, status=Task.RUNNING, locked_by=job.locked_by).update(
+            status=Task.DONE, finished_at=timezone.now(),
+        )
+    metrics.TASK_DURATION.observe(time.perf_counter() - started, task=job.name)
+    metrics.TASK_RUNS.inc(task=job.name, outcome=outcome)
+    return outcome
+
+
+def requeue_stale(lease=None):
+    """Put back tasks whose worker stopped mid-run, failing those out of attempts; returns (requeued, failed)"""
+    lease = lease or getattr(settings, 'TASK_QUEUE_LEASE', DEFAULT_LEASE)
+    now = timezone.now()
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=now - timedelta(seconds=lease))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, finished_at=now, last_error='Worker stopped while running the task',
+    )
+    requeued = stale.update(status=Task.QUEUED, locked_by='', locked_at=None, run_after=now)
+    return requeued, failed
+
+
+def purge(days=None):
+    """Delete tasks that finished successfully more than ``days`` ago; failed ones are kept"""
+    days = days if days is not None else getattr(settings, 'TASK_QUEUE_KEEP_DONE_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def depth():
+    """{status: number of tasks} for queued, running and failed tasks"""
+    counts = dict.fromkeys([Task.QUEUED, Task.RUNNING, Task.FAILED], 0)
+    rows = Task.objects.filter(status__in=counts).values('status').annotate(n=Count('pk')).order_by()
+    counts.update({row['status']: row['n'] for row in rows})
+    return counts
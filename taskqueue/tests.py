@@ -0,0 +1,151 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Task
+
+
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(queue.TASKS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @queue.task(name='tests.record', priority=1)
+        def record(**kwargs):
+            self.calls.append(kwargs)
+
+        @queue.task(name='tests.broken', max_attempts=2, retry_delay=10)
+        def broken():
+            raise RuntimeError('boom')
+
+        self.record, self.broken = record, broken
+
+    def due(self, job):
+        """Make a task queued for later due now"""
+        Task.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+
+class ClaimTests(TaskQueueTestCase):
+    def test_highest_priority_due_task_first(self):
+        low = queue.enqueue('tests.record', priority=0, n=1)
+        high = self.record.enqueue(n=2)
+        queue.enqueue('tests.record', priority=9, delay=60, n=3)
+        self.assertEqual(queue.claim('w1').pk, high.pk)
+        self.assertEqual(queue.claim('w1').pk, low.pk)
+        self.assertIsNone(queue.claim('w1'))
+
+    def test_claimed_task_is_locked_to_its_worker(self):
+        job = self.record.enqueue(n=1)
+        claimed = queue.claim('w1')
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), (Task.RUNNING, 'w1', 1))
+        self.assertIsNone(queue.claim('w2'))
+        self.assertEqual(queue.execute(claimed), 'done')
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertEqual(Task.objects.get(pk=job.pk).status, Task.DONE)
+
+    def test_unregistered_functions_are_refused(self):
+        with self.assertRaises(ValueError):
+            queue.enqueue(lambda: None)
+
+
+class RetryTests(TaskQueueTestCase):
+    def test_failure_is_retried_with_backoff_then_fails(self):
+        job = self.broken.enqueue()
+        before = timezone.now()
+        self.assertEqual(queue.execute(queue.claim('w1')), 'retry')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Task.QUEUED, ''))
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=10))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertIsNone(queue.claim('w1'))
+
+        self.due(job)
+        self.assertEqual(queue.execute(queue.claim('w1')), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_backoff_doubles_with_each_attempt(self):
+        self.broken.max_attempts = 3
+        job = self.broken.enqueue()
+        queue.execute(queue.claim('w1'))
+        self.due(job)
+        before = timezone.now()
+        queue.execute(queue.claim('w1'))
+        job.refresh_from_db()
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=20))
+        self.assertLess(job.run_after, before + timedelta(seconds=30))
+
+    def test_stale_tasks_are_requeued_or_failed(self):
+        spare = self.record.enqueue(n=1)
+        spent = self.broken.enqueue()
+        queue.claim('w1')
+        queue.claim('w1')
+        Task.objects.filter(pk=spent.pk).update(attempts=2)
+        Task.objects.update(locked_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(queue.requeue_stale(lease=600), (1, 1))
+        self.assertEqual(Task.objects.get(pk=spare.pk).status, Task.QUEUED)
+        self.assertEqual(Task.objects.get(pk=spent.pk).status, Task.FAILED)
+
+    def test_late_outcome_does_not_overwrite_a_requeued_task(self):
+        job = self.record.enqueue(n=1)
+        claimed = queue.claim('w1')
+        queue.requeue_stale(lease=-1)
+        queue.claim('w2')
+        queue.execute(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Task.RUNNING, 'w2'))
+
+
+class IdempotencyKeyTests(TaskQueueTestCase):
+    def test_pending_key_returns_the_existing_task(self):
+        first = queue.enqueue(self.record, key='photo:1', n=1)
+        self.assertEqual(queue.enqueue(self.record, key='photo:1', n=2).pk, first.pk)
+        queue.claim('w1')
+        self.assertEqual(queue.enqueue(self.record, key='photo:1', n=3).pk, first.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_key_is_free_again_once_the_task_finished(self):
+        first = queue.enqueue(self.record, key='photo:1', n=1)
+        queue.execute(queue.claim('w1'))
+        second = queue.enqueue(self.record, key='photo:1', n=2)
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(Task.objects.filter(status__in=Task.PENDING).count(), 1)
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(queue.enqueue(self.record, n=1))
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(TASK_QUEUE_LEASE=0.3)
+class HeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(queue.TASKS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_long_task_keeps_its_lease(self):
+        seen = {}
+
+        @queue.task(name='tests.slow')
+        def slow():
+            time.sleep(0.45)
+            seen['locked_at'] = Task.objects.get(pk=job.pk).locked_at
+            seen['stale'] = queue.requeue_stale()
+
+        job = slow.enqueue()
+        claimed = queue.claim('w1')
+        self.assertEqual(queue.execute(claimed), 'done')
+        self.assertGreater(seen['locked_at'], claimed.locked_at)
+        self.assertEqual(seen['stale'], (0, 0))
+        self.assertEqual(Task.objects.get(pk=job.pk).status, Task.DONE)
@@ -0,0 +1,75 @@
+"""
+The loops behind ``manage.py runworker``.
+
+Each worker process runs ``threads`` threads. Every thread claims one task
+at a time and runs it, sleeping ``poll`` seconds when nothing is due. Each
+thread holds its own database connection. The main thread requeues tasks
+left behind by dead workers and purges old finished tasks. SIGTERM and
+SIGINT let running tasks finish before the process exits.
+"""
+import signal
+import threading
+import time
+
+from django.db import DatabaseError, close_old_connections, connection
+
+from . import queue
+
+
+HOUSEKEEPING_INTERVAL = 60  # seconds
+
+
+def _work(stop, poll, burst):
+    """Claim and run tasks until ``stop`` is set; in ``burst`` mode, until none is due"""
+    worker = queue.worker_name()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                job = queue.claim(worker)
+                if job is None:
+                    if burst:
+                        return
+                    stop.wait(poll)
+                    continue
+                queue.execute(job)
+            except DatabaseError as e:
+                # e.g. SQLite busy; a task left running is requeued once its lease expires
+                print(f"Task queue database error in {worker}: {e}")
+                stop.wait(poll)
+    finally:
+        connection.close()
+
+
+def housekeeping():
+    """Requeue tasks of dead workers and purge old finished ones"""
+    close_old_connections()
+    requeued, failed = queue.requeue_stale()
+    purged = queue.purge()
+    if requeued or failed or purged:
+        print(f"Task queue housekeeping: {requeued} requeued, {failed} failed, {purged} purged")
+
+
+def serve(threads, poll, burst=False, stop=None, maintain=True):
+    """Run ``threads`` worker threads in this process until stopped (or, in ``burst`` mode, idle)"""
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stop.set())
+
+    if maintain:
+        housekeeping()
+    pool = [
+        threading.Thread(target=_work, args=(stop, poll, burst), name=f'taskqueue-{i}', daemon=True)
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    last_housekeeping = time.monotonic()
+    for thread in pool:
+        while thread.is_alive():
+            thread.join(1)
+            if maintain and not stop.is_set() and time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                housekeeping()
+                last_housekeeping = time.monotonic()
+    connection.close()
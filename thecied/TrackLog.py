@@ -0,0 +1,130 @@
+"""
+Request activity instrumentation.
+
+``ActivityLoggerMiddleware`` times every request and counts the database
+queries it runs, then records the figures in ``thecied.instrumentation``
+under the route's URL name. Queries are counted by an execute wrapper put
+on every connection as it opens (so it works with DEBUG off), which adds
+to the recorder of the request in the current context. ``sync_to_async``
+carries that context into its executor threads, so queries an async view
+runs there are counted too. The status API reports them with p50/p95/p99 per
+route, and the same figures are added to the cross-process counters that
+``/status/metrics`` exposes (``thecied.metrics``).
+"""
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+from .instrumentation import registry
+
+
+UNRESOLVED_ROUTE = '<unresolved>'
+
+_recorder = ContextVar('query_recorder', default=None)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+            self.count += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding the query to the current request's recorder, if any"""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Put ``record_query`` on ``connection``, below any ``execute_wrapper()`` blocks in progress"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED_ROUTE
+    return match.view_name or match._func_path
+
+
+class ActivityLoggerMiddleware:
+    """Record latency, query count/time and response size per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _record(self, request, response, started, recorder):
+        elapsed = time.perf_counter() - started
+        if response.streaming:
+            # Body size is unknown until the client has read it all
+            size = 0
+        else:
+            size = len(response.content)
+        route = route_name(request)
+        registry.record(
+            route,
+            latency_us=elapsed * 1_000_000,
+            queries=recorder.count,
+            query_us=recorder.elapsed * 1_000_000,
+            response_bytes=size,
+            error=response.status_code >= 500,
+        )
+        metrics.REQUEST_DURATION.observe(elapsed, route=route)
+        metrics.REQUESTS.inc(route=route, status=f'{response.status_code // 100}xx')
+        metrics.DB_QUERY_DURATION.observe(recorder.elapsed, route=route)
+        metrics.DB_QUERIES.inc(recorder.count, route=route)
+
+    def _start(self, recorder):
+        # Connections opened before this module was imported missed the signal
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        return _recorder.set(recorder)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        token = self._start(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._record(request, response, started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        token = self._start(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._record(request, response, started, recorder)
+        return response
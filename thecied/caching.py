@@ -0,0 +1,113 @@
+"""
+Per-view response caching with model-driven invalidation.
+
+Views opt in with ``@cache_view(name, depends_on=[...])``. The TTL for each
+view comes from ``settings.CACHE_VIEW_TTLS`` so policies live in one place.
+Every cache key embeds a generation token for each model the view depends
+on; saving or deleting one of those models replaces its token, which
+orphans all dependent entries at once. With a shared backend (file or
+Redis) this works across all mod_wsgi processes.
+
+Entries are keyed by path only, so they are shared between visitors. Only
+requests without a session or message cookie are served from or stored in
+the cache, and a response is stored only if it is the same for everyone:
+no cookies, no ``Vary`` header (session, messages) and no CSRF token.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from . import metrics
+
+
+GENERATION_KEY = 'cache-gen:{label}'
+VIEW_KEY = 'view-cache:{name}:{path}:{generations}'
+DEFAULT_TTL = 60
+
+
+def _label(model):
+    if isinstance(model, str):
+        return model.lower()
+    return model._meta.label_lower
+
+
+def bump(model):
+    """Invalidate every cached view that depends on ``model``"""
+    cache.set(GENERATION_KEY.format(label=_label(model)), uuid.uuid4().hex, None)
+
+
+def generations(labels):
+    """Current generation tokens for the given model labels, creating missing ones"""
+    keys = [GENERATION_KEY.format(label=label) for label in labels]
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def _invalidate(sender, **kwargs):
+    transaction.on_commit(lambda: bump(sender))
+
+
+def track_models(*models):
+    """Bump the generation of each model whenever one of its rows changes"""
+    for model in models:
+        post_save.connect(_invalidate, sender=model, dispatch_uid=f'caching-save-{_label(model)}')
+        post_delete.connect(_invalidate, sender=model, dispatch_uid=f'caching-delete-{_label(model)}')
+
+
+def view_ttl(name):
+    return getattr(settings, 'CACHE_VIEW_TTLS', {}).get(name, DEFAULT_TTL)
+
+
+def _private(request):
+    """Whether the request carries state that can change the page: a login, a session or messages"""
+    return any(cookie in request.COOKIES for cookie in (settings.SESSION_COOKIE_NAME, 'messages'))
+
+
+def _shareable(request, response):
+    """Whether ``response`` would be the same for every cookie-less visitor"""
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Vary')
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cache_view(name, depends_on=()):
+    """Cache successful GET responses of a view until its TTL or a dependency changes"""
+    labels = [_label(model) for model in depends_on]
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            ttl = view_ttl(name)
+            if request.method not in ('GET', 'HEAD') or not ttl or _private(request):
+                return view_func(request, *args, **kwargs)
+
+            key = VIEW_KEY.format(
+                name=name,
+                path=hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest(),
+                generations=hashlib.md5(':'.join(generations(labels)).encode('utf-8')).hexdigest(),
+            )
+            response = cache.get(key)
+            if response is not None:
+                metrics.CACHE_REQUESTS.inc(cache=name, result='hit')
+                return response
+            metrics.CACHE_REQUESTS.inc(cache=name, result='miss')
+
+            response = view_func(request, *args, **kwargs)
+            if _shareable(request, response):
+                cache.set(key, response, ttl)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,198 @@
+"""
+Per-route request metrics.
+
+``thecied.TrackLog.ActivityLoggerMiddleware`` records, for every request,
+its latency, the number and total time of the database queries it ran and
+the response size, keyed by URL name. Latencies and query counts go into
+log-linear histograms (HDR style: 16 sub-buckets per power of two, about
+6% relative error at any magnitude) so p50/p95/p99 can be read back
+without keeping raw samples.
+
+Recording is lock-free: each thread writes only to its own shard of
+counters, and ``report()`` merges the shards when someone asks. Figures
+are per process.
+"""
+import threading
+from collections import defaultdict
+
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value):
+    """Histogram bucket for a non-negative integer"""
+    value = int(value)
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_bounds(index):
+    """(lowest, highest) value that falls in bucket ``index``"""
+    if index < SUB_BUCKETS:
+        return index, index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """Sparse bucket counts of integer values"""
+
+    __slots__ = ('counts', 'total', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[bucket_index(value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in list(other.counts.items()):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the ``percent``-th percentile value"""
+        if not self.total:
+            return 0
+        rank = max(1, -(-self.total * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_bounds(index)[1], self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+
+class RouteStats:
+    """Counters for one route within one thread's shard"""
+
+    __slots__ = ('latency_us', 'queries', 'query_us', 'response_bytes', 'errors')
+
+    def __init__(self):
+        self.latency_us = Histogram()
+        self.queries = Histogram()
+        self.query_us = 0
+        self.response_bytes = 0
+        self.errors = 0
+
+    def merge(self, other):
+        self.latency_us.merge(other.latency_us)
+        self.queries.merge(other.queries)
+        self.query_us += other.query_us
+        self.response_bytes += other.response_bytes
+        self.errors += other.errors
+
+
+class Registry:
+    """Thread-sharded route statistics"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = defaultdict(RouteStats)
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'routes', None)
+        if shard is None:
+            shard = self._local.routes = defaultdict(RouteStats)
+            # Only taken once per thread, never on the recording path
+            with self._shards_lock:
+                self._retire_dead_threads()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_threads(self):
+        """Fold shards of finished threads into one, so thread-per-request servers don't grow the list"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for route, stats in shard.items():
+                    self._retired[route].merge(stats)
+        self._shards = alive
+
+    def record(self, route, latency_us, queries, query_us, response_bytes, error):
+        stats = self._shard()[route]
+        stats.latency_us.record(latency_us)
+        stats.queries.record(queries)
+        stats.query_us += int(query_us)
+        stats.response_bytes += response_bytes or 0
+        if error:
+            stats.errors += 1
+
+    def merged(self):
+        """Route name -> RouteStats summed over every thread"""
+        merged = defaultdict(RouteStats)
+        with self._shards_lock:
+            shards = [shard for _, shard in self._shards]
+            for route, stats in self._retired.items():
+                merged[route].merge(stats)
+        for shard in shards:
+            for route, stats in list(shard.items()):
+                merged[route].merge(stats)
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            self._retired.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+
+registry = Registry()
+
+
+def summarize(stats):
+    """JSON-ready figures for one route"""
+    latency = stats.latency_us
+    count = latency.total
+    return {
+        'count': count,
+        'errors': stats.errors,
+        'p50_ms': round(latency.percentile(50) / 1000, 2),
+        'p95_ms': round(latency.percentile(95) / 1000, 2),
+        'p99_ms': round(latency.percentile(99) / 1000, 2),
+        'max_ms': round(latency.max / 1000, 2),
+        'mean_ms': round(latency.mean / 1000, 2),
+        'total_ms': round(latency.sum / 1000, 1),
+        'queries_mean': round(stats.queries.mean, 2),
+        'queries_p95': stats.queries.percentile(95),
+        'query_ms_mean': round(stats.query_us / count / 1000, 2) if count else 0,
+        'bytes_mean': round(stats.response_bytes / count) if count else 0,
+    }
+
+
+def report(limit=None):
+    """Request totals and per-route figures, busiest (by total time) first"""
+    routes = registry.merged()
+    summaries = sorted(
+        ({'route': route, **summarize(stats)} for route, stats in routes.items()),
+        key=lambda summary: -summary['total_ms'],
+    )
+    if limit is not None:
+        summaries = summaries[:limit]
+    return {
+        'total_requests': sum(stats.latency_us.total for stats in routes.values()),
+        'total_errors': sum(stats.errors for stats in routes.values()),
+        'routes': summaries,
+    }
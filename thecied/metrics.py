@@ -0,0 +1,388 @@
+"""
+Counters and histograms shared by every server process, in OpenMetrics form.
+
+mod_wsgi runs several processes, so in-memory counters would only describe
+whichever process a scrape happened to reach. Instead each process adds to
+its own memory-mapped file in ``METRICS_DIR`` (``<pid>.db``) and
+``/status/metrics`` sums all of them when scraped. A write is an in-place
+update of an 8-byte double, cheap enough for the request path.
+
+Counters must survive their process, so the files of processes that have
+exited are folded into ``archive.db`` the next time a process opens its
+own file. A shared lock keeps scrapes from seeing a file both before and
+after it is folded.
+
+Usage::
+
+    from thecied import metrics
+    metrics.RESERVATIONS_CREATED.inc(status='pending')
+    metrics.CHAT_UPSTREAM_DURATION.observe(0.8, mode='sync', status='200')
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, dead files are kept as they are
+    fcntl = None
+
+
+INITIAL_FILE_SIZE = 1 << 16
+HEADER_SIZE = 8  # bytes used, then padding so values stay 8-byte aligned
+ARCHIVE_NAME = 'archive.db'
+LOCK_NAME = '.lock'
+
+# Seconds; the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', settings.BASE_DIR / 'metrics'))
+
+
+class MmapDict:
+    """Append-only map of string keys to doubles in a memory-mapped file.
+
+    Layout: the number of bytes in use, then entries of
+    ``<int32 key length><key, space padded><float64 value>`` with every
+    value 8-byte aligned. Only one process writes a given file.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_FILE_SIZE:
+            self._file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = struct.unpack_from('i', self._map, 0)[0]
+        if not self._used:
+            self._used = HEADER_SIZE
+            struct.pack_into('i', self._map, 0, self._used)
+        self._positions = {key: position for key, _, position in _entries(self._map, self._used)}
+
+    def _grow(self, needed):
+        while self._capacity < needed:
+            self._capacity *= 2
+        self._map.close()
+        self._file.truncate(self._capacity)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = key.encode('utf-8')
+            padded = encoded + b' ' * (-(4 + len(encoded)) % 8)
+            entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+            if self._used + len(entry) > self._capacity:
+                self._grow(self._used + len(entry))
+            self._map[self._used:self._used + len(entry)] = entry
+            self._used += len(entry)
+            # Publish the entry only once it is fully written
+            struct.pack_into('i', self._map, 0, self._used)
+            position = self._positions[key] = self._used - 8
+        return position
+
+    def add(self, key, amount):
+        position = self._position(key)
+        value = struct.unpack_from('d', self._map, position)[0]
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _entries(data, used):
+    """(key, value, value position) for every entry in an MmapDict's bytes"""
+    position = HEADER_SIZE
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        key_end = position + 4 + length
+        value_position = key_end + (-(4 + length) % 8)
+        key = bytes(data[position + 4:key_end]).decode('utf-8')
+        yield key, struct.unpack_from('d', data, value_position)[0], value_position
+        position = value_position + 8
+
+
+def read_file(path):
+    """{key: value} of a metrics file written by another process"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        return {}
+    used = min(struct.unpack_from('i', data, 0)[0], len(data))
+    return {key: value for key, value, _ in _entries(data, used)}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pid_files(directory):
+    for path in directory.glob('*.db'):
+        if path.stem.isdigit():
+            yield int(path.stem), path
+
+
+class MetricStore:
+    """This process's metrics file, reopened after a fork"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    @contextmanager
+    def _directory_lock(self, shared):
+        directory = metrics_dir()
+        if fcntl is None:
+            yield directory
+            return
+        with open(directory / LOCK_NAME, 'a+b') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield directory
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._file = None
+        directory = metrics_dir()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if fcntl is not None:
+                self._archive_dead(directory)
+            self._file = MmapDict(directory / f'{self._pid}.db')
+        except OSError as e:
+            # Metrics are best effort; never fail the request that records one
+            print(f"Metrics store unavailable in {directory}: {e}")
+
+    def _archive_dead(self, directory):
+        """Fold the files of exited processes into the archive so counters keep their totals"""
+        with self._directory_lock(shared=False):
+            dead = [path for pid, path in _pid_files(directory) if pid != self._pid and not _pid_alive(pid)]
+            if not dead:
+                return
+            archive = MmapDict(directory / ARCHIVE_NAME)
+            try:
+                for path in dead:
+                    for key, value in read_file(path).items():
+                        archive.add(key, value)
+                    path.unlink()
+            finally:
+                archive.close()
+
+    def add(self, *updates):
+        """Apply (key, amount) pairs"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child must not write into its parent's mapping
+                self._open()
+            if self._file is not None:
+                for key, amount in updates:
+                    self._file.add(key, amount)
+
+    def collect(self):
+        """{key: value} summed over every process"""
+        totals = defaultdict(float)
+        if not metrics_dir().exists():
+            return totals
+        with self._directory_lock(shared=True) as directory:
+            for path in directory.glob('*.db'):
+                try:
+                    values = read_file(path)
+                except FileNotFoundError:
+                    continue
+                for key, value in values.items():
+                    totals[key] += value
+        return totals
+
+    def live_pids(self):
+        """Processes that have recorded metrics and are still running"""
+        directory = metrics_dir()
+        if not directory.exists():
+            return []
+        return sorted(pid for pid, _ in _pid_files(directory) if _pid_alive(pid))
+
+
+store = MetricStore()
+REGISTRY = {}
+
+
+def _key(sample, labels):
+    return json.dumps([sample, labels], sort_keys=True, separators=(',', ':'))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        REGISTRY[name] = self
+
+    def series(self, labels):
+        """Store keys for one label set, built once"""
+        if len(labels) != len(self.labels):
+            raise ValueError(f'{self.name} takes labels {self.labels}, got {tuple(labels)}')
+        values = tuple(str(labels[name]) for name in self.labels)
+        keys = self._series.get(values)
+        if keys is None:
+            keys = self._series[values] = self._keys(dict(zip(self.labels, values)))
+        return keys
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _keys(self, labels):
+        return _key(f'{self.name}_total', labels)
+
+    def inc(self, amount=1, **labels):
+        store.add((self.series(labels), amount))
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def _keys(self, labels):
+        # Counts are stored per bucket and made cumulative when exposed
+        buckets = [
+            _key(f'{self.name}_bucket', {**labels, 'le': format_value(bound)})
+            for bound in self.buckets + (float('inf'),)
+        ]
+        return buckets, _key(f'{self.name}_sum', labels), _key(f'{self.name}_count', labels)
+
+    def observe(self, value, **labels):
+        buckets, sum_key, count_key = self.series(labels)
+        store.add((buckets[bisect_left(self.buckets, value)], 1), (sum_key, value), (count_key, 1))
+
+
+REQUEST_DURATION = Histogram(
+    'thecied_http_request_duration_seconds', 'Time to produce a response, by URL name', ['route'],
+)
+REQUESTS = Counter(
+    'thecied_http_requests', 'Responses sent, by URL name and status class', ['route', 'status'],
+)
+DB_QUERY_DURATION = Histogram(
+    'thecied_db_query_duration_seconds', 'Database time per request, by URL name', ['route'],
+)
+DB_QUERIES = Counter(
+    'thecied_db_queries', 'Database queries run, by URL name', ['route'],
+)
+CHAT_UPSTREAM_DURATION = Histogram(
+    'thecied_chat_upstream_duration_seconds',
+    'Completion API calls until the response headers arrive, by caller and HTTP status',
+    ['mode', 'status'], buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0),
+)
+CACHE_REQUESTS = Counter(
+    'thecied_cache_requests', 'Cache lookups, by cache and result', ['cache', 'result'],
+)
+RESERVATIONS_CREATED = Counter(
+    'thecied_reservations_created', 'Reservations created, by initial status', ['status'],
+)
+TASK_DURATION = Histogram(
+    'thecied_task_duration_seconds', 'Background task run time, by task', ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+TASK_RUNS = Counter(
+    'thecied_task_runs', 'Background task attempts, by task and outcome (done, retry, failed)', ['task', 'outcome'],
+)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(name, labels, value):
+    if labels:
+        rendered = ','.join(f'{label}="{_escape(labels[label])}"' for label in sorted(labels))
+        return f'{name}{{{rendered}}} {format_value(value)}'
+    return f'{name} {format_value(value)}'
+
+
+def _histogram_lines(metric, samples):
+    """Cumulative buckets plus +Inf, _count and _sum for every label set seen"""
+    lines = []
+    series = defaultdict(lambda: {'buckets': {}})
+    for sample, labels, value in samples:
+        labels = dict(labels)
+        if sample == f'{metric.name}_bucket':
+            le = labels.pop('le')
+            series[tuple(sorted(labels.items()))]['buckets'][le] = value
+        else:
+            series[tuple(sorted(labels.items()))][sample] = value
+    for key in sorted(series):
+        labels = dict(key)
+        values = series[key]
+        cumulative = 0.0
+        for bound in metric.buckets:
+            cumulative += values['buckets'].get(format_value(bound), 0.0)
+            lines.append(format_sample(f'{metric.name}_bucket', {**labels, 'le': format_value(bound)}, cumulative))
+        lines.append(format_sample(f'{metric.name}_bucket', {**labels, 'le': '+Inf'}, values.get(f'{metric.name}_count', 0.0)))
+        lines.append(format_sample(f'{metric.name}_count', labels, values.get(f'{metric.name}_count', 0.0)))
+        lines.append(format_sample(f'{metric.name}_sum', labels, values.get(f'{metric.name}_sum', 0.0)))
+    return lines
+
+
+def exposition(extra=()):
+    """OpenMetrics text for every registered metric, summed across processes.
+
+    ``extra`` is an iterable of (name, type, help, [(labels, value), ...])
+    families computed at scrape time, such as gauges.
+    """
+    totals = store.collect()
+    by_metric = defaultdict(list)
+    for key, value in totals.items():
+        sample, labels = json.loads(key)
+        for suffix in ('_total', '_bucket', '_count', '_sum'):
+            if sample.endswith(suffix) and sample[:-len(suffix)] in REGISTRY:
+                by_metric[sample[:-len(suffix)]].append((sample, labels, value))
+                break
+
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# TYPE {name} {metric.kind}')
+        lines.append(f'# HELP {name} {metric.documentation}')
+        samples = sorted(by_metric[name], key=lambda item: _key(item[0], item[1]))
+        if metric.kind == 'histogram':
+            lines.extend(_histogram_lines(metric, samples))
+        else:
+            lines.extend(format_sample(sample, labels, value) for sample, labels, value in samples)
+    for name, kind, documentation, samples in extra:
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'# HELP {name} {documentation}')
+        suffix = '_total' if kind == 'counter' else ''
+        lines.extend(format_sample(name + suffix, labels, value) for labels, value in samples)
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,196 @@
+"""
+Per-request SQL inspector for debug and staging.
+
+``QueryInspectorMiddleware`` hooks ``connection.execute_wrapper`` for the
+duration of each request and records every query with its time and the
+line of project code that issued it. Queries slower than
+``QUERY_INSPECTOR_SLOW_MS`` are logged. Queries are also grouped by
+*shape* (the SQL with literals and ``IN`` lists collapsed), and a shape run
+``QUERY_INSPECTOR_REPEAT_THRESHOLD`` times or more in one request is
+reported as a likely N+1.
+
+Responses to staff users get an ``X-Query-Summary`` header and an
+``X-Query-Report`` header with the offenders as compact JSON; the SQL in
+them is never shown to anyone else. The full report is also attached as
+``response.query_report`` for in-process callers such as the
+``inspect_queries`` management command.
+
+The middleware is only loaded when ``QUERY_INSPECTOR`` is on
+(``THECIED_QUERY_INSPECTOR=1``), which is off by default, DEBUG or not.
+"""
+import json
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEADER_ITEMS = 5  # offenders of each kind in the X-Query-Report header
+SQL_PREVIEW_CHARS = 300
+CALLERS_PER_SHAPE = 3
+# Modules whose frames sit between the ORM and the view (execute wrappers, middleware)
+SKIPPED_MODULES = {__name__, 'thecied.TrackLog'}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'IN \((?:\?, )*\?\)')
+_SPACE = re.compile(r'\s+')
+_SELECT_LIST = re.compile(r'^SELECT (?:DISTINCT )?.+? FROM ')
+
+
+def sql_shape(sql):
+    """``sql`` with literals, placeholders and IN lists collapsed, so N+1 variants compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _preview(sql):
+    """``sql`` without its column list, cut to SQL_PREVIEW_CHARS"""
+    sql = _SELECT_LIST.sub('SELECT ... FROM ', sql, count=1)
+    return sql if len(sql) <= SQL_PREVIEW_CHARS else sql[:SQL_PREVIEW_CHARS] + '...'
+
+
+def _project_caller():
+    """``path:line in function`` of the innermost project frame that issued the query"""
+    root = str(Path(settings.BASE_DIR))
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code in _BOUNDARY_CODES:
+            # Everything further out is the server, not the request
+            return None
+        filename = frame.f_code.co_filename
+        if (filename.startswith(root) and 'site-packages' not in filename
+                and frame.f_globals.get('__name__') not in SKIPPED_MODULES):
+            return f'{Path(filename).relative_to(root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryLog:
+    """``execute_wrapper`` hook keeping every query one request runs"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'ms': (time.perf_counter() - started) * 1000,
+                'caller': _project_caller(),
+            })
+
+    def report(self, slow_ms, repeat_threshold):
+        """Totals, slow queries and repeated shapes, worst first"""
+        shapes = defaultdict(list)
+        for query in self.queries:
+            shapes[sql_shape(query['sql'])].append(query)
+
+        repeated = []
+        for shape, queries in shapes.items():
+            if len(queries) < repeat_threshold:
+                continue
+            callers = defaultdict(int)
+            for query in queries:
+                callers[query['caller']] += 1
+            repeated.append({
+                'shape': _preview(shape),
+                'count': len(queries),
+                'identical': len(queries) - len({(q['sql'], q['params']) for q in queries}),
+                'time_ms': round(sum(q['ms'] for q in queries), 2),
+                'callers': sorted(callers, key=callers.get, reverse=True)[:CALLERS_PER_SHAPE],
+            })
+        repeated.sort(key=lambda item: -item['count'])
+
+        slow = [
+            {'sql': _preview(q['sql']), 'ms': round(q['ms'], 2), 'caller': q['caller']}
+            for q in sorted(self.queries, key=lambda q: -q['ms'])
+            if q['ms'] >= slow_ms
+        ]
+        return {
+            'queries': len(self.queries),
+            'time_ms': round(sum(q['ms'] for q in self.queries), 2),
+            'shapes': len(shapes),
+            'slow': slow,
+            'repeated': repeated,
+        }
+
+
+def summary_header(report):
+    header = f"queries={report['queries']}; time_ms={report['time_ms']}; slow={len(report['slow'])}; repeated={len(report['repeated'])}"
+    if report['repeated']:
+        header += f"; worst={report['repeated'][0]['count']}x"
+    return header
+
+
+class QueryInspectorMiddleware:
+    """Log slow queries, flag N+1 patterns and report both on the response"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'QUERY_INSPECTOR_SLOW_MS', 50)
+        self.repeat_threshold = getattr(settings, 'QUERY_INSPECTOR_REPEAT_THRESHOLD', 3)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _attach(self, request, response, log, staff):
+        report = log.report(self.slow_ms, self.repeat_threshold)
+        for query in report['slow']:
+            logger.warning('Slow query (%.1f ms) on %s from %s: %s', query['ms'], request.path, query['caller'], query['sql'])
+        for item in report['repeated']:
+            logger.warning('Repeated query (%dx) on %s from %s: %s', item['count'], request.path, ', '.join(map(str, item['callers'])), item['shape'])
+        if staff:
+            response['X-Query-Summary'] = summary_header(report)
+            response['X-Query-Report'] = json.dumps({
+                'slow': report['slow'][:REPORT_HEADER_ITEMS],
+                'repeated': report['repeated'][:REPORT_HEADER_ITEMS],
+            }, separators=(',', ':'))
+        response.query_report = report
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        log = QueryLog()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        self._attach(request, response, log, staff=bool(user and user.is_staff))
+        return response
+
+    async def __acall__(self, request):
+        log = QueryLog()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            response = await self.get_response(request)
+        user = await request.auser() if hasattr(request, 'auser') else None
+        self._attach(request, response, log, staff=bool(user and user.is_staff))
+        return response
+
+
+# Frames of the middleware itself; walking past them leaves the request
+_BOUNDARY_CODES = {QueryInspectorMiddleware.__call__.__code__, QueryInspectorMiddleware.__acall__.__code__}
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'assets',  # before staticfiles, so its collectstatic is the one that runs
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
@@ -46,17 +47,20 @@ INSTALLED_APPS = [
     'admin_dashboard',
     'chat',
     'system_status',
+    'imaging',
+    'taskqueue',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'thecied.query_inspector.QueryInspectorMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     # 'admin_dashboard.middleware.SubdomainRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    # 'thecied.TrackLog.ActivityLoggerMiddleware',
+    'thecied.TrackLog.ActivityLoggerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +95,105 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite tuning for mod_wsgi (THECIED_DB_PROFILE=production). WAL lets
+# readers run while a write is in progress, IMMEDIATE transactions take the
+# write lock up front instead of failing on upgrade, and the busy timeout
+# makes writers queue rather than raise "database is locked".
+# Benchmark with: python manage.py benchmark_sqlite
+DB_PROFILE = os.getenv('THECIED_DB_PROFILE', 'default')
+
+SQLITE_BUSY_TIMEOUT = 20  # seconds
+
+SQLITE_PRODUCTION_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}',
+    'PRAGMA mmap_size=134217728',  # 128 MB
+    'PRAGMA cache_size=-20000',  # 20 MB
+    'PRAGMA temp_store=MEMORY',
+]
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(SQLITE_PRODUCTION_PRAGMAS),
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# THECIED_CACHE_BACKEND picks the backend: 'locmem' (default, an LRU private
+# to each process), 'file' (a directory shared by all mod_wsgi processes) or
+# 'redis' (needs the redis package and a local server).
+
+CACHE_BACKEND = os.getenv('THECIED_CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('THECIED_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+elif CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('THECIED_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'thecied',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
+# Seconds each @cache_view response is kept (see thecied/caching.py)
+CACHE_VIEW_TTLS = {
+    'api_event_classes': 300,
+    'api_venues': 300,
+    'reservation_list': 60,
+    'reservation_detail': 60,
+}
+
+# Seconds an admin dashboard statistics section is served before recomputing
+ADMIN_STATS_TTL = 30
+
+# Background system metrics sampler behind the status API (system_status.sampler)
+STATUS_SAMPLE_INTERVAL = 5  # seconds between samples
+STATUS_HISTORY_MINUTES = 60  # ring buffer length
+STATUS_DATABASE_TTL = 30  # seconds the status page's row counts are reused
+# Live status streams per process. Each holds a request thread while its tab
+# is open, so keep this well below the 15 threads per process of the vhost
+# (system_status.live also caps it at a quarter of mod_wsgi's threads)
+STATUS_STREAM_MAX_SUBSCRIBERS = 2
+STATUS_STREAM_QUEUE_SIZE = 4  # undelivered updates kept per stream before resyncing it
+
+# Per-process metric files summed by /status/metrics (thecied.metrics); must be
+# writable by, and shared between, all server processes
+METRICS_DIR = Path(os.getenv('THECIED_METRICS_DIR', str(BASE_DIR / 'metrics')))
+# Bearer token a scraper sends to read /status/metrics (staff sessions need none);
+# unset, only staff can read it
+METRICS_TOKEN = os.getenv('THECIED_METRICS_TOKEN', '')
+# Runs the suite with METRICS_DIR in a scratch directory
+TEST_RUNNER = 'thecied.test_runner.TestRunner'
+
+# Per-request slow-query log and N+1 detector (thecied.query_inspector), for
+# debug/staging; off unless THECIED_QUERY_INSPECTOR=1, and its report headers
+# (raw SQL) are only added to staff users' responses
+QUERY_INSPECTOR = os.getenv('THECIED_QUERY_INSPECTOR', '0') == '1'
+QUERY_INSPECTOR_SLOW_MS = 50
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 3  # same query shape this often in one request is flagged
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,11 +234,49 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+# collectstatic also saves content-hashed copies (listed in staticfiles.json)
+# and .gz/.br variants (assets.storage). Apache serves STATIC_ROOT itself;
+# when a request reaches Django, 'sendfile' hands the file back to Apache
+# via X-Sendfile (mod_xsendfile) and 'python' sends it from the process
+STATIC_SERVE_MODE = os.getenv('THECIED_STATIC_SERVE_MODE', 'python')
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # seconds
 
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per content under media/content/ (imaging.storage)
+# and served with immutable caching; reclaim unused files with
+# python manage.py gc_media
+STORAGES = {
+    'default': {'BACKEND': 'imaging.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'assets.storage.PrecompressedManifestStorage'},
+}
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # seconds
+MEDIA_GC_GRACE_HOURS = 24
+
+# Resized, EXIF-free WebP/JPEG renditions of uploaded photos (imaging.pipeline);
+# backfill existing uploads with: python manage.py process_images
+IMAGE_DERIVATIVE_SIZES = {'thumb': 320, 'card': 800, 'full': 1920}  # widths in pixels
+IMAGE_WEBP_QUALITY = 80
+IMAGE_JPEG_QUALITY = 82
+IMAGE_PROCESS_JOBS = max(1, (os.cpu_count() or 1) // 2)  # render processes per batch; the rest serve requests
+# Bulk uploads (POST /imaging/api/uploads/) stream here; keep it on the same
+# filesystem as MEDIA_ROOT so storing a photo is a rename, not a copy
+IMAGE_UPLOAD_TEMP_DIR = BASE_DIR / 'incoming'
+IMAGE_UPLOAD_MAX_BYTES = 25 * 1024 * 1024
+
+# Background tasks (taskqueue), run by: python manage.py runworker
+# (in production, the thecied-worker systemd unit the deploy scripts install)
+# THECIED_TASK_QUEUE_EAGER=1 runs them in the web process after commit instead,
+# for development without a worker.
+TASK_QUEUE_EAGER = os.getenv('THECIED_TASK_QUEUE_EAGER', '0') == '1'
+TASK_QUEUE_PROCESSES = 1
+TASK_QUEUE_THREADS = 2
+TASK_QUEUE_POLL_INTERVAL = 1.0  # seconds
+TASK_QUEUE_LEASE = 600  # seconds without a worker heartbeat before a running task is presumed abandoned and requeued
+TASK_QUEUE_KEEP_DONE_DAYS = 7
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -160,6 +301,39 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only allow all origins in debug mode
 # IMPORTANT: Set OPENAI_API_KEY environment variable for production
 # You can get an API key from https://platform.openai.com/api-keys
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+# Point at a local server (e.g. `python manage.py fake_completions`) for testing
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
+
+# Async chat upstream client (chat.async_backend): one pooled client per process on a background loop
+CHAT_UPSTREAM_CONCURRENCY = int(os.getenv('CHAT_UPSTREAM_CONCURRENCY', '8'))  # in-flight calls per process
+CHAT_UPSTREAM_MAX_CONNECTIONS = 20  # pooled keep-alive connections per process
+CHAT_UPSTREAM_CONNECT_TIMEOUT = 5
+CHAT_UPSTREAM_TIMEOUT = 30
+CHAT_UPSTREAM_RETRIES = 2  # extra attempts on 429/5xx and network errors
+CHAT_UPSTREAM_BACKOFF = 0.5  # seconds, doubled per retry with jitter
+CHAT_UPSTREAM_MAX_RETRY_AFTER = CHAT_UPSTREAM_TIMEOUT  # give up when a 429/503 asks to wait longer
+
+# Chat history long-polls (?wait=) per process. Each holds a request thread
+# until a message arrives, so chat.views also caps it at a quarter of
+# mod_wsgi's threads; past the cap the history answers without waiting
+CHAT_HISTORY_MAX_WAITERS = 3
+
+# Conversation context sent with each chat turn (chat.context)
+CHAT_CONTEXT_MESSAGES = 20  # newest messages read per turn
+CHAT_CONTEXT_TOKEN_BUDGET = 1500  # estimated tokens of verbatim history
+CHAT_SUMMARY_TOKEN_BUDGET = 300  # running summary of older turns
+CHAT_SUMMARY_SOURCE_MESSAGES = 50  # older messages read when rebuilding a cold summary
+CHAT_SUMMARY_TIMEOUT = 86400
+
+# Replies to repeated first-turn questions (chat.response_cache)
+CHAT_RESPONSE_CACHE_SIZE = 500
+CHAT_RESPONSE_CACHE_TTL = 3600
+CHAT_RESPONSE_CACHE_SIMILARITY = 0.85  # TF-IDF cosine for near-duplicates; 0 for exact matches only
+
+# Local retrieval index of venues, event types, suites and upcoming bookings (chat.knowledge)
+CHAT_KNOWLEDGE_RESULTS = 5  # records added to the prompt per question
+CHAT_KNOWLEDGE_HORIZON_DAYS = 90
+CHAT_KNOWLEDGE_REBUILD_SECONDS = 300
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
@@ -198,6 +372,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'thecied.query_inspector': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -0,0 +1,25 @@
+"""
+Test runner that keeps the suite's metrics out of the real METRICS_DIR.
+
+Every request a test makes records metrics (``thecied.metrics``), so for the
+length of the run METRICS_DIR points at a scratch directory, removed after.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_dir = tempfile.mkdtemp(prefix='thecied-metrics-')
+        self.metrics_settings = override_settings(METRICS_DIR=Path(self.metrics_dir))
+        self.metrics_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.metrics_settings.disable()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
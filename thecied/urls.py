@@ -15,15 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
 from django.contrib.auth import logout
 from admin_dashboard.views import dashboard_view
+from assets.views import serve_static
+from imaging.views import serve_media
 import os
+import re
 
 def react_app(request):
     """Serve the React application"""
@@ -113,17 +114,17 @@ urlpatterns = [
     # New app routes
     path('chat/', include('chat.urls')),
     path('status/', include('system_status.urls')),
+    path('imaging/', include('imaging.urls')),
     path('dashboard/', dashboard_view, name='dashboard'),
     path('calendar/', calendar_page, name='calendar'),
-    # Serve images at /images/ for React app compatibility
-    path('images/<path:path>', serve, {
+    # Serve images at /images/ for React app compatibility (Apache serves it directly in production)
+    path('images/<path:path>', serve_static, {
         'document_root': os.path.join(settings.STATIC_ROOT, 'images')
     }),
+    # Precompressed static files, for when Apache does not serve STATIC_ROOT itself
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static),
 ]
 
-# Serve static and media files in development
+# Serve media files in development
 if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns += [re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media)]